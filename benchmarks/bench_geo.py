@@ -0,0 +1,60 @@
+"""Micro-benchmark of the vectorized great circle kernels in :mod:`seispy.geo` and :mod:`seispy.distaz`.
+
+The baselines are the former implementations: ``latlon_from`` looped over array elements
+in Python, and ``distaz`` was evaluated point by point.
+
+Usage::
+
+    python benchmarks/bench_geo.py [npts]
+"""
+import sys
+import time
+import numpy as np
+from seispy.geo import latlon_from, sind, cosd, asind
+from seispy.distaz import delaz, distaz
+
+
+def latlon_from_loop(lat1, lon1, azimuth, gcarc_dist):
+    lat2 = asind((sind(lat1) * cosd(gcarc_dist)) + (cosd(lat1) * sind(gcarc_dist) * cosd(azimuth)))
+    lon2 = np.zeros_like(lat2)
+    for n in range(len(gcarc_dist)):
+        if cosd(gcarc_dist[n]) >= (cosd(90 - lat1) * cosd(90 - lat2[n])):
+            lon2[n] = lon1 + asind(sind(gcarc_dist[n]) * sind(azimuth) / cosd(lat2[n]))
+        else:
+            lon2[n] = lon1 + asind(sind(gcarc_dist[n]) * sind(azimuth) / cosd(lat2[n])) + 180
+    return lat2, lon2
+
+
+def timeit(func, *args, repeat=3, **kwargs):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(npts=1000000, nloop=20000):
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(-80, 80, npts)
+    lon = rng.uniform(-180, 180, npts)
+    dist = rng.uniform(0, 90, npts)
+    scale = npts / nloop
+
+    t_loop = timeit(latlon_from_loop, 30., 100., 45., dist[:nloop], repeat=1) * scale
+    t_vec = timeit(latlon_from, 30., 100., 45., dist)
+    out = (np.empty(npts, dtype=np.float32), np.empty(npts, dtype=np.float32))
+    t_f32 = timeit(latlon_from, 30., 100., 45., dist, out=out)
+    print('latlon_from  loop {:8.3f} s  vectorized {:7.3f} s  float32 out= {:7.3f} s  speedup {:7.1f}x'.format(
+          t_loop, t_vec, t_f32, t_loop / t_vec))
+
+    t_loop = timeit(lambda: [distaz(30., 100., lat[i], lon[i]) for i in range(nloop)], repeat=1) * scale
+    t_vec = timeit(delaz, 30., 100., lat, lon)
+    out = tuple(np.empty(npts, dtype=np.float32) for _ in range(3))
+    t_f32 = timeit(delaz, 30., 100., lat, lon, out=out)
+    print('distaz       loop {:8.3f} s  vectorized {:7.3f} s  float32 out= {:7.3f} s  speedup {:7.1f}x'.format(
+          t_loop, t_vec, t_f32, t_loop / t_vec))
+
+
+if __name__ == '__main__':
+    main(int(float(sys.argv[1])) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,47 @@
+"""Import time of the seispy modules behind the command line tools.
+
+Each module is imported in a fresh interpreter, so the time includes all its dependencies.
+GUI and plotting packages are only imported by the functions that use them, and the
+modules they would pull in are listed for each import.
+
+Usage::
+
+    python benchmarks/bench_import.py [module ...]
+"""
+import sys
+import subprocess
+import json
+
+
+MODULES = ['seispy.scripts', 'seispy.rf', 'seispy.rfcorrect', 'seispy.ccp3d', 'seispy.ccpprofile', 'seispy.hk']
+HEAVY = ['PyQt5', 'matplotlib.pyplot', 'obspy.taup', 'obspy.clients.fdsn', 'scikits.bootstrap', 'seispy.sviewerui']
+
+SNIPPET = '''
+import sys, time, json
+t0 = time.perf_counter()
+import {mod}
+dt = time.perf_counter() - t0
+print(json.dumps([dt, [m for m in {heavy!r} if m in sys.modules]]))
+'''
+
+
+def import_time(mod, repeat=3):
+    """Best import time in sec of ``mod`` in a fresh interpreter, and heavy modules it loads"""
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', SNIPPET.format(mod=mod, heavy=HEAVY)],
+                             capture_output=True, text=True, check=True).stdout
+        dt, loaded = json.loads(out.strip().splitlines()[-1])
+        if best is None or dt < best[0]:
+            best = (dt, loaded)
+    return best
+
+
+def main(modules=MODULES):
+    for mod in modules:
+        dt, loaded = import_time(mod)
+        print('{:20s} {:6.2f} s  {}'.format(mod, dt, ', '.join(loaded) if loaded else '-'))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] if len(sys.argv) > 1 else MODULES)
@@ -0,0 +1,309 @@
+"""Offline benchmark suite of the hot paths on synthetic data from :mod:`synthetic`.
+
+Data are generated in a working directory once per size and reused in later runs. Timings
+are the best of ``repeat`` runs and written as JSON together with the git commit, so that
+results can be compared across commits.
+
+Usage::
+
+    python benchmarks/bench_suite.py [-s small|medium|large] [-k case1,case2] [-r repeat]
+                                     [-d workdir] [-o results.json]
+"""
+import sys
+import json
+import time
+import copy
+import logging
+import argparse
+import platform
+import subprocess
+from os.path import join, exists, dirname, abspath
+import numpy as np
+
+sys.path.insert(0, dirname(abspath(__file__)))
+import synthetic
+
+
+SIZES = {
+    'small': {'decon_traces': 20, 'events': 10, 'rfs': 100, 'depth': 150, 'raytracing_rfs': 5,
+              'stations': 9, 'rfdep_events': 50, 'span': 2., 'hk_dh': 0.1, 'hk_dk': 0.01},
+    'medium': {'decon_traces': 100, 'events': 40, 'rfs': 300, 'depth': 300, 'raytracing_rfs': 20,
+               'stations': 36, 'rfdep_events': 100, 'span': 4., 'hk_dh': 0.1, 'hk_dk': 0.005},
+    'large': {'decon_traces': 400, 'events': 150, 'rfs': 1000, 'depth': 800, 'raytracing_rfs': 50,
+              'stations': 100, 'rfdep_events': 200, 'span': 6., 'hk_dh': 0.05, 'hk_dk': 0.0025},
+}
+
+
+def quiet_logger():
+    from seispy.setuplog import setuplog
+    logger = setuplog()
+    for name in ('RF', 'RF2depth', 'CCP', 'Bat', 'ModCreator'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    return logger
+
+
+class Data(object):
+    def __init__(self, workdir, size):
+        """Synthetic data of ``size`` in ``workdir``, generated on first access"""
+        self.path = join(workdir, size)
+        self.par = SIZES[size]
+
+    def decon_traces(self):
+        n = self.par['decon_traces']
+        rng = np.random.default_rng(0)
+        time_axis = np.arange(int(130 / 0.01)) * 0.01 - 10
+        win, uin, _ = synthetic.synthetic_seis(time_axis, rng.uniform(0.04, 0.08, n),
+                                               rng.uniform(0, 360, n), rng)
+        return uin + 0.01 * rng.normal(size=uin.shape), win, 0.01
+
+    def events(self):
+        path = join(self.path, 'events')
+        para, eq_lst = synthetic.write_events(path, nev=self.par['events'])
+        para.rfpath = join(path, 'RFresult')
+        return para, eq_lst
+
+    def rfs(self):
+        path = join(self.path, 'rf')
+        if not exists(join(path, 'SYN', 'SYNfinallist.dat')):
+            synthetic.write_rfs(path, nev=self.par['rfs'])
+        return join(path, 'SYN')
+
+    def rfs_raytracing(self):
+        path = join(self.path, 'rf_raytracing')
+        if not exists(join(path, 'SYN', 'SYNfinallist.dat')):
+            synthetic.write_rfs(path, nev=self.par['raytracing_rfs'])
+        return join(path, 'SYN')
+
+    def mod3d(self):
+        fname = join(self.path, 'mod3d.npz')
+        if not exists(fname):
+            synthetic.write_mod3d(self.path)
+        return fname
+
+    def ccp(self):
+        path = join(self.path, 'ccp')
+        cfg_file = join(path, 'ccp.cfg')
+        if not exists(cfg_file):
+            synthetic.write_rfdep(path, nsta=self.par['stations'], nev=self.par['rfdep_events'],
+                                  span=self.par['span'])
+        return cfg_file
+
+
+def case_deconit(data):
+    uin, win, dt = data.decon_traces()
+    from seispy.decon import deconit
+
+    def run():
+        for u in uin:
+            deconit(u, win, dt, tshift=10, f0=2.0)
+    return run, uin.shape[0]
+
+
+def case_deconwater(data):
+    uin, win, dt = data.decon_traces()
+    from seispy.decon import deconwater
+
+    def run():
+        for u in uin:
+            deconwater(u, win, dt, tshift=10, f0=2.0)
+    return run, uin.shape[0]
+
+
+def case_rf(data):
+    para, eq_lst = data.events()
+    from seispy.rf import RF
+    logger = quiet_logger()
+
+    def run():
+        pjt = RF(log=logger)
+        pjt.para = para
+        pjt.load_stainfo()
+        pjt.eq_lst = eq_lst.copy()
+        pjt.match_eq()
+        pjt.detrend()
+        pjt.filter()
+        pjt.cal_phase()
+        pjt.batch_qc()
+        pjt.rotate()
+        pjt.trim()
+        pjt.deconv()
+        pjt.saverf()
+    return run, eq_lst.shape[0]
+
+
+def case_hkstack(data):
+    from seispy.rfcorrect import RFStation
+    from seispy.hk import hkstack
+    from seispy.geo import srad2skm
+    rfsta = RFStation(data.rfs(), only_r=True)
+    hrange = np.arange(20, 80, data.par['hk_dh'])
+    krange = np.arange(1.6, 1.9, data.par['hk_dk'])
+
+    def run():
+        hkstack(rfsta.datar, rfsta.shift, rfsta.sampling, srad2skm(rfsta.rayp), hrange, krange)
+    return run, rfsta.ev_num
+
+
+def case_hkstack_adaptive(data):
+    from seispy.rfcorrect import RFStation
+    from seispy.hk import hkstack_adaptive
+    from seispy.geo import srad2skm
+    rfsta = RFStation(data.rfs(), only_r=True)
+    hrange = np.arange(20, 80, data.par['hk_dh'])
+    krange = np.arange(1.6, 1.9, data.par['hk_dk'])
+
+    def run():
+        hkstack_adaptive(rfsta.datar, rfsta.shift, rfsta.sampling, srad2skm(rfsta.rayp), hrange, krange)
+    return run, rfsta.ev_num
+
+
+def case_hkvstack(data):
+    from seispy.rfcorrect import RFStation
+    from seispy.hk import hkvstack
+    from seispy.geo import srad2skm
+    rfsta = RFStation(data.rfs(), only_r=True)
+    hrange = np.arange(20, 80, data.par['hk_dh'])
+    krange = np.arange(1.6, 1.9, data.par['hk_dk'])
+    vprange = np.arange(5.8, 7.0, 0.1)
+
+    def run():
+        hkvstack(rfsta.datar, rfsta.shift, rfsta.sampling, srad2skm(rfsta.rayp), hrange, krange, vprange)
+    return run, rfsta.ev_num
+
+
+def case_psrf2depth(data):
+    from seispy.rfcorrect import RFStation
+    rfsta = RFStation(data.rfs(), only_r=True)
+    dep_range = np.arange(0, data.par['depth'] + 1.)
+
+    def run():
+        rfsta.psrf2depth(dep_range)
+    return run, rfsta.ev_num
+
+
+def case_psrf2depth_lut(data):
+    from seispy.rfcorrect import RFStation
+    rfsta = RFStation(data.rfs(), only_r=True)
+    dep_range = np.arange(0, data.par['depth'] + 1.)
+
+    def run():
+        rfsta.psrf2depth(dep_range, lut=True)
+    return run, rfsta.ev_num
+
+
+def case_psrf_3D_raytracing(data):
+    from seispy.rfcorrect import RFStation
+    rfsta = RFStation(data.rfs_raytracing(), only_r=True)
+    mod3d = data.mod3d()
+    dep_range = np.arange(0, data.par['depth'] + 1.)
+
+    def run():
+        rfsta.psrf_3D_raytracing(mod3d, dep_range.copy())
+    return run, rfsta.ev_num
+
+
+def case_ccp3d(data):
+    from seispy.ccp3d import CCP3D
+    cfg_file = data.ccp()
+    logger = quiet_logger()
+
+    def run():
+        ccp = CCP3D(cfg_file, log=logger)
+        ccp.initial_grid()
+        ccp.stack()
+    return run, data.par['stations']
+
+
+def case_ccpprofile(data):
+    from seispy.ccpprofile import CCPProfile
+    cfg_file = data.ccp()
+    logger = quiet_logger()
+
+    def run():
+        ccp = CCPProfile(cfg_file, log=logger)
+        ccp.initial_profile()
+        ccp.stack()
+    return run, data.par['stations']
+
+
+def case_rfani(data):
+    from seispy.rfcorrect import RFStation
+    rfsta = RFStation(data.rfs())
+
+    def run():
+        copy.deepcopy(rfsta).jointani(2, 7, tlen=3.5)
+    return run, rfsta.ev_num
+
+
+def case_harmonics(data):
+    from seispy.rfcorrect import RFStation
+    rfsta = RFStation(data.rfs())
+
+    def run():
+        rfsta.harmonic(-2, 12)
+    return run, rfsta.ev_num
+
+
+CASES = {'deconit': case_deconit, 'deconwater': case_deconwater, 'rf': case_rf, 'hkstack': case_hkstack,
+         'hkstack_adaptive': case_hkstack_adaptive,
+         'hkvstack': case_hkvstack, 'psrf2depth': case_psrf2depth, 'psrf2depth_lut': case_psrf2depth_lut,
+         'psrf_3D_raytracing': case_psrf_3D_raytracing, 'ccp3d': case_ccp3d,
+         'ccpprofile': case_ccpprofile, 'rfani': case_rfani, 'harmonics': case_harmonics}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=dirname(abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_suite(cases=None, size='small', repeat=3, workdir='bench_data'):
+    """Run benchmark cases and return results as a dict
+
+    :param cases: Names of cases in ``CASES``, defaults to None for all cases
+    :type cases: list, optional
+    """
+    if cases is None:
+        cases = list(CASES.keys())
+    data = Data(workdir, size)
+    results = {}
+    for name in cases:
+        t0 = time.perf_counter()
+        run, nitem = CASES[name](data)
+        t_setup = time.perf_counter() - t0
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - t0)
+        results[name] = {'time': min(times), 'times': times, 'items': nitem, 'setup': t_setup}
+        print('{:20s} {:9.3f} s  {:6d} items  (setup {:.1f} s)'.format(name, min(times), nitem, t_setup))
+    return {'commit': git_commit(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'size': size, 'params': SIZES[size], 'repeat': repeat, 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmarks of seispy on synthetic data')
+    parser.add_argument('-s', dest='size', choices=list(SIZES.keys()), default='small', help='Data size')
+    parser.add_argument('-k', dest='cases', default=None,
+                        help='Comma separated cases in {}'.format(', '.join(CASES.keys())))
+    parser.add_argument('-r', dest='repeat', type=int, default=3, help='Number of runs of each case')
+    parser.add_argument('-d', dest='workdir', default='bench_data', help='Directory of synthetic data')
+    parser.add_argument('-o', dest='output', default=None, help='Write results to a JSON file')
+    arg = parser.parse_args()
+    cases = None if arg.cases is None else arg.cases.split(',')
+    if cases is not None:
+        unknown = [c for c in cases if c not in CASES]
+        if unknown:
+            parser.error('Unknown cases: {}'.format(', '.join(unknown)))
+    results = run_suite(cases, arg.size, arg.repeat, arg.workdir)
+    if arg.output is not None:
+        with open(arg.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
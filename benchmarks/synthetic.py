@@ -0,0 +1,296 @@
+"""Synthetic data sets for the offline benchmarks.
+
+The generated directories have the same layout and SAC headers as real data, so they go
+through the same code paths as production runs:
+
+* :func:`write_events`: 3-component event SAC files of a station, a catalog of the events
+  and the matching ``RF`` parameters
+* :func:`write_rfs`: radial and transverse RFs of a station with a ``finallist.dat``
+* :func:`write_rfdep`: ``RFdepth`` file, station list and configure file for CCP stacking
+* :func:`write_mod3d`: 3-D velocity model in ``.npz`` format
+
+The RFs are the responses of a layer over a half space with the Moho depth ``h`` and
+Vp/Vs ratio ``kappa``, and the transverse RFs have a 2-lobed back-azimuth pattern.
+"""
+import numpy as np
+from os import makedirs
+from os.path import join
+from obspy import UTCDateTime
+from obspy.io.sac import SACTrace
+from scipy.signal import fftconvolve
+from seispy.geo import latlon_from, srad2skm, skm2srad, rad2deg
+from seispy.distaz import distaz
+from seispy.hk import vslow
+from seispy.utils import DepModel
+from seispy.rfcorrect import xps_tps_map
+
+
+def gauss_pulse(time_axis, t0, f0=2.0):
+    """Gaussian pulse centered at ``t0`` with the same width as the Gaussian filter of ``f0``"""
+    return np.exp(-((time_axis - t0) * f0) ** 2)
+
+
+def synthetic_rf(time_axis, rayp, bazi, h=35., kappa=1.75, vp=6.3, f0=2.0, fvd=60., ani=0.2):
+    """Radial and transverse RFs of a layer over a half space.
+
+    :param time_axis: Time axis relative to P in sec
+    :type time_axis: numpy.ndarray
+    :param rayp: Ray parameters in s/km
+    :type rayp: numpy.ndarray
+    :param bazi: Back-azimuths in degree
+    :type bazi: numpy.ndarray
+    :param h: Moho depth in km, defaults to 35.
+    :param kappa: Vp/Vs ratio of the crust, defaults to 1.75
+    :param ani: Amplitude of Ps on transverse RFs relative to the radial, defaults to 0.2
+    :return: Radial and transverse RFs in shape of ``(ev_num, npts)``
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    rayp = np.asarray(rayp, dtype=float)[:, np.newaxis]
+    bazi = np.asarray(bazi, dtype=float)[:, np.newaxis]
+    eta_p = vslow(vp, rayp)
+    eta_s = vslow(vp / kappa, rayp)
+    t_ps = h * (eta_s - eta_p)
+    datar = (gauss_pulse(time_axis, 0, f0) + 0.3 * gauss_pulse(time_axis, t_ps, f0) +
+             0.15 * gauss_pulse(time_axis, h * (eta_s + eta_p), f0) -
+             0.1 * gauss_pulse(time_axis, 2 * h * eta_s, f0))
+    dgauss = -2 * f0 ** 2 * (time_axis - t_ps) * gauss_pulse(time_axis, t_ps, f0)
+    datat = ani * 0.3 * np.sin(np.deg2rad(2 * (bazi - fvd))) * dgauss / f0
+    return datar, datat
+
+
+def synthetic_seis(time_axis, rayp, bazi, rng=None):
+    """Vertical, radial and transverse seismograms without noise, which are the source
+    wavelet with a decaying coda convolved with RFs from :func:`synthetic_rf`.
+
+    :param time_axis: Time axis relative to P in sec with the same intervals
+    :type time_axis: numpy.ndarray
+    :return: Vertical seismogram in shape of ``(npts,)``, radial and transverse seismograms
+             in shape of ``(ev_num, npts)``
+    :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    if rng is None:
+        rng = np.random.default_rng(0)
+    dt = time_axis[1] - time_axis[0]
+    npts = time_axis.size
+    # a coda keeps SNR in long windows as high as in real data
+    coda = np.convolve(rng.normal(size=npts), gauss_pulse(np.arange(-40, 41) * dt, 0, 1.), 'same')
+    wavelet = (np.diff(gauss_pulse(time_axis, 0, 0.5), prepend=0) / dt +
+               0.1 * coda * np.exp(-np.clip(time_axis, 0, None) / 30) * (time_axis > 2))
+    datar, datat = synthetic_rf(time_axis, rayp, bazi)
+    shift = int(round(-time_axis[0] / dt))
+    radial = fftconvolve(datar, wavelet[np.newaxis], axes=1)[:, shift:shift+npts] * dt
+    trans = fftconvolve(datat, wavelet[np.newaxis], axes=1)[:, shift:shift+npts] * dt
+    return wavelet, radial, trans
+
+
+def gen_events(nev, stla, stlo, date_begin=UTCDateTime('2015-01-01'), seed=0):
+    """Teleseismic events in distance of 30-90 degree around a station, one per day.
+
+    :return: Origin time, latitude, longitude, depth, magnitude, distance, back-azimuth and
+             ray parameter in s/km of events
+    :rtype: dict
+    """
+    from obspy.taup import TauPyModel
+    rng = np.random.default_rng(seed)
+    dis = rng.uniform(30, 90, nev)
+    bazi = rng.uniform(0, 360, nev)
+    evla, evlo = latlon_from(stla, stlo, bazi, dis)
+    evdp = rng.uniform(10, 300, nev)
+    model = TauPyModel('iasp91')
+    arr = [model.get_travel_times(dp, ds, phase_list=['P'])[0] for dp, ds in zip(evdp, dis)]
+    da = distaz(stla, stlo, evla, evlo)
+    return {'date': [date_begin + 86400 * i + int(rng.integers(0, 80000)) for i in range(nev)],
+            'evla': evla, 'evlo': evlo, 'evdp': evdp, 'mag': rng.uniform(5.5, 7, nev),
+            'dis': da.delta, 'bazi': da.baz, 'tp': np.array([a.time for a in arr]),
+            'rayp': srad2skm(np.array([a.ray_param for a in arr]))}
+
+
+def write_events(path, nev=20, network='SY', station='SYN', stla=30., stlo=100., dt=0.05,
+                 time_before=100., time_after=200., noise=0.02, seed=0):
+    """Write 3-component SAC files of ``nev`` events and a catalog in the format of ``EventCMT.dat``.
+
+    :return: Instance of :class:`seispy.para.para` ready for :class:`seispy.rf.RF`, and the events
+    :rtype: (seispy.para.para, pandas.DataFrame)
+    """
+    import pandas as pd
+    from seispy.para import para
+    makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    evts = gen_events(nev, stla, stlo, seed=seed)
+    npts = int((time_before + time_after) / dt)
+    time_axis = np.arange(npts) * dt - time_before
+    wavelet, radial, trans = synthetic_seis(time_axis, evts['rayp'], evts['bazi'], rng)
+    ba = np.deg2rad(evts['bazi'])[:, np.newaxis]
+    north = -radial * np.cos(ba) + trans * np.sin(ba)
+    east = -radial * np.sin(ba) - trans * np.cos(ba)
+    with open(join(path, 'catalog.dat'), 'w') as f:
+        for i, date in enumerate(evts['date']):
+            datestr = date.strftime('%Y.%j.%H.%M.%S')
+            b = evts['tp'][i] - time_before
+            for chan, data in zip(('BHE', 'BHN', 'BHZ'), (east[i], north[i], wavelet)):
+                sac = SACTrace(data=data + noise * rng.normal(size=npts), delta=dt,
+                               kstnm=station, knetwk=network, kcmpnm=chan, stla=stla, stlo=stlo, stel=0.,
+                               evla=evts['evla'][i], evlo=evts['evlo'][i], evdp=evts['evdp'][i],
+                               cmpaz={'BHE': 90., 'BHN': 0., 'BHZ': 0.}[chan],
+                               cmpinc={'BHE': 90., 'BHN': 90., 'BHZ': 0.}[chan])
+                sac.reftime = date
+                sac.b, sac.o = b, 0.
+                sac.write(join(path, '{}.{}.{}.{}.SAC'.format(datestr, network, station, chan)))
+            f.write('{} {} {} {:.4f} {:.4f} {:.1f} {:.1f}\n'.format(
+                    date.strftime('%Y %m %d'), date.julday, date.strftime('%H %M %S'),
+                    evts['evla'][i], evts['evlo'][i], evts['evdp'][i], evts['mag'][i]))
+    pa = para()
+    pa.datapath = path
+    pa.rfpath = join(path, 'RFresult')
+    pa.catalogpath = join(path, 'catalog.dat')
+    pa.date_begin = evts['date'][0] - 86400
+    pa.date_end = evts['date'][-1] + 86400
+    pa.offset = None
+    eq_lst = pd.DataFrame({'date': evts['date'], 'evla': evts['evla'], 'evlo': evts['evlo'],
+                           'evdp': evts['evdp'], 'mag': evts['mag']})
+    return pa, eq_lst
+
+
+def write_rfs(path, nev=100, station='SYN', stla=30., stlo=100., dt=0.1, shift=10., time_after=120.,
+              noise=0.01, seed=0, **kwargs):
+    """Write radial and transverse RFs of a station in ``path/station`` with a ``finallist.dat``.
+    Keyword arguments are passed to :func:`synthetic_rf`.
+
+    :return: Path to the RF directory
+    :rtype: str
+    """
+    rfpath = join(path, station)
+    makedirs(rfpath, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dis = rng.uniform(30, 90, nev)
+    bazi = rng.uniform(0, 360, nev)
+    rayp = 0.08 - 0.0006 * (dis - 30)
+    evla, evlo = latlon_from(stla, stlo, bazi, dis)
+    npts = int((shift + time_after) / dt) + 1
+    time_axis = np.arange(npts) * dt - shift
+    datar, datat = synthetic_rf(time_axis, rayp, bazi, **kwargs)
+    datar += noise * rng.normal(size=datar.shape)
+    datat += noise * rng.normal(size=datat.shape)
+    with open(join(rfpath, station + 'finallist.dat'), 'w') as f:
+        for i in range(nev):
+            evt = (UTCDateTime('2015-01-01') + 86400 * i).strftime('%Y.%j.%H.%M.%S')
+            for comp, data in zip(('R', 'T'), (datar[i], datat[i])):
+                sac = SACTrace(data=data, delta=dt, b=-shift, kstnm=station, kcmpnm=comp,
+                               stla=stla, stlo=stlo, stel=0., baz=bazi[i], gcarc=dis[i],
+                               user0=rayp[i])
+                sac.write(join(rfpath, '{}_P_{}.sac'.format(evt, comp)))
+            f.write('{} P {:.3f} {:.3f} {:.1f} {:.2f} {:.2f} {:.6f} {:.1f} 2.0\n'.format(
+                    evt, evla[i], evlo[i], 50., dis[i], bazi[i], rayp[i], 6.))
+    return rfpath
+
+
+def gen_rfdep(nsta=20, nev=100, depth_axis=np.arange(0, 801, 1.), center=(30., 100.), span=4., seed=0):
+    """``RFdepth`` structure as written by :func:`seispy.rf2depth_makedata.makedata` with
+    stations on a grid. Conversion points are calculated in iasp91 and RFs in depth have
+    peaks at 410 and 660 km.
+
+    :rtype: list
+    """
+    rng = np.random.default_rng(seed)
+    nside = int(np.ceil(np.sqrt(nsta)))
+    grid = np.linspace(-span / 2, span / 2, nside)
+    stla = center[0] + np.repeat(grid, nside)[:nsta]
+    stlo = center[1] + np.tile(grid, nside)[:nsta]
+    dep_mod = DepModel(depth_axis)
+    rfdep = []
+    for s in range(nsta):
+        bazi = rng.uniform(0, 360, nev)
+        rayp = skm2srad(rng.uniform(0.04, 0.07, nev))
+        _, x_s, _ = xps_tps_map(dep_mod, rayp[:, np.newaxis], rayp[:, np.newaxis])
+        plat, plon = latlon_from(stla[s], stlo[s], bazi[:, np.newaxis], rad2deg(np.real(x_s)))
+        amp = (0.05 * np.exp(-((depth_axis - 410 - rng.normal(0, 5)) / 8) ** 2) +
+               0.04 * np.exp(-((depth_axis - 660 - rng.normal(0, 5)) / 8) ** 2))
+        rfdep.append({'station': 'SY{:03d}'.format(s), 'stalat': stla[s], 'stalon': stlo[s],
+                      'depthrange': depth_axis, 'bazi': bazi, 'rayp': rayp,
+                      'moveout_correct': amp + 0.02 * rng.normal(size=(nev, depth_axis.size)),
+                      'piercelat': plat, 'piercelon': plon,
+                      'stopindex': np.full(nev, depth_axis.size - 1)})
+    return rfdep
+
+
+CCP_CFG = """[FileIO]
+rfpath = {path}
+rayp_lib =
+depthdat = {depthdat}
+stackfile = {path}/ccp.dat
+stalist = {path}/sta.lst
+stack_sta_list =
+velmod = iasp91
+
+[bin]
+shape = circle
+domperiod = 5
+bin_radius = {bin_radius}
+slide_val = {slide_val}
+
+[line]
+profile_lat1 = {lat1}
+profile_lon1 = {lon1}
+profile_lat2 = {lat2}
+profile_lon2 = {lon2}
+
+[depth]
+dep_end = {dep_end}
+dep_val = {dep_val}
+
+[stack]
+stack_start = {stack_start}
+stack_end = {stack_end}
+stack_val = {stack_val}
+
+[spacedbins]
+center_lat = {center_lat}
+center_lon = {center_lon}
+half_len_lat = {half_len}
+half_len_lon = {half_len}
+"""
+
+
+def write_rfdep(path, nsta=20, nev=100, dep_end=800., dep_val=1., center=(30., 100.), span=4.,
+                bin_radius=50, slide_val=50, stack_range=(300, 750, 2), seed=0):
+    """Write an ``RFdepth`` file, a station list and a configure file for
+    :class:`seispy.ccp3d.CCP3D` and :class:`seispy.ccpprofile.CCPProfile`.
+
+    :return: Path to the configure file
+    :rtype: str
+    """
+    makedirs(path, exist_ok=True)
+    depth_axis = np.append(np.arange(0, dep_end, dep_val), dep_end)
+    rfdep = gen_rfdep(nsta, nev, depth_axis, center, span, seed)
+    depthdat = join(path, 'RFdepth.npy')
+    np.save(depthdat, rfdep)
+    with open(join(path, 'sta.lst'), 'w') as f:
+        for sta in rfdep:
+            f.write('{}\t{:.3f}\t{:.3f}\t0\n'.format(sta['station'], sta['stalat'], sta['stalon']))
+    cfg_file = join(path, 'ccp.cfg')
+    with open(cfg_file, 'w') as f:
+        f.write(CCP_CFG.format(path=path, depthdat=depthdat, bin_radius=bin_radius, slide_val=slide_val,
+                               lat1=center[0] - span / 2, lon1=center[1] - span / 2,
+                               lat2=center[0] + span / 2, lon2=center[1] + span / 2,
+                               dep_end=dep_end, dep_val=dep_val, stack_start=stack_range[0],
+                               stack_end=stack_range[1], stack_val=stack_range[2],
+                               center_lat=center[0], center_lon=center[1], half_len=span / 2))
+    return cfg_file
+
+
+def write_mod3d(path, center=(30., 100.), span=10., dep_end=800., nlat=21, nlon=21, ndep=81, seed=0):
+    """Write a 3-D velocity model of iasp91 with random perturbations up to 2%.
+
+    :return: Path to the ``.npz`` file
+    :rtype: str
+    """
+    rng = np.random.default_rng(seed)
+    dep = np.linspace(0, dep_end, ndep)
+    lat = np.linspace(center[0] - span / 2, center[0] + span / 2, nlat)
+    lon = np.linspace(center[1] - span / 2, center[1] + span / 2, nlon)
+    dep_mod = DepModel(dep)
+    pert = 1 + 0.02 * rng.uniform(-1, 1, (ndep, nlat, nlon))
+    fname = join(path, 'mod3d.npz')
+    np.savez(fname, dep=dep, lat=lat, lon=lon, vp=dep_mod.vp[:, np.newaxis, np.newaxis] * pert,
+             vs=dep_mod.vs[:, np.newaxis, np.newaxis] * pert)
+    return fname
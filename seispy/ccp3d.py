@@ -1,18 +1,27 @@
 import numpy as np
-from seispy.geo import km2deg, latlon_from, cosd, extrema, skm2srad, rad2deg
+from seispy.geo import km2deg, latlon_from, cosd, skm2srad, rad2deg
 from seispy import distaz
 from seispy.rfcorrect import DepModel
 from seispy.setuplog import setuplog
-from scikits.bootstrap import ci
 from seispy.ccppara import ccppara, CCPPara
 from seispy.signal import smooth
 from seispy.utils import check_stack_val, read_rfdep
-from scipy.interpolate import interp1d
+from seispy.ccpoperator import load_or_build
+from seispy.ccpstats import CCPStats
+from seispy.metrics import metrics
+from os.path import exists, join
+from os import makedirs
+import hashlib
 import warnings
 import sys
 
 
-def gen_center_bin(center_lat, center_lon, len_lat, len_lon, val):
+def _center_bin_cache(cache, center_lat, center_lon, len_lat, len_lon, val):
+    key = '{:.10f} {:.10f} {:.10f} {:.10f} {:.10f}'.format(center_lat, center_lon, len_lat, len_lon, val)
+    return join(cache, 'center_bin_{}.npz'.format(hashlib.sha1(key.encode()).hexdigest()[:16]))
+
+
+def gen_center_bin(center_lat, center_lon, len_lat, len_lon, val, cache=None):
     """
 Create spaced grid point with coordinates of the center point in the area in spherical coordinates.
 
@@ -26,33 +35,34 @@ Create spaced grid point with coordinates of the center point in the area in sph
 :type len_lon: float
 :param val: Interval in degree between adjacent grid point.
 :type val: float
-:return: Coordinates of Grid points.
-:rtype: 2-D ndarray of floats with shape (n, 2), where n is the number of grid points.
+:param cache: Directory to cache the grid, keyed by the parameters above. Defaults to None for no cache.
+:type cache: str, optional
+:return: Coordinates of Grid points, coordinates in shape of (nlat, nlon, 2) and indices of grid points in shape of (nlat, nlon).
+:rtype: (2-D ndarray of floats with shape (n, 2), 3-D ndarray, 2-D ndarray)
     """
+    if cache is not None:
+        cache_file = _center_bin_cache(cache, center_lat, center_lon, len_lat, len_lon, val)
+        if exists(cache_file):
+            with np.load(cache_file) as grid:
+                return grid['bin_loca'], grid['bin_mat'], grid['bin_map']
     lats = np.arange(0, 2*len_lat, val)
     lons = np.arange(0, 2*len_lon, val)
     plat, plon = latlon_from(center_lat, center_lon, 0, 90)
     da = distaz(plat, plon, center_lat, center_lon)
     begx = -len_lon 
     begy = -len_lat
-    bin_loca = []
-    bin_mat = np.zeros([lats.size, lons.size, 2])
-    bin_map = np.zeros([lats.size, lons.size]).astype(int)
-    n = 0
-    for j in range(lats.size):
-        delyinc = j * val + begy
-        delt = da.delta + delyinc
-        for i in range(lons.size):
-            azim = da.az + (begx + i * val) / cosd(delyinc)
-            glat, glon = latlon_from(plat, plon, azim, delt)
-            if glon > 180:
-                glon -= 360
-            bin_loca.append([glat, glon])
-            bin_mat[j, i, 0] = glat
-            bin_mat[j, i, 1] = glon
-            bin_map[j, i] = n
-            n += 1
-    return np.array(bin_loca), bin_mat, bin_map
+    delyinc = np.arange(lats.size) * val + begy
+    delt = da.delta + delyinc
+    azim = da.az + (begx + np.arange(lons.size) * val) / cosd(delyinc)[:, np.newaxis]
+    glat, glon = latlon_from(plat, plon, azim, delt[:, np.newaxis])
+    glon[glon > 180] -= 360
+    bin_mat = np.stack((glat, glon), axis=-1)
+    bin_map = np.arange(lats.size * lons.size).reshape(lats.size, lons.size)
+    bin_loca = bin_mat.reshape(-1, 2)
+    if cache is not None:
+        makedirs(cache, exist_ok=True)
+        np.savez(cache_file, bin_loca=bin_loca, bin_mat=bin_mat, bin_map=bin_map)
+    return bin_loca, bin_mat, bin_map
 
 
 def bin_shape(cpara):
@@ -68,13 +78,16 @@ def bin_shape(cpara):
 
 def boot_bin_stack(data_bin, n_samples=3000):
     warnings.filterwarnings("ignore")
+    # NaN beyond the end of RFs is skipped, the same as the stacking operator and statistics
+    data_bin = data_bin[np.isfinite(data_bin)]
     count = data_bin.shape[0]
     if count > 1:
         if n_samples is not None:
+            from scikits.bootstrap import ci
             cci = ci(data_bin, n_samples=n_samples)
         else:
             cci = np.array([np.nan, np.nan])
-        mu = np.average(data_bin)
+        mu = np.mean(data_bin, dtype=np.float64)
     else:
         cci = np.array([np.nan, np.nan])
         mu = np.nan
@@ -92,6 +105,67 @@ def _sta_val(stack_range, radius):
     return dis
 
 
+def _local_extrema(mat, opt='max'):
+    # strict local extrema along the last axis, same as seispy.geo.extrema for each row
+    diff = np.diff(mat, axis=-1)
+    mask = np.zeros(mat.shape, dtype=bool)
+    if opt == 'max':
+        mask[..., 1:-1] = (diff[..., :-1] > 0) & (diff[..., 1:] < 0)
+    elif opt == 'min':
+        mask[..., 1:-1] = (diff[..., :-1] < 0) & (diff[..., 1:] > 0)
+    else:
+        raise ValueError('opt must be \'max\' or \'min\'')
+    return mask
+
+
+def peak_depth(mu, stack_range, dep_min, dep_max):
+    """Depth of the largest positive local maximum within ``(dep_min, dep_max)`` for all bins.
+
+    :param mu: Stacked amplitudes of all bins in shape of ``(nbin, ndep)``
+    :type mu: numpy.ndarray
+    :param stack_range: Depth axis of ``mu``
+    :type stack_range: numpy.ndarray
+    :param dep_min: Minimum depth of the window
+    :type dep_min: float
+    :param dep_max: Maximum depth of the window
+    :type dep_max: float
+    :return: Depth of peaks, NaN for bins without any peak in the window
+    :rtype: numpy.ndarray
+    """
+    in_win = (stack_range > dep_min) & (stack_range < dep_max)
+    mask = _local_extrema(mu) & (mu > 0) & in_win
+    idx = np.argmax(np.where(mask, mu, -np.inf), axis=1)
+    return np.where(mask.any(axis=1), stack_range[idx], np.nan)
+
+
+def crossing_depth(mu, stack_range, cvalue, low_idx, up_idx):
+    """Depths where traces cross ``cvalue`` between ``low_idx`` and ``up_idx`` for all bins,
+    by linear interpolation between adjacent samples.
+
+    :return: Upper and lower depths in shape of ``(nbin, 2)``,
+             NaN for bins that do not cross ``cvalue`` exactly twice
+    :rtype: numpy.ndarray
+    """
+    nbin, ndep = mu.shape
+    k = np.arange(ndep - 1)
+    amp = mu[:, :-1]
+    amp_next = mu[:, 1:]
+    c = cvalue[:, np.newaxis]
+    cross = ((amp <= c) & (c < amp_next)) | ((amp > c) & (c >= amp_next))
+    cross &= (k >= low_idx[:, np.newaxis]) & (k < up_idx[:, np.newaxis])
+    first = np.argmax(cross, axis=1)
+    last = ndep - 2 - np.argmax(cross[:, ::-1], axis=1)
+    err = np.full((nbin, 2), np.nan)
+    valid = cross.sum(axis=1) == 2
+    rows = np.where(valid)[0]
+    for col, kk in enumerate((first[rows], last[rows])):
+        a0 = mu[rows, kk]
+        a1 = mu[rows, kk + 1]
+        err[rows, col] = stack_range[kk] + (cvalue[rows] - a0) * \
+            (stack_range[kk + 1] - stack_range[kk]) / (a1 - a0)
+    return err
+
+
 class CCP3D():
     def __init__(self, cfg_file=None, log=None):
         """Class for 3-D CCP stacking, Usually used to study mantle transition zone structure.
@@ -140,7 +214,8 @@ class CCP3D():
 
     def initial_grid(self):
         self.read_rfdep()
-        self.bin_loca, self.bin_mat, self.bin_map = gen_center_bin(*self.cpara.center_bin)
+        self.bin_loca, self.bin_mat, self.bin_map = gen_center_bin(*self.cpara.center_bin,
+                                                                   cache=self.cpara.bin_cache)
         self.fzone = bin_shape(self.cpara)
         self.stalst = _get_sta(self.rfdep)
         self.dismin = _sta_val(self.cpara.stack_range, self.fzone[-1])
@@ -148,10 +223,65 @@ class CCP3D():
     def _select_sta(self, bin_lat, bin_lon):
         return np.where(distaz(bin_lat, bin_lon, self.stalst[:, 0], self.stalst[:, 1]).delta <= self.dismin)[0]
 
+    def _stack_idx(self):
+        return (np.arange(self.cpara.stack_range.size) * self.stack_mul +
+                self.cpara.stack_range[0]/self.cpara.dep_val).astype(int)
+
+    def _sta_bins(self):
+        return [np.where(distaz(sta[0], sta[1], self.bin_loca[:, 0], self.bin_loca[:, 1]).delta <= self.dismin)[0]
+                for sta in self.stalst]
+
+    @metrics.timed('ccp3d.stack_operator', items=lambda self: self.bin_loca.shape[0])
+    def stack_operator(self):
+        """Stack with the sparse operator in ``cpara.stack_operator``, which is built and saved
+        at the first run and reused as long as the pierce points and bins are unchanged.
+        """
+        op = load_or_build(self.cpara.stack_operator, self.rfdep, self.bin_loca, self._stack_idx(),
+                           self.fzone, sta_bins=self._sta_bins, logger=self.logger)
+        mu, ci, count = op.stack(op.amplitudes(self.rfdep), self.fzone, weight=self.cpara.stack_weight,
+                                 boot_samples=self.cpara.boot_samples)
+        self.stack_data = []
+        for i, bin_info in enumerate(self.bin_loca):
+            self.stack_data.append({'bin_lat': bin_info[0], 'bin_lon': bin_info[1],
+                                    'mu': mu[i], 'ci': ci[i], 'count': count[i]})
+
+    @metrics.timed('ccp3d.stack_incremental', items=lambda self: self.bin_loca.shape[0])
+    def stack_incremental(self):
+        """Merge stations in ``rfdep`` into the statistics in ``cpara.stack_stats`` and restack.
+        New stations are added and changed stations replaced, so ``rfdep`` only needs to include
+        new or updated stations. Confidence intervals are only recomputed in affected bins.
+        """
+        path = self.cpara.stack_stats
+        stack_idx = self._stack_idx()
+        stats = None
+        if exists(path):
+            stats = CCPStats.load(path)
+            if not stats.match(self.bin_loca, stack_idx, self.fzone):
+                self.logger.CCPlog.warning('Statistics in {} do not match the bins, restarting'.format(path))
+                stats = None
+        if stats is None:
+            stats = CCPStats(self.bin_loca, stack_idx, self.fzone, reservoir=self.cpara.stats_reservoir)
+        rows = stats.update(self.rfdep, sta_bins=self._sta_bins(), logger=self.logger)
+        self.logger.CCPlog.info('{} bins affected'.format(np.unique(rows // stack_idx.size).size))
+        mu, ci, count, _ = stats.stack(rows, boot_samples=self.cpara.boot_samples)
+        stats.save(path)
+        self.stack_data = []
+        for i, bin_info in enumerate(self.bin_loca):
+            self.stack_data.append({'bin_lat': bin_info[0], 'bin_lon': bin_info[1],
+                                    'mu': mu[i], 'ci': ci[i], 'count': count[i]})
+
     def stack(self):
         """Search conversion points falling within a bin and stack them with bootstrap method.
+        Use the incremental statistics if ``cpara.stack_stats`` is set,
+        or the sparse stacking operator if ``cpara.stack_operator`` is set.
         """
-        for i, bin_info in enumerate(self.bin_loca):
+        if self.cpara.stack_stats is not None:
+            self.stack_incremental()
+            return
+        if self.cpara.stack_operator is not None:
+            self.stack_operator()
+            return
+        for i, bin_info in metrics.batched('ccp3d.stack_bins', enumerate(self.bin_loca)):
             boot_stack = {}
             bin_mu = np.zeros(self.cpara.stack_range.size)
             bin_ci = np.zeros([self.cpara.stack_range.size, 2])
@@ -188,52 +318,34 @@ class CCP3D():
             raise ValueError('fname should be in \'str\'')
         np.savez(fname, cpara=self.cpara, stack_data=self.stack_data)
     
-    def _search_peak(self, tr, peak_410_min=380, peak_410_max=440, peak_660_min=630, peak_660_max=690):
-        tr = smooth(tr, half_len=4)
-        idx_all = extrema(tr)
-        idx_ex = np.where(tr[idx_all] > 0)[0]
-        #idx = idx_all[idx_ex]
-        peak = tr[idx_all[idx_ex]]
-        peak_depth = idx_all[idx_ex] * self.cpara.stack_val + self.cpara.stack_range[0]
-        idx_410 = np.where((peak_depth>peak_410_min) & (peak_depth<peak_410_max))[0]
-        try:
-            idx_410_max = idx_410[np.nanargmax(peak[idx_410])]
-            dep_410 = peak_depth[idx_410_max]
-        except:
-            dep_410 = np.nan
-        idx_660 = np.where((peak_depth>peak_660_min) & (peak_depth<peak_660_max))[0]
-        try:
-            idx_660_max = idx_660[np.nanargmax(peak[idx_660])]
-            dep_660 = peak_depth[idx_660_max]
-        except:
-            dep_660 = np.nan
-        return dep_410, dep_660
+    def _stack_matrix(self, key):
+        return np.array([boot_stack[key] for boot_stack in self.stack_data])
 
     def search_good_410_660(self, peak_410_min=380, peak_410_max=440, peak_660_min=630, peak_660_max=690):
-        self.good_410_660 = np.zeros_like(self.bin_loca)
-        for i, boot_stack in enumerate(self.stack_data):
-            self.good_410_660[i, 0], self.good_410_660[i, 1] = self._search_peak(boot_stack['mu'], peak_410_min, peak_410_max, peak_660_min, peak_660_max)
+        """Search the largest positive peaks around 410 km and 660 km in smoothed stacks of all bins.
+
+        :param peak_410_min: Minimum depth of the 410 window, defaults to 380
+        :param peak_410_max: Maximum depth of the 410 window, defaults to 440
+        :param peak_660_min: Minimum depth of the 660 window, defaults to 630
+        :param peak_660_max: Maximum depth of the 660 window, defaults to 690
+        """
+        mu = smooth(self._stack_matrix('mu'), half_len=4)
+        dep_axis = np.arange(mu.shape[1]) * self.cpara.stack_val + self.cpara.stack_range[0]
+        self.good_410_660 = np.column_stack((peak_depth(mu, dep_axis, peak_410_min, peak_410_max),
+                                             peak_depth(mu, dep_axis, peak_660_min, peak_660_max)))
 
     def save_good_410_660(self, fname):
-        with open(fname, 'w') as f:
-            for i, good_peak in enumerate(self.good_410_660):
-                if np.isnan(good_peak[0]):
-                    ci_410 = np.array([np.nan, np.nan])
-                    count_410 = np.nan
-                else:
-                    idx = int((good_peak[0]-self.cpara.stack_range[0]) / self.cpara.stack_val)
-                    ci_410 = self.stack_data[i]['ci'][idx]
-                    count_410 = self.stack_data[i]['count'][idx]
-                if np.isnan(good_peak[1]):
-                    ci_660 = np.array([np.nan, np.nan])
-                    count_660 = np.nan
-                else:
-                    idx = int((good_peak[1]-self.cpara.stack_range[0]) / self.cpara.stack_val)
-                    ci_660 = self.stack_data[i]['ci'][idx]
-                    count_660 = self.stack_data[i]['count'][idx]
-                f.write('{:.3f} {:.3f} {:.0f} {:.4f} {:.4f} {:.0f} {:.0f} {:.4f} {:.4f} {:.0f}\n'.format(   
-                        self.bin_loca[i, 0], self.bin_loca[i, 1], good_peak[0], ci_410[0], ci_410[1], count_410,
-                        good_peak[1], ci_660[0], ci_660[1], count_660))
+        ci = self._stack_matrix('ci')
+        count = self._stack_matrix('count')
+        rows = np.arange(self.good_410_660.shape[0])
+        cols = [self.bin_loca]
+        for dep in self.good_410_660.T:
+            isnan = np.isnan(dep)
+            idx = np.where(isnan, 0, (np.nan_to_num(dep) - self.cpara.stack_range[0]) / self.cpara.stack_val).astype(int)
+            cols += [dep[:, np.newaxis],
+                     np.where(isnan[:, np.newaxis], np.nan, ci[rows, idx]),
+                     np.where(isnan, np.nan, count[rows, idx])[:, np.newaxis]]
+        np.savetxt(fname, np.hstack(cols), fmt='%.3f %.3f %.0f %.4f %.4f %.0f %.0f %.4f %.4f %.0f')
 
     @classmethod
     def read_stack_data(cls, stack_data_path, cfg_file=None, good_depth_path=None, ismtz=False):
@@ -241,58 +353,53 @@ class CCP3D():
         data = np.load(stack_data_path, allow_pickle=True)
         ccp.stack_data = data['stack_data']
         ccp.cpara = data['cpara'].any()
-        ccp.bin_loca, ccp.bin_mat, ccp.bin_map = gen_center_bin(*ccp.cpara.center_bin)
+        ccp.bin_loca, ccp.bin_mat, ccp.bin_map = gen_center_bin(*ccp.cpara.center_bin,
+                                                                cache=getattr(ccp.cpara, 'bin_cache', None))
         if good_depth_path is not None:
             if ismtz:
-                ccp.good_410_660[:, 0] =  np.loadtxt(good_depth_path, usecols=[2])
-                ccp.good_410_660[:, 0] =  np.loadtxt(good_depth_path, usecols=[6])
+                ccp.good_410_660 = np.loadtxt(good_depth_path, usecols=[2, 6], ndmin=2)
             else:
                 ccp.good_depth = np.loadtxt(good_depth_path, usecols=[2])
         return ccp
 
     def get_depth_err(self, type='std'):
-        moho_err = np.zeros([self.bin_loca.shape[0], 2])
         self.logger.CCPlog.info('Computing errors of selected depth')
         if self.good_depth.size == 0:
             self.logger.CCPlog.error('Please load good depths before.')
             sys.exit(1)
-        if np.isnan(self.stack_data['ci']).all() and type == 'ci':
+        mu = self._stack_matrix('mu')
+        ci = self._stack_matrix('ci')
+        if np.isnan(ci).all() and type == 'ci':
             self.logger.CCPlog.warning('No confidence intervals in stack data, using standard division instead.')
             type = 'std'
-        for i, _ in enumerate(self.bin_loca):
-            if np.isnan(self.good_depth[i]):
-                moho_err[i, 0], moho_err[i, 1] = np.nan, np.nan
-            else:
-                idx = np.nanargmin(np.abs(self.cpara.stack_range-self.good_depth[i]))
-                mu = self.stack_data[i]['mu']
-                min_idxes = extrema(mu, opt='min')
-                try:
-                    low_idx = min_idxes[np.max(np.where((min_idxes - idx) < 0)[0])]
-                    up_idx = min_idxes[np.min(np.where((min_idxes - idx) > 0)[0])]
-                except:
-                    moho_err[i, 0], moho_err[i, 1] = np.nan, np.nan
-                    continue
-                if type == 'std':
-                    cvalue = mu[idx] - 1.645 * np.std(mu[low_idx:up_idx+1])/np.sqrt(up_idx-low_idx+1)
-                elif type == 'ci':
-                    cvalue = self.stack_data[i]['ci'][idx, 0]
-                else:
-                    self.logger.error('Reference type should be in \'std\' and \'ci\'')
-                    sys.exit(1)
-                moho_err[i, 0], moho_err[i, 1] = self._get_err(mu[low_idx:up_idx+1],
-                                    self.cpara.stack_range[low_idx:up_idx+1], cvalue)
-        return moho_err
-
-    def _get_err(self, tr, dep, cvalue):
-        result = np.array([])
-        for i, amp in enumerate(tr[:-1]):
-            if (amp <= cvalue < tr[i+1]) or (amp > cvalue >= tr[i+1]):
-                result = np.append(result, interp1d([amp, tr[i+1]], 
-                                  [dep[i], dep[i+1]])(cvalue))
-        if len(result) == 2:
-            return result[0], result[1]
+        if type not in ('std', 'ci'):
+            self.logger.CCPlog.error('Reference type should be in \'std\' and \'ci\'')
+            sys.exit(1)
+        nbin, ndep = mu.shape
+        rows = np.arange(nbin)
+        has_depth = ~np.isnan(self.good_depth)
+        idx = np.argmin(np.abs(self.cpara.stack_range - np.nan_to_num(self.good_depth)[:, np.newaxis]), axis=1)
+        # nearest local minima above and below the selected depth
+        pos = np.arange(ndep)
+        is_min = _local_extrema(mu, opt='min')
+        last_min = np.maximum.accumulate(np.where(is_min, pos, -1), axis=1)
+        next_min = np.minimum.accumulate(np.where(is_min, pos, ndep)[:, ::-1], axis=1)[:, ::-1]
+        low_idx = np.where(idx > 0, last_min[rows, np.maximum(idx - 1, 0)], -1)
+        up_idx = np.where(idx < ndep - 1, next_min[rows, np.minimum(idx + 1, ndep - 1)], ndep)
+        valid = has_depth & (low_idx >= 0) & (up_idx < ndep)
+        low_idx = np.where(valid, low_idx, 0)
+        up_idx = np.where(valid, up_idx, 0)
+        if type == 'std':
+            seg = (pos >= low_idx[:, np.newaxis]) & (pos <= up_idx[:, np.newaxis])
+            seg_len = up_idx - low_idx + 1
+            seg_mean = np.sum(np.where(seg, mu, 0), axis=1) / seg_len
+            seg_std = np.sqrt(np.sum(np.where(seg, (mu - seg_mean[:, np.newaxis]) ** 2, 0), axis=1) / seg_len)
+            cvalue = mu[rows, idx] - 1.645 * seg_std / np.sqrt(seg_len)
         else:
-            return np.nan, np.nan
+            cvalue = ci[rows, idx, 0]
+        moho_err = crossing_depth(mu, self.cpara.stack_range, cvalue, low_idx, up_idx)
+        moho_err[~valid] = np.nan
+        return moho_err
 
 if __name__ == '__main__':
     bin_loca = gen_center_bin(48.5, 100, 5, 8, km2deg(55))
@@ -0,0 +1,264 @@
+"""Sparse operator of CCP stacking.
+
+Rows of the operator are (bin, stack depth) pairs in the order of ``bin * nstack + depth``.
+Columns are samples of ``moveout_correct`` of all stations in ``rfdep``, concatenated in the
+order of stations, events and depths. Each entry stores the distance in degree between the
+pierce point and the bin center, so that the operator only depends on the geometry. Bin
+radii, distance weights and amplitudes are applied when stacking, and the operator can be
+saved and reused as long as the pierce points and bins are unchanged.
+"""
+import hashlib
+import numpy as np
+from os.path import exists
+from scipy.sparse import csr_matrix
+from seispy.distaz import delaz
+
+
+OPERATOR_VERSION = 2
+
+
+def fingerprint(sta, field_lat='piercelat', field_lon='piercelon', amplitudes=False):
+    """Hash of pierce points and stop indices of a station in ``rfdep``
+
+    :param amplitudes: Whether also hash ``moveout_correct``, defaults to False
+    :type amplitudes: bool, optional
+    :rtype: str
+    """
+    sha = hashlib.sha1()
+    keys = (field_lat, field_lon, 'stopindex') + (('moveout_correct',) if amplitudes else ())
+    for key in keys:
+        sha.update(np.ascontiguousarray(sta[key]).tobytes())
+    return sha.hexdigest()
+
+
+def _weight(dis, radius, weight=None):
+    inside = dis < radius
+    if weight is None:
+        return inside.astype(float)
+    elif weight == 'linear':
+        return np.where(inside, 1 - dis / radius, 0.)
+    elif weight == 'gaussian':
+        return np.where(inside, np.exp(-2 * (dis / radius) ** 2), 0.)
+    else:
+        raise ValueError('weight must be in None, \'linear\' or \'gaussian\'')
+
+
+class CCPOperator(object):
+    def __init__(self, matrix, nbin, stack_idx, radius, stations, ev_shapes, bin_loca, fingerprints=None):
+        """Sparse operator from samples of ``moveout_correct`` to (bin, depth) stacks.
+        Use :meth:`build` or :meth:`load` to initialize it.
+
+        :param matrix: Distance between pierce points and bins in shape of ``(nbin*nstack, nsample)``
+        :type matrix: scipy.sparse.csr_matrix
+        :param nbin: Number of bins
+        :type nbin: int
+        :param stack_idx: Index in ``depthrange`` of each stack depth
+        :type stack_idx: numpy.ndarray
+        :param radius: Maximum radius in degree of bins at each stack depth when building
+        :type radius: numpy.ndarray
+        :param stations: Station names in ``rfdep``
+        :type stations: list
+        :param ev_shapes: Shape of ``moveout_correct`` of each station
+        :type ev_shapes: numpy.ndarray
+        :param bin_loca: Coordinates of bins
+        :type bin_loca: numpy.ndarray
+        :param fingerprints: :func:`fingerprint` of pierce points of each station, defaults to None
+        :type fingerprints: list, optional
+        """
+        self.matrix = matrix
+        self.nbin = nbin
+        self.stack_idx = np.asarray(stack_idx)
+        self.nstack = self.stack_idx.size
+        self.radius = np.asarray(radius)
+        self.stations = list(stations)
+        self.ev_shapes = np.asarray(ev_shapes).reshape(-1, 2)
+        self.bin_loca = np.asarray(bin_loca)
+        self.fingerprints = None if fingerprints is None else list(fingerprints)
+
+    @classmethod
+    def build(cls, rfdep, bin_loca, stack_idx, radius, sta_bins=None,
+              field_lat='piercelat', field_lon='piercelon', max_elements=2**22, logger=None):
+        """Search pierce points falling within bins at each stack depth.
+
+        :param rfdep: RF data in depth from ``rf2depth``
+        :type rfdep: list or numpy.ndarray of dict
+        :param bin_loca: Coordinates of bins in shape of ``(nbin, 2)``
+        :type bin_loca: numpy.ndarray
+        :param stack_idx: Index in ``depthrange`` of each stack depth
+        :type stack_idx: numpy.ndarray
+        :param radius: Radius in degree of bins at each stack depth.
+                       Stacking with larger radii requires rebuilding the operator.
+        :type radius: numpy.ndarray
+        :param sta_bins: Candidate bin indices of each station, defaults to None for all bins
+        :type sta_bins: list of numpy.ndarray, optional
+        :param field_lat: Field of latitude of pierce points, defaults to 'piercelat'
+        :type field_lat: str, optional
+        :param field_lon: Field of longitude of pierce points, defaults to 'piercelon'
+        :type field_lon: str, optional
+        :param max_elements: Maximum number of bin-pierce point pairs in one distance computation
+        :type max_elements: int, optional
+        :param logger: Logger with ``CCPlog``, defaults to None
+        :type logger: seispy.setuplog.setuplog, optional
+        :rtype: CCPOperator
+        """
+        bin_loca = np.asarray(bin_loca)
+        nbin = bin_loca.shape[0]
+        stack_idx = np.asarray(stack_idx, dtype=int)
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), stack_idx.shape)
+        nstack = stack_idx.size
+        rows, cols, dis = [], [], []
+        offset = 0
+        ev_shapes = []
+        for k, sta in enumerate(rfdep):
+            shape = sta['moveout_correct'].shape
+            ev_shapes.append(shape)
+            bins = np.arange(nbin) if sta_bins is None else np.asarray(sta_bins[k], dtype=int)
+            if logger is not None:
+                logger.CCPlog.info('{}/{} building stacking operator of {}'.format(k + 1, len(rfdep), sta['station']))
+            if bins.size:
+                for j, idx in enumerate(stack_idx):
+                    evs = np.where(sta['stopindex'] >= idx)[0]
+                    if evs.size == 0:
+                        continue
+                    plat = sta[field_lat][evs, idx]
+                    plon = sta[field_lon][evs, idx]
+                    chunk = max(1, max_elements // evs.size)
+                    for b in range(0, bins.size, chunk):
+                        cbins = bins[b:b+chunk]
+                        delta = delaz(plat, plon, bin_loca[cbins, 0][:, np.newaxis],
+                                      bin_loca[cbins, 1][:, np.newaxis])[0]
+                        ib, ie = np.where(delta < radius[j])
+                        rows.append(cbins[ib] * nstack + j)
+                        cols.append(offset + evs[ie] * shape[1] + idx)
+                        dis.append(delta[ib, ie])
+            offset += shape[0] * shape[1]
+        if rows:
+            rows, cols, dis = np.concatenate(rows), np.concatenate(cols), np.concatenate(dis)
+        matrix = csr_matrix((dis, (rows, cols)), shape=(nbin * nstack, offset))
+        matrix.sort_indices()
+        stations = [sta['station'] for sta in rfdep]
+        fingerprints = [fingerprint(sta, field_lat, field_lon) for sta in rfdep]
+        return cls(matrix, nbin, stack_idx, radius, stations, ev_shapes, bin_loca, fingerprints)
+
+    def save(self, path):
+        """Save the operator to a ``.npz`` file"""
+        np.savez(path, version=OPERATOR_VERSION, data=self.matrix.data, indices=self.matrix.indices,
+                 indptr=self.matrix.indptr, shape=np.array(self.matrix.shape), nbin=self.nbin,
+                 stack_idx=self.stack_idx, radius=self.radius, stations=np.array(self.stations, dtype=str),
+                 ev_shapes=self.ev_shapes, bin_loca=self.bin_loca,
+                 fingerprints=np.array(self.fingerprints or [], dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        """Load an operator saved by :meth:`save`"""
+        with np.load(path, allow_pickle=False) as op:
+            if op['version'] > OPERATOR_VERSION:
+                raise ValueError('Operator version {} is newer than supported version {}'.format(
+                                 op['version'], OPERATOR_VERSION))
+            matrix = csr_matrix((op['data'], op['indices'], op['indptr']), shape=tuple(op['shape']))
+            # operators saved before version 2 have no fingerprints and never match
+            fingerprints = op['fingerprints'].tolist() if 'fingerprints' in op.files else None
+            return cls(matrix, int(op['nbin']), op['stack_idx'], op['radius'], op['stations'].tolist(),
+                       op['ev_shapes'], op['bin_loca'], fingerprints)
+
+    def match(self, rfdep, bin_loca, stack_idx, radius=None, field_lat='piercelat', field_lon='piercelon'):
+        """Whether the operator applies to ``rfdep``, bins and stack depths. Pierce points and
+        stop indices of stations are compared with their fingerprints when building.
+
+        :rtype: bool
+        """
+        if [sta['station'] for sta in rfdep] != self.stations or \
+           not np.array_equal([sta['moveout_correct'].shape for sta in rfdep], self.ev_shapes):
+            return False
+        if self.fingerprints is None or \
+           [fingerprint(sta, field_lat, field_lon) for sta in rfdep] != self.fingerprints:
+            return False
+        if not (np.array_equal(np.asarray(stack_idx), self.stack_idx) and
+                np.allclose(np.asarray(bin_loca), self.bin_loca)):
+            return False
+        return radius is None or bool(np.all(np.asarray(radius) <= self.radius + 1e-10))
+
+    def amplitudes(self, rfdep):
+        """Concatenate ``moveout_correct`` of all stations into the column vector of the operator.
+        The data type of ``moveout_correct`` is kept, and stacking is accumulated in float64.
+
+        :rtype: numpy.ndarray
+        """
+        return np.concatenate([np.asarray(sta['moveout_correct']).ravel() for sta in rfdep])
+
+    def weights(self, radius=None, weight=None):
+        """Weights of pierce points in bins with radius of ``radius`` at each stack depth
+
+        :param radius: Radius in degree of bins at each stack depth, defaults to the radius when building
+        :type radius: numpy.ndarray, optional
+        :param weight: Distance weight in None, ``'linear'`` or ``'gaussian'``, defaults to None for equal weights
+        :type weight: str, optional
+        :return: Sparse weight matrix with the same shape as the operator
+        :rtype: scipy.sparse.csr_matrix
+        """
+        radius = self.radius if radius is None else np.broadcast_to(np.asarray(radius, dtype=float), self.stack_idx.shape)
+        if np.any(radius > self.radius + 1e-10):
+            raise ValueError('Radius of bins exceeds the radius when building the operator')
+        row_radius = np.repeat(np.tile(radius, self.nbin), np.diff(self.matrix.indptr))
+        w = csr_matrix((_weight(self.matrix.data, row_radius, weight), self.matrix.indices.copy(),
+                        self.matrix.indptr.copy()), shape=self.matrix.shape)
+        w.eliminate_zeros()
+        return w
+
+    def stack(self, amp, radius=None, weight=None, boot_samples=None):
+        """Stack amplitudes in bins.
+
+        :param amp: Amplitudes from :meth:`amplitudes`, non-finite amplitudes are skipped
+        :type amp: numpy.ndarray
+        :param radius: Radius in degree of bins at each stack depth, defaults to the radius when building
+        :type radius: numpy.ndarray, optional
+        :param weight: Distance weight in None, ``'linear'`` or ``'gaussian'``, defaults to None
+        :type weight: str, optional
+        :param boot_samples: Number of bootstrap samples for confidence intervals, defaults to None
+        :type boot_samples: int, optional
+        :return: Stacked amplitudes, confidence intervals and counts in shape of
+                 ``(nbin, nstack)``, ``(nbin, nstack, 2)`` and ``(nbin, nstack)``
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        from seispy.ccp3d import boot_bin_stack
+        w = self.weights(radius, weight)
+        # non-finite amplitudes (beyond the end of RFs) are not stacked nor counted
+        finite = np.isfinite(amp)
+        if not finite.all():
+            w = csr_matrix(w.multiply(finite[np.newaxis, :]))
+            w.eliminate_zeros()
+            amp = np.where(finite, amp, 0)
+        count = np.diff(w.indptr)
+        wsum = np.asarray(w.sum(axis=1)).ravel()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mu = np.where(count > 1, (w @ amp) / wsum, np.nan)
+        ci = np.full((mu.size, 2), np.nan)
+        if boot_samples is not None:
+            for r in np.where(count > 1)[0]:
+                ci[r] = boot_bin_stack(amp[w.indices[w.indptr[r]:w.indptr[r+1]]], n_samples=boot_samples)[1]
+        return (mu.reshape(self.nbin, self.nstack), ci.reshape(self.nbin, self.nstack, 2),
+                count.reshape(self.nbin, self.nstack).astype(float))
+
+
+def load_or_build(path, rfdep, bin_loca, stack_idx, radius, sta_bins=None,
+                  field_lat='piercelat', field_lon='piercelon', logger=None):
+    """Load the operator from ``path`` if it applies to the data, otherwise build and save it.
+
+    :param sta_bins: Candidate bin indices of each station or a function returning them, defaults to None
+    :type sta_bins: list or callable, optional
+    :rtype: CCPOperator
+    """
+    if exists(path):
+        op = CCPOperator.load(path)
+        if op.match(rfdep, bin_loca, stack_idx, radius, field_lat=field_lat, field_lon=field_lon):
+            if logger is not None:
+                logger.CCPlog.info('Use stacking operator in {}'.format(path))
+            return op
+        if logger is not None:
+            logger.CCPlog.warning('Stacking operator in {} does not match the data, rebuilding'.format(path))
+    if callable(sta_bins):
+        sta_bins = sta_bins()
+    op = CCPOperator.build(rfdep, bin_loca, stack_idx, radius, sta_bins=sta_bins,
+                           field_lat=field_lat, field_lon=field_lon, logger=logger)
+    op.save(path)
+    return op
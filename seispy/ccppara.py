@@ -24,10 +24,17 @@ class CCPPara(object):
         self.depth_axis = np.array([])
         self.stack_range = np.array([])
         self.center_bin = []
+        self.bin_cache = None
         self.dep_val = 1
         self.stack_val = 1
         self.boot_samples = None
+        self.stack_operator = None
+        self.stack_weight = None
+        self.stack_stats = None
+        self.stats_reservoir = 0
         self.phase = 1
+        self.dtype = np.float64
+        self.rayp_lut = False
         
     @property
     def bin_radius(self):
@@ -115,6 +122,12 @@ def ccppara(cfg_file):
         cpara.phase = cf.getint('depth', 'phase')
     except:
         cpara.phase = 1
+    if cf.has_option('depth', 'rayp_lut'):
+        cpara.rayp_lut = cf.getboolean('depth', 'rayp_lut')
+    if cf.has_option('depth', 'dtype'):
+        dtype = cf.get('depth', 'dtype')
+        if dtype != '':
+            cpara.dtype = np.dtype(dtype)
     cpara.depth_axis = np.append(np.arange(0, dep_end, cpara.dep_val), dep_end)
 
     stack_start = cf.getfloat('stack', 'stack_start')
@@ -125,6 +138,20 @@ def ccppara(cfg_file):
         cpara.boot_samples = cf.getint('stack', 'boot_samples')
     except:
         cpara.boot_samples = None
+    if cf.has_option('stack', 'operator'):
+        operator = cf.get('stack', 'operator')
+        if operator != '':
+            cpara.stack_operator = operator
+    if cf.has_option('stack', 'weight'):
+        weight = cf.get('stack', 'weight')
+        if weight != '':
+            cpara.stack_weight = weight
+    if cf.has_option('stack', 'stats'):
+        stats = cf.get('stack', 'stats')
+        if stats != '':
+            cpara.stack_stats = stats
+    if cf.has_option('stack', 'reservoir'):
+        cpara.stats_reservoir = cf.getint('stack', 'reservoir')
     # para for center bins
     if cf.has_section('spacedbins'):
         cla = cf.getfloat('spacedbins', 'center_lat')
@@ -132,5 +159,9 @@ def ccppara(cfg_file):
         hlla = cf.getfloat('spacedbins', 'half_len_lat')
         hllo = cf.getfloat('spacedbins', 'half_len_lon')
         cpara.center_bin = [cla, clo, hlla, hllo, km2deg(cpara.slide_val)]
+        if cf.has_option('spacedbins', 'bin_cache'):
+            bin_cache = cf.get('spacedbins', 'bin_cache')
+            if bin_cache != '':
+                cpara.bin_cache = bin_cache
 
     return cpara
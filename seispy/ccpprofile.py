@@ -6,8 +6,9 @@ from seispy.distaz import distaz
 from seispy.rfcorrect import DepModel
 from seispy.rf2depth_makedata import Station
 from seispy.ccppara import ccppara, CCPPara
-from scikits.bootstrap import ci
 from seispy.ccp3d import boot_bin_stack
+from seispy.ccpoperator import load_or_build
+from seispy.metrics import metrics
 from seispy.utils import check_stack_val, read_rfdep, create_center_bin_profile
 from os.path import exists, dirname, basename, join
 
@@ -201,18 +202,48 @@ class CCPProfile():
         for i, dep in enumerate(self.cpara.depth_axis):
             rfsta['projlat'][:, i], rfsta['projlon'][:, i] = geoproject(rfsta['piercelat'][:, i], rfsta['piercelon'][:, i], *self.cpara.line)
 
-    def stack(self):
-        """Stack RFs in bins
-        """
-        if self.cpara.shape == 'circle' or self.cpara.adaptive: 
-            field_lat = 'piercelat'
-            field_lon = 'piercelon'
-        elif self.cpara.shape == 'rect':
-            field_lat = 'projlat'
-            field_lon = 'projlon'
+    def _pierce_field(self):
+        if self.cpara.shape == 'rect' and not self.cpara.adaptive:
+            return 'projlat', 'projlon'
+        return 'piercelat', 'piercelon'
+
+    def _sta_bins(self):
+        sta_bins = [[] for _ in range(len(self.rfdep))]
+        if self.cpara.width is None and self.cpara.shape == 'circle':
+            for i, idxs in enumerate(self.idxs):
+                for k in np.atleast_1d(idxs):
+                    sta_bins[k].append(i)
         else:
-            pass
+            for k in self.idxs:
+                sta_bins[k] = np.arange(self.bin_loca.shape[0])
+        return sta_bins
+
+    @metrics.timed('ccpprofile.stack_operator', items=lambda self: self.bin_loca.shape[0])
+    def stack_operator(self):
+        """Stack with the sparse operator in ``cpara.stack_operator``, which is built and saved
+        at the first run and reused as long as the pierce points and bins are unchanged.
+        """
+        field_lat, field_lon = self._pierce_field()
+        stack_idx = (np.arange(self.cpara.stack_range.size) * self.stack_mul +
+                     self.cpara.stack_range[0]/self.cpara.dep_val).astype(int)
+        op = load_or_build(self.cpara.stack_operator, self.rfdep, self.bin_loca, stack_idx, self.fzone,
+                           sta_bins=self._sta_bins, field_lat=field_lat, field_lon=field_lon, logger=self.logger)
+        mu, ci, count = op.stack(op.amplitudes(self.rfdep), self.fzone, weight=self.cpara.stack_weight,
+                                 boot_samples=self.cpara.boot_samples)
+        self.stack_data = []
         for i, bin_info in enumerate(self.bin_loca):
+            self.stack_data.append({'bin_lat': bin_info[0], 'bin_lon': bin_info[1],
+                                    'profile_dis': self.profile_range[i],
+                                    'mu': mu[i], 'ci': ci[i], 'count': count[i]})
+
+    def stack(self):
+        """Stack RFs in bins. Use the sparse stacking operator if ``cpara.stack_operator`` is set.
+        """
+        if self.cpara.stack_operator is not None:
+            self.stack_operator()
+            return
+        field_lat, field_lon = self._pierce_field()
+        for i, bin_info in metrics.batched('ccpprofile.stack_bins', enumerate(self.bin_loca)):
             boot_stack = {}
             bin_mu = np.zeros(self.cpara.stack_range.size)
             bin_ci = np.zeros([self.cpara.stack_range.size, 2])
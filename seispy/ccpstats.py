@@ -0,0 +1,216 @@
+"""Incremental CCP stacking with sufficient statistics.
+
+For each (bin, stack depth) the count, sum and sum of squares of amplitudes are kept, as
+well as the contribution of every station, so that new stations can be added and updated
+stations replaced without touching the others. Optionally a reservoir sample of amplitudes
+is kept for bootstrap confidence intervals.
+"""
+import numpy as np
+from seispy.ccpoperator import CCPOperator, fingerprint
+
+
+STATS_VERSION = 1
+
+
+class CCPStats(object):
+    def __init__(self, bin_loca, stack_idx, radius, reservoir=0, seed=None):
+        """Sufficient statistics of CCP stacking in all bins.
+
+        :param bin_loca: Coordinates of bins in shape of ``(nbin, 2)``
+        :type bin_loca: numpy.ndarray
+        :param stack_idx: Index in ``depthrange`` of each stack depth
+        :type stack_idx: numpy.ndarray
+        :param radius: Radius in degree of bins at each stack depth
+        :type radius: numpy.ndarray
+        :param reservoir: Number of amplitudes kept in each (bin, depth) for bootstrap, defaults to 0
+        :type reservoir: int, optional
+        :param seed: Seed of the random generator of reservoir sampling, defaults to None
+        :type seed: int, optional
+        """
+        self.bin_loca = np.asarray(bin_loca, dtype=float)
+        self.stack_idx = np.asarray(stack_idx, dtype=int)
+        self.radius = np.broadcast_to(np.asarray(radius, dtype=float), self.stack_idx.shape).copy()
+        self.nbin = self.bin_loca.shape[0]
+        self.nstack = self.stack_idx.size
+        nrow = self.nbin * self.nstack
+        self.count = np.zeros(nrow)
+        self.sum = np.zeros(nrow)
+        self.sumsq = np.zeros(nrow)
+        self.ci = np.full((nrow, 2), np.nan)
+        self.stations = {}
+        self.reservoir = int(reservoir)
+        self.rng = np.random.default_rng(seed)
+        self.seen = np.zeros(nrow, dtype=np.int64)
+        self.res_val = np.full((nrow, self.reservoir), np.nan)
+        self.res_sta = np.full((nrow, self.reservoir), -1, dtype=np.int32)
+        self._next_id = 0
+
+    def match(self, bin_loca, stack_idx, radius):
+        """Whether the statistics were accumulated on the same bins, stack depths and radii
+
+        :rtype: bool
+        """
+        return (np.array_equal(np.asarray(stack_idx), self.stack_idx) and
+                np.asarray(bin_loca).shape == self.bin_loca.shape and
+                np.allclose(np.asarray(bin_loca), self.bin_loca) and
+                np.allclose(np.broadcast_to(radius, self.radius.shape), self.radius))
+
+    def remove(self, name):
+        """Remove the contribution of station ``name``
+
+        :return: Rows affected
+        :rtype: numpy.ndarray
+        """
+        led = self.stations.pop(name)
+        rows = led['rows']
+        self.count[rows] -= led['count']
+        self.sum[rows] -= led['sum']
+        self.sumsq[rows] -= led['sumsq']
+        self.seen[rows] -= led['count'].astype(np.int64)
+        if self.reservoir:
+            slot = self.res_sta[rows] == led['id']
+            self.res_val[rows] = np.where(slot, np.nan, self.res_val[rows])
+            self.res_sta[rows] = np.where(slot, -1, self.res_sta[rows])
+        return rows
+
+    def add(self, sta, sta_bins=None, field_lat='piercelat', field_lon='piercelon'):
+        """Add the contribution of a station in ``rfdep``. Non-finite amplitudes are not counted.
+
+        :param sta: A station in ``rfdep``
+        :type sta: dict
+        :param sta_bins: Candidate bin indices of this station, defaults to None for all bins
+        :type sta_bins: numpy.ndarray, optional
+        :return: Rows affected
+        :rtype: numpy.ndarray
+        """
+        op = CCPOperator.build([sta], self.bin_loca, self.stack_idx, self.radius,
+                               sta_bins=None if sta_bins is None else [sta_bins],
+                               field_lat=field_lat, field_lon=field_lon)
+        w = op.weights()
+        amp = op.amplitudes([sta]).astype(float)
+        # NaN beyond the end of RFs is skipped, so that removing the station restores the statistics
+        finite = np.isfinite(amp)
+        amp = np.where(finite, amp, 0.)
+        cnt = np.rint(w @ finite.astype(float)).astype(np.int64)
+        rows = np.where(cnt > 0)[0]
+        led = {'id': self._next_id, 'fingerprint': fingerprint(sta, field_lat, field_lon, amplitudes=True),
+               'rows': rows,
+               'count': cnt[rows].astype(float), 'sum': (w @ amp)[rows], 'sumsq': (w @ amp ** 2)[rows]}
+        self._next_id += 1
+        self.count[rows] += led['count']
+        self.sum[rows] += led['sum']
+        self.sumsq[rows] += led['sumsq']
+        if self.reservoir:
+            for r in rows:
+                cols = w.indices[w.indptr[r]:w.indptr[r+1]]
+                self._sample(r, amp[cols[finite[cols]]], led['id'])
+        else:
+            self.seen[rows] += cnt[rows]
+        self.stations[sta['station']] = led
+        return rows
+
+    def _sample(self, row, values, sta_id):
+        # reservoir sampling (algorithm R), slots freed by removed stations are filled first
+        for val in values:
+            self.seen[row] += 1
+            empty = np.where(self.res_sta[row] < 0)[0]
+            if empty.size:
+                slot = empty[0]
+            else:
+                slot = self.rng.integers(0, self.seen[row])
+                if slot >= self.reservoir:
+                    continue
+            self.res_val[row, slot] = val
+            self.res_sta[row, slot] = sta_id
+
+    def update(self, rfdep, sta_bins=None, field_lat='piercelat', field_lon='piercelon', logger=None):
+        """Merge stations in ``rfdep``. New stations are added, changed stations are replaced and
+        unchanged stations are skipped. Stations not in ``rfdep`` are kept.
+
+        :param rfdep: RF data in depth of new or updated stations
+        :type rfdep: list or numpy.ndarray of dict
+        :param sta_bins: Candidate bin indices of each station, defaults to None for all bins
+        :type sta_bins: list of numpy.ndarray, optional
+        :return: Rows affected
+        :rtype: numpy.ndarray
+        """
+        touched = [np.array([], dtype=int)]
+        for k, sta in enumerate(rfdep):
+            name = sta['station']
+            if name in self.stations:
+                if self.stations[name]['fingerprint'] == fingerprint(sta, field_lat, field_lon, amplitudes=True):
+                    continue
+                if logger is not None:
+                    logger.CCPlog.info('Replace station {}'.format(name))
+                touched.append(self.remove(name))
+            elif logger is not None:
+                logger.CCPlog.info('Add station {}'.format(name))
+            touched.append(self.add(sta, None if sta_bins is None else sta_bins[k], field_lat, field_lon))
+        return np.unique(np.concatenate(touched))
+
+    def stack(self, rows=None, boot_samples=None):
+        """Stacked amplitudes from the statistics. Confidence intervals of ``rows`` are
+        recomputed by bootstrapping the reservoir samples.
+
+        :param rows: Rows to recompute confidence intervals, defaults to None for all rows
+        :type rows: numpy.ndarray, optional
+        :param boot_samples: Number of bootstrap samples, defaults to None for no confidence intervals
+        :type boot_samples: int, optional
+        :return: Stacked amplitudes, confidence intervals, counts and standard deviations in shape of
+                 ``(nbin, nstack)``, ``(nbin, nstack, 2)``, ``(nbin, nstack)`` and ``(nbin, nstack)``
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        from seispy.ccp3d import boot_bin_stack
+        count = np.round(self.count)
+        valid = count > 1
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mu = np.where(valid, self.sum / count, np.nan)
+            std = np.where(valid, np.sqrt(np.maximum(self.sumsq / count - mu ** 2, 0)), np.nan)
+        rows = np.arange(count.size) if rows is None else np.asarray(rows, dtype=int)
+        self.ci[rows] = np.nan
+        if boot_samples is not None and self.reservoir:
+            for r in rows[valid[rows]]:
+                samples = self.res_val[r][self.res_sta[r] >= 0]
+                if samples.size > 1:
+                    self.ci[r] = boot_bin_stack(samples, n_samples=boot_samples)[1]
+        shape = (self.nbin, self.nstack)
+        return mu.reshape(shape), self.ci.reshape(shape + (2,)), count.reshape(shape), std.reshape(shape)
+
+    def save(self, path):
+        """Save the statistics to a ``.npz`` file"""
+        names = list(self.stations.keys())
+        leds = [self.stations[name] for name in names]
+        offsets = np.cumsum([0] + [led['rows'].size for led in leds])
+
+        def cat(key, dtype):
+            if not leds:
+                return np.array([], dtype=dtype)
+            return np.concatenate([led[key] for led in leds]).astype(dtype)
+
+        np.savez(path, version=STATS_VERSION, bin_loca=self.bin_loca, stack_idx=self.stack_idx,
+                 radius=self.radius, count=self.count, sum=self.sum, sumsq=self.sumsq, ci=self.ci,
+                 seen=self.seen, res_val=self.res_val, res_sta=self.res_sta, next_id=self._next_id,
+                 names=np.array(names, dtype=str), ids=np.array([led['id'] for led in leds], dtype=int),
+                 fingerprints=np.array([led['fingerprint'] for led in leds], dtype=str), offsets=offsets,
+                 led_rows=cat('rows', int), led_count=cat('count', float), led_sum=cat('sum', float),
+                 led_sumsq=cat('sumsq', float))
+
+    @classmethod
+    def load(cls, path, seed=None):
+        """Load statistics saved by :meth:`save`"""
+        with np.load(path, allow_pickle=False) as data:
+            if data['version'] > STATS_VERSION:
+                raise ValueError('Statistics version {} is newer than supported version {}'.format(
+                                 data['version'], STATS_VERSION))
+            stats = cls(data['bin_loca'], data['stack_idx'], data['radius'],
+                        reservoir=data['res_val'].shape[1], seed=seed)
+            for key in ('count', 'sum', 'sumsq', 'ci', 'seen', 'res_val', 'res_sta'):
+                setattr(stats, key, data[key])
+            stats._next_id = int(data['next_id'])
+            offsets = data['offsets']
+            for i, name in enumerate(data['names']):
+                sl = slice(offsets[i], offsets[i+1])
+                stats.stations[str(name)] = {'id': int(data['ids'][i]), 'fingerprint': str(data['fingerprints'][i]),
+                                             'rows': data['led_rows'][sl], 'count': data['led_count'][sl],
+                                             'sum': data['led_sum'][sl], 'sumsq': data['led_sumsq'][sl]}
+        return stats
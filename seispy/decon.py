@@ -7,7 +7,6 @@ from math import pi
 from numpy.fft import fft, ifft, ifftshift
 from scipy.signal import fftconvolve, correlate
 from scipy.linalg import solve_toeplitz
-import matplotlib.pyplot as plt
 
 
 def gaussFilter(dt, nft, f0):
@@ -248,6 +247,7 @@ class RFTrace(obspy.Trace):
 
 
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
     ldata = SACTrace.read('data/syn_S.L')
     qdata = SACTrace.read('data/syn_S.Q')
     l = ldata.data
@@ -45,6 +45,72 @@ def deg2km(degree):
     return degree * 111.19
 
 
+def delaz(lat1, lon1, lat2, lon2, dtype=None, out=None):
+    """Great circle arc distance, azimuth and back-azimuth between two sets of geographic
+    coordinates, following Bullen (pg. 154, 155) with the Earth flattening of 1/298.257.
+    Inputs are broadcast against each other.
+
+    :param lat1: Latitude of pt. 1 (station)
+    :type lat1: float or numpy.ndarray
+    :param lon1: Longitude of pt. 1
+    :type lon1: float or numpy.ndarray
+    :param lat2: Latitude of pt. 2 (event)
+    :type lat2: float or numpy.ndarray
+    :param lon2: Longitude of pt. 2
+    :type lon2: float or numpy.ndarray
+    :param dtype: Floating type of the computation, defaults to ``out[0].dtype`` or float64.
+                  In float32 ``delta`` has an error of about 1e-3 degree at short distances.
+    :type dtype: numpy.dtype, optional
+    :param out: Arrays to write ``delta``, ``az`` and ``baz`` into, defaults to None
+    :type out: tuple of numpy.ndarray, optional
+    :return: ``delta`` in degree, ``az`` from pt. 2 to pt. 1 and ``baz`` from pt. 1 to pt. 2 in degree
+    :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    if dtype is None:
+        dtype = np.float64 if out is None else out[0].dtype
+    lat1, lon1, lat2, lon2 = (np.asarray(v, dtype=dtype) for v in (lat1, lon1, lat2, lon2))
+    if out is None:
+        out = tuple(np.empty(np.broadcast_shapes(lat1.shape, lon1.shape, lat2.shape, lon2.shape),
+                             dtype=dtype) for _ in range(3))
+    delta, az, baz = out
+    fl = (1. - 1.0 / 298.257) ** 2
+    # geocentric colatitudes as defined by Richter (pg. 318)
+    scolat = np.pi / 2.0 - np.arctan(fl * np.tan(np.radians(lat1)))
+    ecolat = np.pi / 2.0 - np.arctan(fl * np.tan(np.radians(lat2)))
+    slon = np.radians(lon1)
+    elon = np.radians(lon2)
+    # a - k are as defined by Bullen (pg. 154, Sec 10.2) for pt. 1, aa - kk for pt. 2
+    c = np.cos(scolat)
+    k = -np.sin(scolat)
+    a = -k * np.cos(slon)
+    b = -k * np.sin(slon)
+    d = np.sin(slon)
+    e = -np.cos(slon)
+    cc = np.cos(ecolat)
+    kk = -np.sin(ecolat)
+    aa = -kk * np.cos(elon)
+    bb = -kk * np.sin(elon)
+    dd = np.sin(elon)
+    ee = -np.cos(elon)
+    # Bullen, Sec 10.2, eqn. 4
+    np.degrees(np.arccos(np.clip(a * aa + b * bb + c * cc, -1., 1.)), out=delta)
+    # Bullen, Sec 10.2, eqn 7 / eqn 8; pt. 1 is unprimed, so this is technically the baz
+    rhs1 = (aa - d) ** 2 + (bb - e) ** 2 + cc * cc - 2.
+    rhs2 = (aa + c * e) ** 2 + (bb - c * d) ** 2 + (cc - k) ** 2 - 2.
+    np.degrees(np.arctan2(rhs1, rhs2), out=baz)
+    # pt. 2 is unprimed, so this is technically the az
+    rhs1 = (a - dd) ** 2 + (b - ee) ** 2 + c * c - 2.
+    rhs2 = (a + cc * ee) ** 2 + (b - cc * dd) ** 2 + (c - kk) ** 2 - 2.
+    np.degrees(np.arctan2(rhs1, rhs2), out=az)
+    same = (lat1 == lat2) & (lon1 == lon2)
+    for ang in (baz, az):
+        ang[ang < 0.] += 360.
+        # Make sure 0.0 is always 0.0, not 360.
+        ang[(np.abs(ang - 360.) < .00001) | (np.abs(ang) < .00001) | same] = 0.
+    delta[same] = 0.
+    return delta, az, baz
+
+
 class distaz:
     """
     c Subroutine to calculate the Great Circle Arc distance
@@ -81,150 +147,9 @@ class distaz:
         self.stalon = lon1
         self.evtlat = lat2
         self.evtlon = lon2
-        '''
-        if (lat1 == lat2) and (lon1 == lon2):
-            self.delta = 0.0
-            self.az = 0.0
-            self.baz = 0.0
-            return
-        '''
-
-        rad = 2. * math.pi / 360.0
-        """
-        c
-        c scolat and ecolat are the geocentric colatitudes
-        c as defined by Richter (pg. 318)
-        c
-        c Earth Flattening of 1/298.257 take from Bott (pg. 3)
-        c
-        """
-        sph = 1.0 / 298.257
-
-        scolat = math.pi / 2.0 - np.arctan((1. - sph) * (1. - sph) * np.tan(lat1 * rad))
-        ecolat = math.pi / 2.0 - np.arctan((1. - sph) * (1. - sph) * np.tan(lat2 * rad))
-        slon = lon1 * rad
-        elon = lon2 * rad
-        """
-	c
-	c  a - e are as defined by Bullen (pg. 154, Sec 10.2)
-	c     These are defined for the pt. 1
-	c
-        """
-        a = np.sin(scolat) * np.cos(slon)
-        b = np.sin(scolat) * np.sin(slon)
-        c = np.cos(scolat)
-        d = np.sin(slon)
-        e = -np.cos(slon)
-        g = -c * e
-        h = c * d
-        k = -np.sin(scolat)
-        """
-	c
-	c  aa - ee are the same as a - e, except for pt. 2
-	c
-        """
-        aa = np.sin(ecolat) * np.cos(elon)
-        bb = np.sin(ecolat) * np.sin(elon)
-        cc = np.cos(ecolat)
-        dd = np.sin(elon)
-        ee = -np.cos(elon)
-        gg = -cc * ee
-        hh = cc * dd
-        kk = -np.sin(ecolat)
-        """
-	c
-	c  Bullen, Sec 10.2, eqn. 4
-	c
-        """
-        delrad = np.arccos(a * aa + b * bb + c * cc)
-        self.delta = delrad / rad
-        """
-	c
-	c  Bullen, Sec 10.2, eqn 7 / eqn 8
-	c
-	c    pt. 1 is unprimed, so this is technically the baz
-	c
-	c  Calculate baz this way to avoid quadrant problems
-	c
-        """
-        rhs1 = (aa - d) * (aa - d) + (bb - e) * (bb - e) + cc * cc - 2.
-        rhs2 = (aa - g) * (aa - g) + (bb - h) * (bb - h) + (cc - k) * (cc - k) - 2.
-        dbaz = np.arctan2(rhs1, rhs2)
-
-        dbaz_idx = np.where(dbaz < 0.0)[0]
-        if len(dbaz_idx) != 0:
-            if isinstance(dbaz, (int, float)):
-                dbaz += 2 * math.pi
-            else:
-                dbaz[dbaz_idx] += 2 * math.pi
-
-        self.baz = dbaz / rad
-        """
-	c
-	c  Bullen, Sec 10.2, eqn 7 / eqn 8
-	c
-	c    pt. 2 is unprimed, so this is technically the az
-	c
-	"""
-        rhs1 = (a - dd) * (a - dd) + (b - ee) * (b - ee) + c * c - 2.
-        rhs2 = (a - gg) * (a - gg) + (b - hh) * (b - hh) + (c - kk) * (c - kk) - 2.
-        daz = np.arctan2(rhs1, rhs2)
-
-        daz_idx = np.where(daz < 0.0)[0]
-        if len(daz_idx) != 0:
-            if isinstance(daz, (int, float)):
-                daz += 2 * math.pi
-            else:
-                daz[daz_idx] += 2 * math.pi
-
-        self.az = daz / rad
-        """
-	c
-	c   Make sure 0.0 is always 0.0, not 360.
-	c
-	"""
-        idx = np.where(np.abs(self.baz - 360.) < .00001)[0]
-        if len(idx) != 0:
-            if isinstance(self.baz, float):
-                self.baz = 0.0
-            else:
-                self.baz[idx] = 0.0
-        idx = np.where(np.abs(self.baz) < .00001)[0]
-        if len(idx) != 0:
-            if isinstance(self.baz, float):
-                self.baz = 0.0
-            else:
-                self.baz[idx] = 0.0
-
-        idx = np.where(np.abs(self.az - 360.) < .00001)[0]
-        if len(idx) != 0:
-            if isinstance(self.az, float):
-                self.az = 0.0
-            else:
-                self.az[idx] = 0.0
-        idx = np.where(np.abs(self.az) < .00001)[0]
-        if len(idx) != 0:
-            if isinstance(self.az, float):
-                self.az = 0.0
-            else:
-                self.az[idx] = 0.0
-        
-        la_idx = np.where(lat1 == lat2)[0]
-        lo_idx = np.where(lon1 == lon2)[0]
-        idx = np.intersect1d(la_idx, lo_idx)
-        if len(idx) != 0:
-            if isinstance(self.delta, float):
-                self.delta = 0.
-            else:
-                self.delta[idx] = 0.
-            if isinstance(self.az, float):
-                self.az = 0.
-            else:
-                self.az[idx] = 0.
-            if isinstance(self.baz, float):
-                self.baz = 0.
-            else:
-                self.baz[idx] = 0.
+        self.delta, self.az, self.baz = delaz(lat1, lon1, lat2, lon2)
+        if np.ndim(self.delta) == 0:
+            self.delta, self.az, self.baz = float(self.delta), float(self.az), float(self.baz)
 
     def getDelta(self):
         return self.delta
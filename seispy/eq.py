@@ -8,6 +8,8 @@ from seispy.decon import RFTrace
 from seispy.geo import snr, srad2skm, rotateSeisENtoTR, \
                        rssq, extrema
 from obspy.signal.trigger import recursive_sta_lta
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 
 
 def rotateZNE(st):
@@ -23,6 +25,63 @@ def rotateZNE(st):
         tr.stats.channel = tr.stats.channel[:-1] + component
 
 
+def _read_eq(pathname, datestr, suffix):
+    try:
+        return EQ(pathname, datestr, suffix)
+    except Exception as e:
+        return e
+
+
+class EQPrefetcher(object):
+    def __init__(self, pathname, datestrs, suffix='SAC', workers=0, window=8):
+        """Read 3-component SAC files of upcoming events on a bounded thread pool.
+
+        Iterating over the instance yields ``(datestr, eq)`` in the order of ``datestrs``.
+        If reading failed, ``eq`` is the raised exception instead of an :class:`EQ`,
+        so that the caller can drop the event. ``window`` only limits the events read ahead
+        of the caller. Events kept by the caller stay in memory, e.g., :func:`seispy.rf.match_eq`
+        keeps all of them, and memory is only bounded in the streaming mode :meth:`seispy.rf.RF.stream`.
+
+        :param pathname: Directory to SAC files
+        :type pathname: str
+        :param datestrs: date parts in filenames of events to read
+        :type datestrs: list
+        :param suffix: suffix for SAC files, defaults to 'SAC'
+        :type suffix: str, optional
+        :param workers: Number of reading threads, ``0`` for reading in the current thread, defaults to 0
+        :type workers: int, optional
+        :param window: Max number of events read ahead and held in memory, defaults to 8
+        :type window: int, optional
+        """
+        self.pathname = pathname
+        self.datestrs = list(datestrs)
+        self.suffix = suffix
+        self.workers = int(workers)
+        self.window = max(int(window), self.workers, 1)
+
+    def __len__(self):
+        return len(self.datestrs)
+
+    def __iter__(self):
+        if self.workers < 1:
+            for datestr in self.datestrs:
+                yield datestr, _read_eq(self.pathname, datestr, self.suffix)
+            return
+        remaining = iter(self.datestrs)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for datestr in remaining:
+                pending.append((datestr, executor.submit(_read_eq, self.pathname, datestr, self.suffix)))
+                if len(pending) >= self.window:
+                    break
+            while pending:
+                datestr, future = pending.popleft()
+                for next_datestr in remaining:
+                    pending.append((next_datestr, executor.submit(_read_eq, self.pathname, next_datestr, self.suffix)))
+                    break
+                yield datestr, future.result()
+
+
 class EQ(object):
     def __init__(self, pathname, datestr, suffix='SAC'):
         """Class for processing event data with 3 components, which read SAC files of ``pathname*datastr*suffix`` 
@@ -53,6 +112,36 @@ class EQ(object):
         self.inc_correction = 0
         self.set_comp()
     
+    @property
+    def st(self):
+        """3-component waveforms, loaded on first access when read from a project file"""
+        if self._st is None and self._st_loader is not None:
+            self._st = self._st_loader()
+            self._st_loader = None
+        return self._st
+
+    @st.setter
+    def st(self, value):
+        self._st = value
+        self._st_loader = None
+
+    def set_loader(self, loader):
+        """Defer reading waveforms until :attr:`st` is accessed
+
+        :param loader: Callable returning an ``obspy.Stream``
+        :type loader: callable
+        """
+        self._st = None
+        self._st_loader = loader
+
+    def __setstate__(self, state):
+        # projects pickled before waveforms became lazy store ``st`` directly
+        if 'st' in state:
+            state['_st'] = state.pop('st')
+        state.setdefault('_st', None)
+        state.setdefault('_st_loader', None)
+        self.__dict__.update(state)
+
     def readstream(self):
         self.st = obspy.read(self.filestr)
         self.rf = obspy.Stream()
@@ -142,27 +142,42 @@ def snr(x, y):
     return 10 * np.log10(spow / npow)
 
 
-def latlon_from(lat1, lon1, azimuth, gcarc_dist):
-    lat2 = asind((sind(lat1) * cosd(gcarc_dist)) + (cosd(lat1) * sind(gcarc_dist) * cosd(azimuth)))
-    if isinstance(gcarc_dist, np.ndarray):
-        lon2 = np.zeros_like(lat2)
-        for n in range(len(gcarc_dist)):
-            if cosd(gcarc_dist[n]) >= (cosd(90 - lat1) * cosd(90 - lat2[n])):
-                lon2[n] = lon1 + asind(sind(gcarc_dist[n]) * sind(azimuth) / cosd(lat2[n]))
-            else:
-                lon2[n] = lon1 + asind(sind(gcarc_dist[n]) * sind(azimuth) / cosd(lat2[n])) + 180
-    elif isinstance(azimuth, np.ndarray):
-        lon2 = np.zeros_like(lat2)
-        for n in range(len(azimuth)):
-            if cosd(gcarc_dist) >= (cosd(90 - lat1) * cosd(90 - lat2[n])):
-                lon2[n] = lon1 + asind(sind(gcarc_dist) * sind(azimuth[n]) / cosd(lat2[n]))
-            else:
-                lon2[n] = lon1 + asind(sind(gcarc_dist) * sind(azimuth[n]) / cosd(lat2[n])) + 180
-    else:
-        if (cosd(gcarc_dist) >= (cosd(90 - lat1) * cosd(90 - lat2))):
-            lon2 = lon1 + asind(sind(gcarc_dist) * sind(azimuth) / cosd(lat2))
-        else:
-            lon2 = lon1 + asind(sind(gcarc_dist) * sind(azimuth) / cosd(lat2)) + 180
+def latlon_from(lat1, lon1, azimuth, gcarc_dist, dtype=None, out=None):
+    """Destination point from a start point, azimuth and great circle arc distance on a sphere.
+    Inputs are broadcast against each other.
+
+    :param lat1: Latitude of the start point
+    :type lat1: float or numpy.ndarray
+    :param lon1: Longitude of the start point
+    :type lon1: float or numpy.ndarray
+    :param azimuth: Azimuth from the start point in degree
+    :type azimuth: float or numpy.ndarray
+    :param gcarc_dist: Great circle arc distance in degree
+    :type gcarc_dist: float or numpy.ndarray
+    :param dtype: Floating type of the computation, defaults to ``out[0].dtype`` or float64
+    :type dtype: numpy.dtype, optional
+    :param out: Arrays to write ``lat2`` and ``lon2`` into, defaults to None
+    :type out: tuple of numpy.ndarray, optional
+    :return: Latitude and longitude of the destination point
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    if dtype is None:
+        dtype = np.float64 if out is None else out[0].dtype
+    lat1, lon1, azimuth, gcarc_dist = (np.asarray(v, dtype=dtype) for v in (lat1, lon1, azimuth, gcarc_dist))
+    if out is None:
+        shape = np.broadcast_shapes(lat1.shape, lon1.shape, azimuth.shape, gcarc_dist.shape)
+        out = (np.empty(shape, dtype=dtype), np.empty(shape, dtype=dtype))
+    lat2, lon2 = out
+    sin_lat1 = sind(lat1)
+    sin_dist = sind(gcarc_dist)
+    cos_dist = cosd(gcarc_dist)
+    sin_lat2 = sin_lat1 * cos_dist + cosd(lat1) * sin_dist * cosd(azimuth)
+    np.degrees(np.arcsin(sin_lat2, out=lat2), out=lat2)
+    np.degrees(np.arcsin(np.clip(sin_dist * sind(azimuth) / cosd(lat2), -1., 1.)), out=lon2)
+    lon2 += lon1
+    lon2[cos_dist < sin_lat1 * sin_lat2] += 180
+    if lat2.ndim == 0:
+        return lat2[()], lon2[()]
     return lat2, lon2
 
 
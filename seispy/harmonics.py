@@ -1,11 +1,17 @@
 import numpy as np
 from scipy.sparse.linalg import lsqr
 from seispy.geo import cosd, sind
-import matplotlib.pyplot as plt
 from obspy.io.sac import SACTrace
 from os.path import join
+from scipy.linalg import qr, solve_triangular
+from scipy.stats import norm
 
 
+def _qr_solve(g, b):
+    """Least-squares solutions of ``g @ x = b`` for all columns of ``b`` with one QR factorization"""
+    q, r = qr(g, mode='economic')
+    return solve_triangular(r, q.T @ b)
+
 
 class Harmonics():
     def __init__(self, rfsta, tmin=-5, tmax=10) -> None:
@@ -33,22 +39,103 @@ class Harmonics():
         self.nsamp = ne - nb + 1
         self.time_axis = np.linspace(self.tmin, self.tmax, self.nsamp)
 
-    def harmo_trans(self):
+    def design_matrix(self):
+        """Design matrices of the harmonic and unmodeled components with R rows first and then T rows
+
+        :return: Matrices in shape of ``(2*ev_num, 5)``
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        baz = np.asarray(self.rfsta.bazi, dtype=float)
+        ones = np.ones_like(baz)
+        rows_r = np.column_stack((ones, cosd(baz), sind(baz), cosd(baz*2), sind(baz*2)))
+        harmonic = np.vstack((rows_r, np.column_stack((0*ones, cosd(baz+90), sind(baz+90),
+                                                       cosd(baz*2+90), sind(baz*2+90)))))
+        unmodel = np.vstack((rows_r, np.column_stack((0*ones, cosd(baz-90), sind(baz-90),
+                                                      cosd(baz*2-90), sind(baz*2-90)))))
+        return harmonic, unmodel
+
+    def harmo_trans(self, method='qr'):
+        """Harmonic decomposition of all time samples
+
+        :param method: ``'qr'`` to factorize each design matrix once and solve all samples with
+                       one matrix product, or ``'lsqr'`` to solve sample by sample, defaults to 'qr'
+        :type method: str, optional
+        :return: Residual norms of harmonic and unmodeled fittings of each sample
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
         self.traces = np.vstack((self.datar, self.datat))
-        harmonic = np.zeros((self.rfsta.ev_num*2, 5))
-        unmodel = np.zeros((self.rfsta.ev_num*2, 5))
-        self.harmonic_trans = np.zeros((5, self.nsamp))
-        self.unmodel_trans = np.zeros((5, self.nsamp))
-        for i, baz in enumerate(self.rfsta.bazi):
-            harmonic[i] = np.array([1, cosd(baz), sind(baz), cosd(baz*2), sind(baz*2)])
-            harmonic[i+self.rfsta.ev_num] = np.array([0, cosd(baz+90), sind(baz+90), cosd(baz*2+90), sind(baz*2+90)])
-            unmodel[i] = np.array([1, cosd(baz), sind(baz), cosd(baz*2), sind(baz*2)])
-            unmodel[i+self.rfsta.ev_num] = np.array([0, cosd(baz-90), sind(baz-90), cosd(baz*2-90), sind(baz*2-90)])
-        for i in range(self.nsamp):
-            b = self.traces[:, i]
-            self.harmonic_trans[:, i] = lsqr(harmonic, b, damp=0)[0]
-            self.unmodel_trans[:, i] = lsqr(unmodel, b, damp=0)[0]
-    
+        harmonic, unmodel = self.design_matrix()
+        if method == 'qr':
+            self.harmonic_trans = _qr_solve(harmonic, self.traces)
+            self.unmodel_trans = _qr_solve(unmodel, self.traces)
+        elif method == 'lsqr':
+            self.harmonic_trans = np.zeros((5, self.nsamp))
+            self.unmodel_trans = np.zeros((5, self.nsamp))
+            for i in range(self.nsamp):
+                b = self.traces[:, i]
+                self.harmonic_trans[:, i] = lsqr(harmonic, b, damp=0)[0]
+                self.unmodel_trans[:, i] = lsqr(unmodel, b, damp=0)[0]
+        else:
+            raise ValueError('method must be in \'qr\' or \'lsqr\'')
+        self.harmonic_res = np.linalg.norm(harmonic @ self.harmonic_trans - self.traces, axis=0)
+        self.unmodel_res = np.linalg.norm(unmodel @ self.unmodel_trans - self.traces, axis=0)
+        return self.harmonic_res, self.unmodel_res
+
+    def _normal_equations(self, g):
+        # per-event contributions of R and T rows to G^T G and G^T d
+        ev_num = self.rfsta.ev_num
+        g_r, g_t = g[:ev_num], g[ev_num:]
+        gtg = np.einsum('ei,ej->eij', g_r, g_r) + np.einsum('ei,ej->eij', g_t, g_t)
+        gtd = np.einsum('ei,et->eit', g_r, self.datar) + np.einsum('ei,et->eit', g_t, self.datat)
+        return gtg, gtd
+
+    def resample_ci(self, n_boot=500, method='bootstrap', ci=95, seed=None):
+        """Uncertainty of harmonic and unmodeled components by resampling events.
+
+        A resample only changes the weight of each event in the normal equations, so all
+        resamples are solved together as a batch of 5x5 systems.
+
+        :param n_boot: Number of bootstrap resamples, ignored for jackknife, defaults to 500
+        :type n_boot: int, optional
+        :param method: ``'bootstrap'`` or ``'jackknife'``, defaults to 'bootstrap'
+        :type method: str, optional
+        :param ci: Confidence level in percent, defaults to 95
+        :type ci: float, optional
+        :param seed: Seed of the random generator for bootstrap, defaults to None
+        :type seed: int, optional
+        :return: Lower and upper bounds of harmonic and unmodeled components in shape of ``(2, 5, nsamp)``
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        ev_num = self.rfsta.ev_num
+        if method == 'bootstrap':
+            rng = np.random.default_rng(seed)
+            idx = rng.integers(0, ev_num, size=(n_boot, ev_num))
+            weight = np.zeros((n_boot, ev_num))
+            np.add.at(weight, (np.arange(n_boot)[:, np.newaxis], idx), 1)
+        elif method == 'jackknife':
+            weight = 1 - np.eye(ev_num)
+        else:
+            raise ValueError('method must be in \'bootstrap\' or \'jackknife\'')
+        bands = []
+        for g in self.design_matrix():
+            gtg, gtd = self._normal_equations(g)
+            lhs = np.einsum('be,eij->bij', weight, gtg)
+            rhs = np.einsum('be,eit->bit', weight, gtd)
+            try:
+                sol = np.linalg.solve(lhs, rhs)
+            except np.linalg.LinAlgError:
+                # resamples with too few distinct back-azimuths are rank deficient
+                sol = np.linalg.pinv(lhs) @ rhs
+            if method == 'bootstrap':
+                bands.append(np.percentile(sol, [(100 - ci) / 2, (100 + ci) / 2], axis=0))
+            else:
+                mean = np.mean(sol, axis=0)
+                se = np.sqrt((ev_num - 1) / ev_num * np.sum((sol - mean) ** 2, axis=0))
+                z = norm.ppf((100 + ci) / 200)
+                bands.append(np.array([mean - z * se, mean + z * se]))
+        self.harmonic_ci, self.unmodel_ci = bands
+        return self.harmonic_ci, self.unmodel_ci
+
     def write_constant(self, out_sac_path='./'):
         """ Write constant component to SAC file.
 
@@ -73,11 +160,13 @@ class Harmonics():
         :param enf: Amplification factor, defaults to 2.0
         :type enf: float, optional
         """
+        import matplotlib.pyplot as plt
         plt.style.use("bmh")
         plt.rc('grid', color='white', linestyle='-', linewidth=0.7)
         plt.rcParams["axes.grid.axis"] = "x"
         fig, axes = plt.subplots(1, 2, figsize=(10, 5), sharey=True)
         mtx = [self.harmonic_trans, self.unmodel_trans]
+        bands = [getattr(self, 'harmonic_ci', None), getattr(self, 'unmodel_ci', None)]
         bound = np.zeros(self.nsamp)
         titles = ['Dipping/Anisotropic', 'Unmodeled']
         for iax, ax in enumerate(axes):
@@ -87,6 +176,9 @@ class Harmonics():
                                 alpha=0.7)
                 ax.fill_between(self.time_axis, data, bound + i+1, where=data < i+1, facecolor='#1193F4',
                                 alpha=0.7)
+                if bands[iax] is not None:
+                    for band in bands[iax]:
+                        ax.plot(self.time_axis, band[5-i-1] * enf + (i + 1), color='gray', lw=0.6, ls='--')
             ax.plot([0, 0], [0, 6], color='k', lw=1.2)
             ax.set_xlim([-1, self.tmax])
             ax.set_xlabel('Time after P (s)')
@@ -1,7 +1,6 @@
 import numpy as np
 import re
 from obspy.io.sac.sactrace import SACTrace
-import matplotlib.pyplot as plt
 from os.path import dirname, join, basename
 from seispy.rfcorrect import SACStation
 from seispy.hkpara import hkpara
@@ -100,7 +99,238 @@ def hkstack(seis, t0, dt, p, h, kappa, vp=6.3, weight=(0.7, 0.2, 0.1)):
     return stack, stackvar, Normed_stack, allstackvar
 
 
-def plot(stack, allstack, h, kappa, besth, bestk, cvalue, cmap=load_cyan_map(), title=None, path=None):
+def _hk_points(seis, ti0, dt, p, h, kappa, vp=6.3, weight=(0.7, 0.2, 0.1)):
+    """Stack RFs at points of (H, kappa) with the same amplitudes as :meth:`hkstack`.
+    Statistics are accumulated over RFs with running sums.
+
+    :return: Stacks of 3 phases and their variances in shape of ``(h.size, 3)``,
+             weighted stack and its variance over RFs in shape of ``(h.size,)``
+    """
+    nrf = len(p)
+    am_cor = 151.5478 * p ** 2 + 3.2896 * p + 0.2618
+    vs = vp / kappa
+    stack = np.zeros((h.size, 3))
+    stack2 = np.zeros((h.size, 3))
+    allsum = np.zeros(h.size)
+    allsum2 = np.zeros(h.size)
+    tstack = np.zeros((h.size, 3))
+    for i in range(nrf):
+        eta_p = vslow(vp, p[i])
+        eta_s = vslow(vs, p[i])
+        tstack[:, 0] = am_cor[i] * seis[i, time2idx((eta_s - eta_p) * h, ti0, dt)]
+        tstack[:, 1] = am_cor[i] * seis[i, time2idx((eta_s + eta_p) * h, ti0, dt)]
+        tstack[:, 2] = -am_cor[i] * seis[i, time2idx(2 * eta_s * h, ti0, dt)]
+        stack += tstack
+        stack2 += tstack ** 2
+        amp = tstack @ np.asarray(weight)
+        allsum += amp
+        allsum2 += amp ** 2
+    stack = stack / nrf
+    stackvar = (stack2 - stack ** 2) / (nrf ** 2)
+    allstack = allsum / nrf
+    allstackvar = np.maximum(allsum2 / nrf - allstack ** 2, 0)
+    return stack, stackvar, allstack, allstackvar
+
+
+def _lattice(n, stride):
+    return np.union1d(np.arange(0, n, stride), [n - 1])
+
+
+def _nearest(lattice, idx):
+    """Nearest points in ``lattice`` of indices ``idx``"""
+    pos = np.clip(np.searchsorted(lattice, idx), 1, lattice.size - 1)
+    return np.where(idx - lattice[pos - 1] <= lattice[pos] - idx, lattice[pos - 1], lattice[pos])
+
+
+def _dilate(mask):
+    out = mask.copy()
+    out[1:] |= mask[:-1]
+    out[:-1] |= mask[1:]
+    out[:, 1:] |= out[:, :-1].copy()
+    out[:, :-1] |= out[:, 1:].copy()
+    return out
+
+
+def _extrema_seeds(vals, ntop):
+    """Indices of the ``ntop`` largest local maxima in a 2-D array with NaN of unevaluated points"""
+    pad = np.pad(np.where(np.isnan(vals), -np.inf, vals), 1, constant_values=-np.inf)
+    center = pad[1:-1, 1:-1]
+    is_max = np.isfinite(center)
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            if di or dj:
+                is_max &= center >= pad[1+di:pad.shape[0]-1+di, 1+dj:pad.shape[1]-1+dj]
+    idx = np.flatnonzero(is_max)
+    idx = idx[np.argsort(center.ravel()[idx])[::-1][:ntop]]
+    return np.unravel_index(idx, vals.shape)
+
+
+def hkstack_adaptive(seis, t0, dt, p, h, kappa, vp=6.3, weight=(0.7, 0.2, 0.1), coarse=16, ntop=3, margin=0.05,
+                     full_output=False):
+    """H-kappa stacking with coarse-to-fine search on the grid of ``h`` and ``kappa``.
+
+    The grid is first stacked with a stride of a power of 2 giving about ``coarse`` points
+    along the shorter axis. The stride is then halved around the ``ntop`` largest local
+    maxima and minima and the points above the confidence level of :meth:`ci` minus ``margin``,
+    until the resolution of the grid is reached. The region above this level is finally
+    grown point by point and other points take the value of the nearest point of the coarse
+    grid, so the result is an approximation of :meth:`hkstack`:
+
+    - The stack is normalized with the minimum of evaluated points, which is the minimum of
+      the full grid only if it lies around one of the refined local minima.
+    - The confidence level is estimated from the standard deviation of the coarse grid, a
+      uniform sample of the full grid, instead of the full grid, so the errors of H and kappa
+      from :meth:`ci` with it differ slightly from those of :meth:`hkstack`.
+
+    The maximum and the stack above the confidence level are the same as :meth:`hkstack`
+    when the minimum is found.
+
+    :param coarse: Number of points of the coarse grid along the shorter axis, defaults to 16
+    :type coarse: int, optional
+    :param ntop: Number of local extrema refined at each level, defaults to 3
+    :type ntop: int, optional
+    :param margin: Margin of normalized amplitude below the confidence level, defaults to 0.05
+    :type margin: float, optional
+    :param full_output: Whether also return the confidence level for ``cvalue`` of :meth:`ci`, defaults to False
+    :type full_output: bool, optional
+    :return: ``stack``, ``stackvar``, ``Normed_stack`` and ``allstackvar`` as :meth:`hkstack`
+    """
+    nh, nk, nrf = len(h), len(kappa), len(p)
+    if seis.shape[0] != nrf:
+        seis = seis.T
+        if seis.shape[0] != nrf:
+            raise IndexError('SEIS array dimensions should be (nt x nrf)')
+    ti0 = round(t0 / dt)
+    stack = np.full((nk, nh, 3), np.nan)
+    stackvar = np.full((nk, nh, 3), np.nan)
+    allstack = np.full((nk, nh), np.nan)
+    allstackvar = np.full((nk, nh), np.nan)
+
+    def evaluate(mask):
+        ki, hi = np.nonzero(mask & np.isnan(allstack))
+        if ki.size:
+            stack[ki, hi], stackvar[ki, hi], allstack[ki, hi], allstackvar[ki, hi] = _hk_points(
+                seis, ti0, dt, p, h[hi], kappa[ki], vp=vp, weight=weight)
+        return ki.size
+
+    def normed(vals):
+        return (vals - np.nanmin(allstack)) / (np.nanmax(allstack) - np.nanmin(allstack))
+
+    stride = 2 ** int(np.log2(max(1, min(nh, nk) // coarse)))
+    k0, h0 = _lattice(nk, stride), _lattice(nh, stride)
+    mask = np.zeros((nk, nh), dtype=bool)
+    mask[np.ix_(k0, h0)] = True
+    evaluate(mask)
+    level = 1 - np.std(normed(allstack[np.ix_(k0, h0)])) / np.sqrt(nrf) - margin
+    while stride > 1:
+        ki, hi = _lattice(nk, stride), _lattice(nh, stride)
+        sub = allstack[np.ix_(ki, hi)]
+        seeds = [_extrema_seeds(sub, ntop), _extrema_seeds(-sub, ntop), np.nonzero(normed(sub) >= level)]
+        region = np.zeros((nk, nh), dtype=bool)
+        for si, sj in seeds:
+            for a, b in zip(ki[si], hi[sj]):
+                region[max(a - stride, 0):a + stride + 1, max(b - stride, 0):b + stride + 1] = True
+        stride //= 2
+        mask = np.zeros((nk, nh), dtype=bool)
+        mask[np.ix_(_lattice(nk, stride), _lattice(nh, stride))] = True
+        evaluate(mask & region)
+    # grow the region above the level until its boundary is evaluated
+    while evaluate(_dilate(normed(np.nan_to_num(allstack, nan=np.nanmin(allstack))) >= level)):
+        pass
+    miss = np.isnan(allstack)
+    if miss.any():
+        ki, hi = np.nonzero(miss)
+        ki0, hi0 = _nearest(k0, ki), _nearest(h0, hi)
+        for arr in (stack, stackvar, allstack, allstackvar):
+            arr[ki, hi] = arr[ki0, hi0]
+    Normed_stack = allstack - np.min(allstack)
+    Normed_stack = Normed_stack / np.max(Normed_stack)
+    if full_output:
+        cvalue = 1 - np.std(Normed_stack[np.ix_(k0, h0)]) / np.sqrt(nrf)
+        return stack, stackvar, Normed_stack, allstackvar, cvalue
+    return stack, stackvar, Normed_stack, allstackvar
+
+
+def _hkv_slice(seis, ti0, dt, p, h, kappa, vp, weight, chunk):
+    """Mean and variance over RFs of the weighted stack for one ``vp``. RFs are processed
+    ``chunk`` at a time and the statistics of chunks are merged with running sums.
+    """
+    nrf = len(p)
+    am_cor = 151.5478 * p ** 2 + 3.2896 * p + 0.2618
+    vs = vp / kappa
+    mean = np.zeros((kappa.size, h.size))
+    m2 = np.zeros((kappa.size, h.size))
+    count = 0
+    for start in range(0, nrf, chunk):
+        sl = slice(start, min(start + chunk, nrf))
+        pc = p[sl]
+        rows = np.arange(sl.start, sl.stop)[:, np.newaxis, np.newaxis]
+        eta_p = vslow(vp, pc)[:, np.newaxis, np.newaxis]
+        eta_s = vslow(vs[np.newaxis, :], pc[:, np.newaxis])[:, :, np.newaxis]
+        amp = weight[0] * seis[rows, (ti0 + np.around((eta_s - eta_p) * h / dt)).astype(int)]
+        amp += weight[1] * seis[rows, (ti0 + np.around((eta_s + eta_p) * h / dt)).astype(int)]
+        amp -= weight[2] * seis[rows, (ti0 + np.around(2 * eta_s * h / dt)).astype(int)]
+        amp *= am_cor[sl, np.newaxis, np.newaxis]
+        # merge statistics of the chunk (Chan et al., 1979)
+        n = amp.shape[0]
+        cmean = amp.mean(axis=0)
+        delta = cmean - mean
+        total = count + n
+        mean += delta * n / total
+        m2 += ((amp - cmean) ** 2).sum(axis=0) + delta ** 2 * count * n / total
+        count = total
+    return mean, m2 / count
+
+
+def hkvstack(seis, t0, dt, p, h, kappa, vp, weight=(0.7, 0.2, 0.1), chunk=16, workers=1):
+    """Joint stacking of H, kappa and Vp.
+
+    Each slice of ``vp`` is stacked separately with ``chunk`` RFs at a time, so that the memory
+    is bounded by ``chunk * kappa.size * h.size`` instead of the cube of all RFs in :meth:`hkstack`.
+    The variance over RFs is accumulated with running sums.
+
+    :param vp: 1-D array of Vp
+    :type vp: numpy.ndarray
+    :param chunk: Number of RFs stacked at a time, defaults to 16
+    :type chunk: int, optional
+    :param workers: Number of threads over slices of ``vp``, defaults to 1
+    :type workers: int, optional
+    :return: ``Normed_stack`` normalized over the whole volume and ``allstackvar`` in shape of
+             ``(vp.size, kappa.size, h.size)``, best ``(vp, kappa, h)``, and maxima of
+             ``Normed_stack`` along ``vp``, ``kappa`` and ``h``
+    :rtype: tuple
+    """
+    nrf = len(p)
+    vp = np.atleast_1d(vp)
+    if seis.shape[0] != nrf:
+        seis = seis.T
+        if seis.shape[0] != nrf:
+            raise IndexError('SEIS array dimensions should be (nt x nrf)')
+    ti0 = round(t0 / dt)
+    allstack = np.zeros((vp.size, len(kappa), len(h)))
+    allstackvar = np.zeros((vp.size, len(kappa), len(h)))
+
+    def stack_slice(i):
+        allstack[i], allstackvar[i] = _hkv_slice(seis, ti0, dt, p, h, kappa, vp[i], weight, chunk)
+
+    if workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(stack_slice, range(vp.size)))
+    else:
+        for i in range(vp.size):
+            stack_slice(i)
+    Normed_stack = allstack - np.min(allstack)
+    Normed_stack = Normed_stack / np.max(Normed_stack)
+    iv, ik, ih = np.unravel_index(Normed_stack.argmax(), Normed_stack.shape)
+    marginals = (Normed_stack.max(axis=(1, 2)), Normed_stack.max(axis=(0, 2)), Normed_stack.max(axis=(0, 1)))
+    return Normed_stack, allstackvar, (vp[iv], kappa[ik], h[ih]), marginals
+
+
+def plot(stack, allstack, h, kappa, besth, bestk, cvalue, cmap=None, title=None, path=None):
+    import matplotlib.pyplot as plt
+    if cmap is None:
+        cmap = load_cyan_map()
     f, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(10, 8), sharex='col', sharey='row')
     xlim = (h[0], h[-1])
     ylim = (kappa[0], kappa[-1])
@@ -132,7 +362,7 @@ def plot(stack, allstack, h, kappa, besth, bestk, cvalue, cmap=load_cyan_map(),
         f.savefig(path, format='png', dpi=400, bbox_inches='tight')
 
 
-def ci(allstack, h, kappa, ev_num):
+def ci(allstack, h, kappa, ev_num, cvalue=None):
     """
     Search best H and kappa from stacked matrix.
     Calculate error for H and kappa
@@ -140,15 +370,22 @@ def ci(allstack, h, kappa, ev_num):
     :param h: 1-D array of H
     :param kappa: 1-D array of kappa
     :param ev_num: event number
+    :param cvalue: confidence level, defaults to None to calculate from ``allstack``
     :return:
     """
+    import matplotlib.pyplot as plt
+    from matplotlib.path import Path
     [i, j] = np.unravel_index(allstack.argmax(), allstack.shape)
     bestk = kappa[i]
     besth = h[j]
 
-    cvalue = 1 - np.std(allstack.reshape(allstack.size)) / np.sqrt(ev_num)
+    if cvalue is None:
+        cvalue = 1 - np.std(allstack.reshape(allstack.size)) / np.sqrt(ev_num)
     cs = plt.contour(h, kappa, allstack, [cvalue])
-    cs_path = cs.collections[0].get_paths()[0].vertices
+    # the contour enclosing the maximum
+    segs = cs.allsegs[0]
+    enclosing = [seg for seg in segs if seg.shape[0] > 2 and Path(seg).contains_point((besth, bestk))]
+    cs_path = enclosing[0] if enclosing else segs[0]
     maxhsig = (np.max(cs_path[:, 0]) - np.min(cs_path[:, 0])) / 2
     maxksig = (np.max(cs_path[:, 1]) - np.min(cs_path[:, 1])) / 2
     plt.close()
@@ -167,16 +404,34 @@ def print_result(besth, bestk, maxhsig, maxksig, print_comment=True):
 def hksta(hpara, isplot=False, isdisplay=False):
     station = basename(hpara.rfpath)
     stadata = SACStation(hpara.rfpath, only_r=True)
-    stack, _, allstack, _ = hkstack(stadata.datar, stadata.shift, stadata.sampling, srad2skm(stadata.rayp),
-                                    hpara.hrange, hpara.krange, vp=hpara.vp, weight=hpara.weight)
-    besth, bestk, cvalue, maxhsig, maxksig = ci(allstack, hpara.hrange, hpara.krange, stadata.ev_num)
+    vp = hpara.vp
+    if hpara.vprange is not None:
+        _, _, (vp, _, _), _ = hkvstack(stadata.datar, stadata.shift, stadata.sampling, srad2skm(stadata.rayp),
+                                       hpara.hrange, hpara.krange, hpara.vprange, weight=hpara.weight,
+                                       workers=hpara.workers)
+    if hpara.adaptive:
+        stack, _, allstack, _, cvalue = hkstack_adaptive(
+            stadata.datar, stadata.shift, stadata.sampling, srad2skm(stadata.rayp),
+            hpara.hrange, hpara.krange, vp=vp, weight=hpara.weight, full_output=True)
+    else:
+        stack, _, allstack, _ = hkstack(stadata.datar, stadata.shift, stadata.sampling, srad2skm(stadata.rayp),
+                                        hpara.hrange, hpara.krange, vp=vp, weight=hpara.weight)
+        cvalue = None
+    besth, bestk, cvalue, maxhsig, maxksig = ci(allstack, hpara.hrange, hpara.krange, stadata.ev_num, cvalue=cvalue)
+    line = '{}\t{:.3f}\t{:.3f}\t{:.1f}\t{:.2f}\t{:.2f}\t{:.3f}'.format(station, stadata.stla, stadata.stlo,
+                                                                       besth, maxhsig, bestk, maxksig)
+    if hpara.vprange is not None:
+        line += '\t{:.2f}'.format(vp)
     with open(hpara.hklist, 'a') as f:
-        f.write('{}\t{:.3f}\t{:.3f}\t{:.1f}\t{:.2f}\t{:.2f}\t{:.3f}\n'.format(station, stadata.stla, stadata.stlo,
-                                                                              besth, maxhsig, bestk, maxksig))
+        f.write(line + '\n')
     title = '{}\nMoho depth = ${:.1f}\pm{:.2f}$ km\n$V_P/V_S$ = ${:.2f}\pm{:.3f}$'.format(station, besth,
                                                                                      maxhsig, bestk, maxksig)
+    if hpara.vprange is not None:
+        title += '\n$V_P$ = {:.2f} km/s'.format(vp)
     if isdisplay:
         print_result(besth, bestk, maxhsig, maxksig, print_comment=True)
+        if hpara.vprange is not None:
+            print('Vp = {:.2f}'.format(vp))
     if isplot:
         img_path = join(hpara.hkpath, station+'_Hk.png')
         plot(stack, allstack, hpara.hrange, hpara.krange, besth, bestk, cvalue, title=title, path=img_path)
@@ -193,8 +448,12 @@ def hk():
     # parser.add_argument('-K', help='Range for searching best K: <kmin>/<kmax>', type=str, default='')
     parser.add_argument('-v', help='Display results to standard output',
                         dest='isdisplay', action='store_true')
+    parser.add_argument('-a', help='Search with coarse-to-fine adaptive grids',
+                        dest='isadaptive', action='store_true')
     arg = parser.parse_args()
     hpara = hkpara(arg.cfg_file)
+    if arg.isadaptive:
+        hpara.adaptive = True
     # if arg.station != '':
     #     hpara.rfpath = arg.station
     # if arg.H != '':
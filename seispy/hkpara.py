@@ -13,6 +13,9 @@ class HKPara(object):
         self.krange = np.arange(1.6, 1.9, 0.01)
         self.vp = 6.3
         self.weight = (0.7, 0.2, 0.1)
+        self.adaptive = False
+        self.vprange = None
+        self.workers = 1
 
     @property
     def hrange(self):
@@ -54,12 +57,21 @@ def hkpara(cfg_file):
     hmax = cf.getfloat('hk', 'hmax')
     kmin = cf.getfloat('hk', 'kmin')
     kmax = cf.getfloat('hk', 'kmax')
-    hpara.hrange = np.arange(hmin, hmax, 0.1)
-    hpara.krange = np.arange(kmin, kmax, 0.01)
+    hstep = cf.getfloat('hk', 'hstep') if cf.has_option('hk', 'hstep') else 0.1
+    kstep = cf.getfloat('hk', 'kstep') if cf.has_option('hk', 'kstep') else 0.01
+    hpara.hrange = np.arange(hmin, hmax, hstep)
+    hpara.krange = np.arange(kmin, kmax, kstep)
+    if cf.has_option('hk', 'adaptive'):
+        hpara.adaptive = cf.getboolean('hk', 'adaptive')
 
     vp = cf.get('hk', 'vp')
     if vp != '':
         hpara.vp = float(vp)
+    if cf.has_option('hk', 'vpmin') and cf.has_option('hk', 'vpmax'):
+        vpstep = cf.getfloat('hk', 'vpstep') if cf.has_option('hk', 'vpstep') else 0.05
+        hpara.vprange = np.arange(cf.getfloat('hk', 'vpmin'), cf.getfloat('hk', 'vpmax'), vpstep)
+    if cf.has_option('hk', 'workers'):
+        hpara.workers = cf.getint('hk', 'workers')
 
     w1 = cf.getfloat('hk', 'weight1')
     w2 = cf.getfloat('hk', 'weight2')
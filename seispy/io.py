@@ -2,7 +2,6 @@ import pandas as pd
 from obspy import UTCDateTime
 import numpy as np
 import argparse
-from obspy.clients.fdsn import Client
 # from netCDF4 import Dataset
 import sys
 
@@ -26,6 +25,7 @@ def wsfetch(server, starttime=None, endtime=None, minlatitude=None,
         raise TypeError('server name should be \'str\' type')
     locs = locals()
     locs.pop('server')
+    from obspy.clients.fdsn import Client
     client = Client(server)
     cat = client.get_events(**locs)
     cat_df = _cat2df(cat)
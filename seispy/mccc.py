@@ -1,39 +1,115 @@
 import numpy as np
+from scipy.fft import rfft, irfft
+from scipy.sparse import coo_matrix, vstack
+from scipy.sparse.linalg import lsqr
 
 
-def mccc(seis, dt, twin=0):
-    data = np.zeros([len(seis), seis[0].data.shape[0]])
-    for i in range(len(seis)):
-        data[i, :] = seis[i].data
-    nt = data.shape[1] * 2
+def _pairs(ns, neighbors=None):
+    if neighbors is None or neighbors >= ns - 1:
+        return np.triu_indices(ns, k=1)
+    idx_i = []
+    idx_j = []
+    for k in range(1, int(neighbors)+1):
+        idx_i.append(np.arange(ns-k))
+        idx_j.append(np.arange(k, ns))
+    return np.concatenate(idx_i), np.concatenate(idx_j)
+
+
+def pair_lags(data, pair_i, pair_j, nt, itw=None, max_elements=2**24):
+    """Lag of maximum cross-correlation between trace pairs in samples.
+
+    Cross-spectra are computed for blocks of pairs at once and transformed back in batches.
+
+    :param data: Waveforms in shape of ``(ns, npts)``
+    :type data: numpy.ndarray
+    :param pair_i: Index of the first trace of each pair
+    :type pair_i: numpy.ndarray
+    :param pair_j: Index of the second trace of each pair
+    :type pair_j: numpy.ndarray
+    :param nt: Length of FFT
+    :type nt: int
+    :param itw: Maximum absolute lag to search in samples, defaults to None for all lags
+    :type itw: int, optional
+    :param max_elements: Maximum number of samples of cross-correlations in one batch, defaults to 2**24
+    :type max_elements: int, optional
+    :return: Lag of ``pair_j`` relative to ``pair_i`` in samples, positive if ``pair_j`` is later
+    :rtype: numpy.ndarray
+    """
+    fft_all = rfft(data, nt, axis=1)
+    if itw is None:
+        lag_idx = np.arange(nt)
+    else:
+        lag_idx = np.concatenate((np.arange(0, itw+1), np.arange(nt-itw, nt)))
+    lags = np.where(lag_idx > nt/2, lag_idx - nt, lag_idx)
+    block = max(1, max_elements // nt)
+    npair = pair_i.size
+    shift = np.zeros(npair, dtype=int)
+    for b in range(0, npair, block):
+        pi = pair_i[b:b+block]
+        pj = pair_j[b:b+block]
+        ccf = irfft(fft_all[pi].conj() * fft_all[pj], nt, axis=1)[:, lag_idx]
+        shift[b:b+block] = lags[np.argmax(ccf, axis=1)]
+    return shift
+
+
+def lsq_delay(ns, pair_i, pair_j, tcc):
+    """Least-squares solution of relative arrival times from differential times
+    ``t_j - t_i = tcc`` with zero mean.
+
+    :return: Arrival times relative to the mean, and rms residual of pairs involving each trace
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    npair = pair_i.size
+    rows = np.repeat(np.arange(npair), 2)
+    cols = np.column_stack((pair_i, pair_j)).ravel()
+    vals = np.tile([-1., 1.], npair)
+    g = vstack([coo_matrix((vals, (rows, cols)), shape=(npair, ns)),
+                coo_matrix(np.ones((1, ns)))]).tocsr()
+    d = np.append(tcc, 0.)
+    t = lsqr(g, d, atol=1e-12, btol=1e-12)[0]
+    res = tcc - (t[pair_j] - t[pair_i])
+    count = np.bincount(pair_i, minlength=ns) + np.bincount(pair_j, minlength=ns)
+    sq = np.bincount(pair_i, weights=res**2, minlength=ns) + np.bincount(pair_j, weights=res**2, minlength=ns)
+    sigma = np.sqrt(sq / np.maximum(count - 1, 1))
+    return t, sigma
+
+
+def mccc(seis, dt, twin=0, neighbors=None, lsq=False, max_elements=2**24):
+    """Multi-channel cross-correlation (VanDecar and Crosson, 1990)
+
+    :param seis: Traces with the same length, or an array in shape of ``(ns, npts)``
+    :type seis: list of obspy.Trace or numpy.ndarray
+    :param dt: Sampling interval in sec
+    :type dt: float
+    :param twin: Window of lags to search in sec, defaults to 0 for all lags
+    :type twin: float, optional
+    :param neighbors: Only correlate each trace with the next ``neighbors`` traces, defaults to None for all pairs.
+                      The delays are then solved in the least-squares sense.
+    :type neighbors: int, optional
+    :param lsq: Solve the delays in the least-squares sense and return the residuals, defaults to False
+    :type lsq: bool, optional
+    :param max_elements: Maximum number of samples of cross-correlations in one batch, defaults to 2**24
+    :type max_elements: int, optional
+    :return: Time shifts in sec aligning each trace to the mean arrival,
+             and rms residual of each trace in sec if ``lsq`` is True
+    :rtype: numpy.ndarray or (numpy.ndarray, numpy.ndarray)
+    """
+    if isinstance(seis, np.ndarray):
+        data = np.atleast_2d(seis).astype(float)
+    else:
+        data = np.array([tr.data for tr in seis], dtype=float)
     ns = data.shape[0]
-    mask = np.ones(nt)
-    tcc = np.zeros([ns, ns])
-    tdel = np.zeros(ns)
-    fft_all = np.fft.fft(data, nt, 1)
-    fft_conj = fft_all.conj()
-
-    if twin != 0:
-        itw = np.fix(twin/(2*dt))
-        mask = np.zeros(nt)
-        mask[0:itw] = 1.0
-        mask[nt-itw-1:nt] = 1.0
-    for i in range(ns-1):
-        ffis = np.conj(fft_conj[i])
-#        ffis = np.conj(np.fft.fft(seis[i].data, nt))
-        for j in np.arange(i+1, ns):
-            ffjs = fft_all[j]
-#            ffjs = np.fft.fft(seis[j].data, nt)
-            ccf = np.fft.ifft(ffis*ffjs, nt).real*mask
-            tcc[i, j] = np.argmax(ccf)
-
-    (row, col) = np.where(tcc > nt/2)
-    for i in range(row.shape[0]):
-        tcc[row[i], col[i]] -= (nt+1)
-
-    tcc *= dt
-
-    for i in np.arange(0, ns):
-        tdel[i] = (-np.sum(tcc[0:i+1, i]) + np.sum(tcc[i, i+1:ns]))/ns
-
-    return tdel
\ No newline at end of file
+    nt = data.shape[1] * 2
+    itw = int(np.fix(twin/(2*dt))) if twin != 0 else None
+    pair_i, pair_j = _pairs(ns, neighbors)
+    tcc = pair_lags(data, pair_i, pair_j, nt, itw=itw, max_elements=max_elements) * dt
+
+    if lsq or neighbors is not None:
+        t, sigma = lsq_delay(ns, pair_i, pair_j, tcc)
+        tdel = -t
+    else:
+        tdel = (np.bincount(pair_i, weights=tcc, minlength=ns) -
+                np.bincount(pair_j, weights=tcc, minlength=ns))/ns
+    if lsq:
+        return tdel, sigma
+    return tdel
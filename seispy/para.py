@@ -8,10 +8,12 @@ class para(object):
         self.datapath = expanduser('~')
         self.rfpath = expanduser('~')
         self.catalogpath = join(dirname(__file__), 'data', 'EventCMT.dat')
-        self.pjtpath = 'rfpjt.pkl'
+        self.pjtpath = 'rfpjt.npz'
         self.catalog_server = 'IRIS'
         self.offset = None
         self.tolerance = 210
+        self.prefetch_workers = 0
+        self.prefetch_window = 8
         self.dateformat = '%Y.%j.%H.%M.%S'
         self.date_begin = obspy.UTCDateTime('19760101')
         self.date_end = obspy.UTCDateTime.now()
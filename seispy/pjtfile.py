@@ -0,0 +1,178 @@
+"""Compact project file of :class:`seispy.rf.RF`.
+
+A project is an uncompressed ``.npz`` archive. Its ``header`` entry is a JSON string
+with the parameters, station info, event attributes and trace stats. The event table is
+stored column by column and the waveforms of each event are stored as one contiguous
+block named ``wf_<k>``. Entries of ``.npz`` archives are read on access, so waveforms
+are only loaded when :attr:`seispy.eq.EQ.st` is first used.
+"""
+import json
+import zipfile
+import warnings
+import numpy as np
+import pandas as pd
+import obspy
+from obspy import UTCDateTime
+from obspy.core import AttribDict
+
+
+PJT_VERSION = 1
+_SKIP_ATTRS = ('_st', '_st_loader', 'rf', 'st_pick')
+
+
+def _encode(value):
+    if isinstance(value, UTCDateTime):
+        return {'__utcdatetime__': str(value)}
+    elif isinstance(value, np.ndarray):
+        return {'__ndarray__': value.tolist(), 'dtype': str(value.dtype)}
+    elif isinstance(value, np.generic):
+        return value.item()
+    elif isinstance(value, AttribDict):
+        return {k: _encode(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    else:
+        raise TypeError('Cannot serialize {}'.format(type(value)))
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if '__utcdatetime__' in value:
+            return UTCDateTime(value['__utcdatetime__'])
+        elif '__ndarray__' in value:
+            return np.array(value['__ndarray__'], dtype=value['dtype'])
+        return {k: _decode(v) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _attrs(obj, skip=()):
+    attrs = {}
+    for key, value in obj.__dict__.items():
+        if key in skip:
+            continue
+        try:
+            attrs[key] = _encode(value)
+        except TypeError as e:
+            warnings.warn('Attribute {} of {} is not saved to the project: {}'.format(
+                          key, type(obj).__name__, e))
+    return attrs
+
+
+def _trace_stats(tr):
+    stats = {key: _encode(tr.stats[key]) for key in ('network', 'station', 'location', 'channel',
+                                                    'starttime', 'delta')}
+    stats['npts'] = tr.stats.npts
+    if 'sac' in tr.stats:
+        stats['sac'] = _encode(tr.stats.sac)
+    return stats
+
+
+class _BlockLoader(object):
+    def __init__(self, path, key, stats):
+        self.path = path
+        self.key = key
+        self.stats = stats
+
+    def __call__(self):
+        with np.load(self.path, allow_pickle=False) as pjt:
+            block = pjt[self.key]
+        st = obspy.Stream()
+        offset = 0
+        for stats in self.stats:
+            stats = _decode(stats)
+            npts = stats.pop('npts')
+            if 'sac' in stats:
+                stats['sac'] = AttribDict(stats['sac'])
+            st.append(obspy.Trace(data=block[offset:offset+npts].copy(), header=stats))
+            offset += npts
+        return st
+
+
+def is_pjtfile(path):
+    """Whether ``path`` is a project file in this format rather than a legacy pickle"""
+    return zipfile.is_zipfile(path)
+
+
+def save_pjt(path, para, stainfo, eqs):
+    """Save a project to ``path``
+
+    :param path: Path to the project file
+    :type path: str
+    :param para: Parameters of the project
+    :type para: seispy.para.para
+    :param stainfo: Station information
+    :type stainfo: seispy.rf.stainfo
+    :param eqs: Event table with :class:`seispy.eq.EQ` in the ``data`` column
+    :type eqs: pandas.DataFrame
+    """
+    arrays = {}
+    columns = []
+    for col in eqs.columns:
+        if col == 'data':
+            continue
+        values = eqs[col].to_numpy()
+        if col == 'date':
+            values = np.array([str(v) for v in values], dtype=str)
+        elif values.dtype.kind not in 'biufU':
+            try:
+                values = pd.to_numeric(values).astype(float)
+            except (TypeError, ValueError):
+                values = np.array([str(v) for v in values], dtype=str)
+        arrays['col_{}'.format(col)] = values
+        columns.append(col)
+    events = []
+    for k, this_eq in enumerate(eqs['data'].values if 'data' in eqs.columns else []):
+        evt = {'attrs': _attrs(this_eq, skip=_SKIP_ATTRS), 'stats': None}
+        st = this_eq.st
+        if st is not None and len(st):
+            evt['stats'] = [_trace_stats(tr) for tr in st]
+            arrays['wf_{}'.format(k)] = np.concatenate([tr.data for tr in st])
+        events.append(evt)
+    header = {'version': PJT_VERSION,
+              'para': _attrs(para),
+              'stainfo': _attrs(stainfo),
+              'columns': columns,
+              'index': eqs.index.values.tolist(),
+              'events': events}
+    arrays['header'] = np.array(json.dumps(header))
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def load_pjt(path):
+    """Load a project from ``path``. Waveforms are read on first access.
+
+    :param path: Path to the project file
+    :type path: str
+    :return: Header, event table with :class:`seispy.eq.EQ` in the ``data`` column
+    :rtype: (dict, pandas.DataFrame)
+    """
+    from seispy.eq import EQ
+    with np.load(path, allow_pickle=False) as pjt:
+        header = json.loads(pjt['header'].item())
+        if header['version'] > PJT_VERSION:
+            raise ValueError('Project file version {} is newer than supported version {}'.format(
+                             header['version'], PJT_VERSION))
+        eqs = pd.DataFrame({col: pjt['col_{}'.format(col)] for col in header['columns']},
+                           index=header['index'], columns=header['columns'])
+    if 'date' in eqs.columns:
+        eqs['date'] = [UTCDateTime(v) for v in eqs['date']]
+    if header['events']:
+        data = []
+        for k, evt in enumerate(header['events']):
+            this_eq = EQ.__new__(EQ)
+            this_eq.__dict__.update(_decode(evt['attrs']))
+            this_eq.rf = obspy.Stream()
+            if evt['stats'] is not None:
+                this_eq.set_loader(_BlockLoader(path, 'wf_{}'.format(k), evt['stats']))
+            else:
+                this_eq.st = None
+            data.append(this_eq)
+        eqs['data'] = data
+    header['para'] = _decode(header['para'])
+    header['stainfo'] = _decode(header['stainfo'])
+    return header, eqs
@@ -1,6 +1,8 @@
 import os
+import zipfile
 import numpy as np
-from scipy.interpolate import interpn
+from scipy.interpolate import interpn, RegularGridInterpolator
+from functools import lru_cache
 import subprocess
 import argparse
 import sys
@@ -86,7 +88,121 @@ def gen_rayp_lib():
     pr.save(path=arg.out_path)
 
 
+def _npz_memmap(path, name):
+    """Memory-map array ``name`` in an uncompressed npz file, None if it cannot be mapped"""
+    with zipfile.ZipFile(path) as zf:
+        info = zf.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, 'rb') as f:
+        # local file header of 30 bytes followed by the file name and the extra field
+        f.seek(info.header_offset + 26)
+        name_len, extra_len = np.frombuffer(f.read(4), dtype='<u2')
+        f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        else:
+            return None
+        offset = f.tell()
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape, offset=offset,
+                     order='F' if fortran_order else 'C')
+
+
+class PsRaypLib(object):
+    def __init__(self, dis, dep, layers, rayp):
+        """Ray-parameter library of Pds phases generated by :meth:`PsRayp.save`,
+        in s/deg on grids of epicentral distance, event depth and conversion depth.
+
+        :param dis: Epicentral distances in degree
+        :type dis: numpy.ndarray
+        :param dep: Event depths in km
+        :type dep: numpy.ndarray
+        :param layers: Conversion depths in km
+        :type layers: numpy.ndarray
+        :param rayp: Ray-parameters in shape of ``(dis.size, dep.size, layers.size)``
+        :type rayp: numpy.ndarray
+        """
+        self.dis = np.asarray(dis, dtype=float)
+        self.dep = np.asarray(dep, dtype=float)
+        self.layers = np.asarray(layers, dtype=float)
+        self.rayp = rayp
+        self.interp = RegularGridInterpolator((self.dis, self.dep, self.layers), rayp,
+                                              bounds_error=False, fill_value=None)
+
+    @classmethod
+    def load(cls, rayp_lib, mmap=True):
+        """Load a library from a npz file or an opened ``NpzFile``
+
+        :param rayp_lib: Path to the npz file or the ``NpzFile``
+        :type rayp_lib: str or numpy.lib.npyio.NpzFile
+        :param mmap: Whether memory-map ray-parameters from the file, so that they are
+                     read on demand and shared between processes. Only for a path
+                     to npz file saved without compression, defaults to True
+        :type mmap: bool, optional
+        """
+        if isinstance(rayp_lib, str):
+            if not os.path.exists(rayp_lib):
+                raise FileNotFoundError('Ps rayp lib file was not found')
+            rayp = _npz_memmap(rayp_lib, 'rayp') if mmap else None
+            with np.load(rayp_lib) as data:
+                if rayp is None:
+                    rayp = data['rayp']
+                return cls(data['dis'], data['dep'], data['layers'], rayp)
+        return cls(rayp_lib['dis'], rayp_lib['dep'], rayp_lib['layers'], rayp_lib['rayp'])
+
+    def __call__(self, dis, dep, layers):
+        """Ray-parameters in s/deg of events at conversion depths ``layers``
+
+        :param dis: Epicentral distances of events in degree
+        :type dis: float or numpy.ndarray
+        :param dep: Depths of events in km
+        :type dep: float or numpy.ndarray
+        :param layers: Conversion depths in km
+        :type layers: numpy.ndarray
+        :return: Ray-parameters in shape of ``(dis.size, layers.size)``, or ``(layers.size,)``
+                 for scalar ``dis`` and ``dep``
+        :rtype: numpy.ndarray
+        """
+        layers = np.asarray(layers, dtype=float)
+        dis, dep = np.broadcast_arrays(np.asarray(dis, dtype=float), np.asarray(dep, dtype=float))
+        points = np.empty(dis.shape + layers.shape + (3,))
+        points[..., 0] = dis[..., np.newaxis]
+        points[..., 1] = dep[..., np.newaxis]
+        points[..., 2] = layers
+        return self.interp(points)
+
+
+@lru_cache(maxsize=4)
+def _load_rayp_lib(path, mtime):
+    return PsRaypLib.load(path)
+
+
+def load_rayp_lib(rayp_lib):
+    """Load a ray-parameter library once per process. Paths are cached by their modification time.
+
+    :param rayp_lib: Path to the npz file, an opened ``NpzFile`` or a loaded library
+    :type rayp_lib: str, numpy.lib.npyio.NpzFile or :class:`PsRaypLib`
+    :rtype: :class:`PsRaypLib`
+    """
+    if isinstance(rayp_lib, PsRaypLib):
+        return rayp_lib
+    elif isinstance(rayp_lib, str):
+        if not os.path.exists(rayp_lib):
+            raise FileNotFoundError('Ps rayp lib file was not found')
+        path = os.path.abspath(rayp_lib)
+        return _load_rayp_lib(path, os.path.getmtime(path))
+    elif isinstance(rayp_lib, np.lib.npyio.NpzFile):
+        return PsRaypLib.load(rayp_lib)
+    else:
+        raise TypeError('srayp should be path to Ps rayp lib')
+
+
 def get_psrayp(rayp_lib, dis, dep, layers):
+    if isinstance(rayp_lib, PsRaypLib):
+        return rayp_lib(dis, dep, layers)
     # x_layers = np.zeros([len(layers), 3])
     # for i in range(len(layers)):
     #     x_layers[i] = np.array([dis, dep, layers[i]])
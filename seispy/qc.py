@@ -0,0 +1,144 @@
+"""Batch quality control of event waveforms.
+
+Waveforms of all events are cut into a 2-D window matrix aligned on the predicted
+arrival, so that SNR and STA/LTA triggers are computed for all events in one call.
+"""
+import numpy as np
+from scipy.signal import lfilter
+
+
+def window_matrix(traces, ref_times, time_before, time_after):
+    """Cut windows around reference times from traces with the same sampling interval.
+    Samples outside the records are set to zero.
+
+    :param traces: Traces with the same ``delta``
+    :type traces: list of obspy.Trace
+    :param ref_times: Reference time (e.g., predicted arrival) of each trace
+    :type ref_times: list of obspy.UTCDateTime
+    :param time_before: Time before the reference time in sec
+    :type time_before: float
+    :param time_after: Time after the reference time in sec
+    :type time_after: float
+    :return: Window matrix in shape of ``(len(traces), npts)``, sampling interval
+    :rtype: (numpy.ndarray, float)
+    """
+    dt = traces[0].stats.delta
+    nb = int(round(time_before / dt))
+    npts = nb + int(round(time_after / dt)) + 1
+    data = np.zeros((len(traces), npts))
+    for i, (tr, t_ref) in enumerate(zip(traces, ref_times)):
+        if tr.stats.delta != dt:
+            raise ValueError('All traces must share the same sampling interval')
+        b = int(round((t_ref - tr.stats.starttime) / dt)) - nb
+        src_b = max(b, 0)
+        src_e = min(b + npts, tr.stats.npts)
+        if src_e > src_b:
+            data[i, src_b-b:src_e-b] = tr.data[src_b:src_e]
+    return data, dt
+
+
+def recursive_sta_lta(data, nsta, nlta):
+    """Recursive STA/LTA along the last axis, same as ``obspy.signal.trigger.recursive_sta_lta``
+    but for all rows at once.
+
+    :param data: Waveforms in shape of ``(..., npts)``
+    :type data: numpy.ndarray
+    :param nsta: Length of short time average window in samples
+    :type nsta: int
+    :param nlta: Length of long time average window in samples
+    :type nlta: int
+    :return: Characteristic function with the same shape as ``data``
+    :rtype: numpy.ndarray
+    """
+    data = np.asarray(data, dtype=np.float64)
+    sq = data[..., 1:] ** 2
+    csta = 1. / nsta
+    clta = 1. / nlta
+    zi_shape = data.shape[:-1] + (1,)
+    sta = lfilter([csta], [1., csta - 1.], sq, axis=-1, zi=np.zeros(zi_shape))[0]
+    lta = lfilter([clta], [1., clta - 1.], sq, axis=-1, zi=np.full(zi_shape, (1. - clta) * 1e-99))[0]
+    charfct = np.zeros_like(data)
+    charfct[..., 1:] = sta / lta
+    charfct[..., :nlta] = 0.
+    return charfct
+
+
+def batch_snr(data, idx, nlen):
+    """SNR in dB between ``nlen`` samples after and before sample ``idx`` for all rows,
+    same as :func:`seispy.geo.snr` except that it is 0 if either window is all zero.
+
+    :param data: Window matrix in shape of ``(..., npts)``
+    :type data: numpy.ndarray
+    :param idx: Index of the arrival in the window
+    :type idx: int
+    :param nlen: Length of signal and noise windows in samples
+    :type nlen: int
+    :return: SNR with the shape of ``data.shape[:-1]``
+    :rtype: numpy.ndarray
+    """
+    spow = np.mean(data[..., idx:idx+nlen+1] ** 2, axis=-1)
+    npow = np.mean(data[..., max(idx-nlen, 0):idx+1] ** 2, axis=-1)
+    # windows outside the records are zero, SNR of them is 0 as in :meth:`seispy.eq.EQ.snr`
+    empty = (spow == 0) | (npow == 0)
+    snr = np.zeros(spow.shape)
+    snr[~empty] = 10 * np.log10(spow[~empty] / npow[~empty])
+    return snr
+
+
+def trigger_index(data, nsta, nlta):
+    """Index of the steepest rise of the recursive STA/LTA after the first ``nlta`` samples for all rows
+
+    :return: Trigger indices in shape of ``data.shape[:-1]``
+    :rtype: numpy.ndarray
+    """
+    cft = recursive_sta_lta(data, nsta, nlta)
+    return np.argmax(np.diff(cft, axis=-1)[..., nlta:], axis=-1) + nlta
+
+
+def batch_qc(data, dt, time_before, noiselen=50, noisegate=5, trigger_data=None,
+             trigger_before=None, trigger_after=None, stl=5, ltl=10):
+    """Screen all events with SNR and STA/LTA trigger in one call.
+
+    :param data: Window matrix aligned on the predicted arrival in shape of ``(nev, npts)``,
+                 or ``(nev, ncomp, npts)`` to average SNR over components
+    :type data: numpy.ndarray
+    :param dt: Sampling interval in sec
+    :type dt: float
+    :param time_before: Time before the predicted arrival at the first column in sec
+    :type time_before: float
+    :param noiselen: Length of signal and noise windows for SNR in sec, defaults to 50
+    :type noiselen: float, optional
+    :param noisegate: Events with SNR less than it are dropped, defaults to 5
+    :type noisegate: float, optional
+    :param trigger_data: Window matrix in shape of ``(nev, npts)`` for the STA/LTA trigger,
+                         defaults to ``data`` when it is 2-D. Skip the trigger if None.
+    :type trigger_data: numpy.ndarray, optional
+    :param trigger_before: Time before the predicted arrival where the trigger begins, defaults to ``time_before``
+    :type trigger_before: float, optional
+    :param trigger_after: Time after the predicted arrival where the trigger ends, defaults to the end of window
+    :type trigger_after: float, optional
+    :param stl: Length of short time average window in sec, defaults to 5
+    :type stl: float, optional
+    :param ltl: Length of long time average window in sec, defaults to 10
+    :type ltl: float, optional
+    :return: Mask of kept events, SNR, and trigger shift relative to the predicted arrival
+             in sec (None if the trigger is skipped)
+    :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    data = np.asarray(data)
+    idx = int(round(time_before / dt))
+    snr = batch_snr(data, idx, int(noiselen / dt))
+    if snr.ndim > 1:
+        snr = snr.mean(axis=tuple(range(1, snr.ndim)))
+    keep = snr >= noisegate
+    if trigger_data is None and data.ndim == 2:
+        trigger_data = data
+    if trigger_data is None:
+        return keep, snr, None
+    if trigger_before is None:
+        trigger_before = time_before
+    b = idx - int(round(trigger_before / dt))
+    e = trigger_data.shape[-1] if trigger_after is None else idx + int(round(trigger_after / dt)) + 1
+    df = 1 / dt
+    n_trigger = trigger_index(trigger_data[..., b:e], int(stl*df), int(ltl*df))
+    return keep, snr, n_trigger * dt - trigger_before
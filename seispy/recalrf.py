@@ -1,56 +1,23 @@
-from seispy.rf import RF, datestr2regex, SACFileNotFoundError
-from seispy.eq import EQ
+from seispy.rf import RF, match_sac_files, iter_eq
 import numpy as np
 from obspy import UTCDateTime
-from datetime import timedelta
 import pandas as pd
-import glob
 from os.path import join
-import re
 import sys
-import obspy
 
 
 def match_eq(eq_lst, pathname, logger, ref_comp='Z', suffix='SAC', offset=0,
-             tolerance=1, dateformat='%Y.%j.%H.%M.%S'):
-    pattern = datestr2regex(dateformat)
-    ref_eqs = glob.glob(join(pathname, '*{0}*{1}'.format(ref_comp, suffix)))
-    if len(ref_eqs) == 0:
-        raise SACFileNotFoundError(join(pathname, '*{0}*{1}'.format(ref_comp, suffix)))
-    sac_files = []
-    for ref_sac in ref_eqs:
-        try:
-            datestr = re.findall(pattern, ref_sac)[0]
-        except IndexError:
-            raise IndexError('Error data format of {} in {}'.format(dateformat, ref_sac))
-        if isinstance(offset, (int, float)):
-            sac_files.append([datestr, UTCDateTime.strptime(datestr, dateformat), -offset])
-        elif offset is None:
-            try:
-                tr = obspy.read(ref_sac)[0]
-            except TypeError:
-                continue
-            sac_files.append([datestr, tr.stats.starttime-tr.stats.sac.b, tr.stats.sac.o])
-        else:
-            raise TypeError('offset should be int or float type')
+             tolerance=1, dateformat='%Y.%j.%H.%M.%S', prefetch_workers=0, prefetch_window=8):
+    eq_match = match_sac_files(eq_lst, pathname, ref_comp=ref_comp, suffix=suffix, offset=offset,
+                               tolerance=tolerance, dateformat=dateformat)
     new_col = ['data', 'datestr']
-    eq_match = pd.DataFrame(columns=new_col)
-    for datestr, b_time, offs in sac_files:
-        date_range_begin = b_time + timedelta(seconds=offs - tolerance)
-        date_range_end = b_time + timedelta(seconds=offs + tolerance)
-        results = eq_lst[(eq_lst.date > date_range_begin) & (eq_lst.date < date_range_end)]
-        if len(results) != 1:
-            continue
-        try:
-            this_eq = EQ(pathname, datestr, suffix)
-        except Exception as e:
-            logger.RFlog.error(''.format(e))
-            continue
-        this_eq.get_time_offset(results.iloc[0]['date'])
-        this_df = pd.DataFrame([[this_eq, datestr]], columns=new_col, index=results.index.values)
-        eq_match = eq_match.append(this_df)
-    ind = eq_match.index.drop_duplicates(keep=False)
-    eq_match = eq_match.loc[ind]
+    rows = []
+    index = []
+    for i, row, this_eq in iter_eq(eq_match, pathname, logger, suffix=suffix,
+                                   prefetch_workers=prefetch_workers, prefetch_window=prefetch_window):
+        rows.append([this_eq, row['datestr']])
+        index.append(i)
+    eq_match = pd.DataFrame(rows, columns=new_col, index=index)
     return pd.concat([eq_lst, eq_match], axis=1, join='inner')
 
 
@@ -79,7 +46,8 @@ class ReRF(RF):
             self.eqs = match_eq(self.eq_lst, self.para.datapath, self.logger,
                                 ref_comp=self.para.ref_comp, suffix=self.para.suffix,
                                 offset=self.para.offset, tolerance=self.para.tolerance,
-                                dateformat=self.para.dateformat)
+                                dateformat=self.para.dateformat, prefetch_workers=self.para.prefetch_workers,
+                                prefetch_window=self.para.prefetch_window)
         except Exception as e:
             self.logger.RFlog.error('{0}'.format(e))
             raise e
@@ -89,6 +57,13 @@ class ReRF(RF):
         else:
             self.logger.RFlog.info('{0} earthquakes are matched'.format(self.eqs.shape[0]))
 
+    def _read_events(self, eq_match):
+        for i, row, this_eq in iter_eq(eq_match, self.para.datapath, self.logger, suffix=self.para.suffix,
+                                       prefetch_workers=self.para.prefetch_workers,
+                                       prefetch_window=self.para.prefetch_window):
+            row['data'] = this_eq
+            yield i, row
+
     def write_list(self):
         path = join(self.para.rfpath, '{}.{}finallist.dat'.format(self.stainfo.network, self.stainfo.station))
         self.logger.RFlog.info('Writting event info to {}'.format(path))
@@ -1,15 +1,16 @@
 import obspy
 from obspy import UTCDateTime
 from obspy.io.sac import SACTrace
-from obspy.taup import TauPyModel
 import re
 from os.path import join, exists
 from seispy.io import wsfetch
 from seispy.para import para
 from seispy import distaz
-from seispy.eq import EQ
+from seispy.eq import EQPrefetcher
 from seispy.setuplog import setuplog
-from seispy.sviewerui import MatplotlibWidget
+from seispy.metrics import metrics
+from seispy.pjtfile import save_pjt, load_pjt, is_pjtfile
+from seispy import qc
 import glob
 import numpy as np
 from datetime import timedelta
@@ -17,11 +18,12 @@ import pandas as pd
 import configparser
 import argparse
 import sys
-from PyQt5.QtWidgets import QApplication
 import pickle
 
 
 def pickphase(eqs, para, logger):
+    from PyQt5.QtWidgets import QApplication
+    from seispy.sviewerui import MatplotlibWidget
     app = QApplication(sys.argv)
     ui = MatplotlibWidget(eqs, para, logger)
     ui.show()
@@ -80,8 +82,13 @@ def load_station_info(pathname, ref_comp, suffix):
     return ex_tr.knetwk, ex_tr.kstnm, ex_tr.stla, ex_tr.stlo, ex_tr.stel
 
 
-def match_eq(eq_lst, pathname, stla, stlo, logger, ref_comp='Z', suffix='SAC', offset=None,
-             tolerance=210, dateformat='%Y.%j.%H.%M.%S'):
+def match_sac_files(eq_lst, pathname, ref_comp='Z', suffix='SAC', offset=None,
+                    tolerance=210, dateformat='%Y.%j.%H.%M.%S'):
+    """Match SAC files in ``pathname`` with events in ``eq_lst`` by origin time without reading waveforms.
+
+    :return: A copy of ``eq_lst`` with only matched events and a new column of ``datestr``
+    :rtype: pandas.DataFrame
+    """
     pattern = datestr2regex(dateformat)
     ref_eqs = glob.glob(join(pathname, '*{0}*{1}'.format(ref_comp, suffix)))
     if len(ref_eqs) == 0:
@@ -96,34 +103,68 @@ def match_eq(eq_lst, pathname, stla, stlo, logger, ref_comp='Z', suffix='SAC', o
             sac_files.append([datestr, UTCDateTime.strptime(datestr, dateformat), -offset])
         elif offset is None:
             try:
-                tr = obspy.read(ref_sac)[0]
+                tr = obspy.read(ref_sac, headonly=True)[0]
             except TypeError:
                 continue
-            sac_files.append([datestr, tr.stats.starttime-tr.stats.sac.b, tr.stats.sac.o])
+            sac_files.append([datestr, tr.stats.starttime-tr.stats.sac.b, float(tr.stats.sac.o)])
         else:
             raise TypeError('offset should be int or float type')
-    new_col = ['dis', 'bazi', 'data', 'datestr']
-    eq_match = pd.DataFrame(columns=new_col)
+    datestrs = []
+    index = []
     for datestr, b_time, offs in sac_files:
         date_range_begin = b_time + timedelta(seconds=offs - tolerance)
         date_range_end = b_time + timedelta(seconds=offs + tolerance)
         results = eq_lst[(eq_lst.date > date_range_begin) & (eq_lst.date < date_range_end)]
         if len(results) != 1:
             continue
-        try:
-            this_eq = EQ(pathname, datestr, suffix)
-        except Exception as e:
-            logger.RFlog.error(''.format(e))
-            continue
-        this_eq.get_time_offset(results.iloc[0]['date'])
-        daz = distaz(stla, stlo, results.iloc[0]['evla'], results.iloc[0]['evlo'])
-        this_df = pd.DataFrame([[daz.delta, daz.baz, this_eq, datestr]], columns=new_col, index=results.index.values)
-        eq_match = pd.concat([eq_match, this_df])
+        datestrs.append(datestr)
+        index.append(results.index.values[0])
+    eq_match = pd.DataFrame({'datestr': datestrs}, index=index)
     ind = eq_match.index.drop_duplicates(keep=False)
     eq_match = eq_match.loc[ind]
     return pd.concat([eq_lst, eq_match], axis=1, join='inner')
 
 
+def iter_eq(eq_match, pathname, logger, suffix='SAC', prefetch_workers=0, prefetch_window=8):
+    """Read matched events one by one, yielding ``(index, row, EQ)`` for readable events.
+
+    :param eq_match: Matched events from :func:`match_sac_files`
+    :type eq_match: pandas.DataFrame
+    """
+    reader = EQPrefetcher(pathname, eq_match['datestr'], suffix,
+                          workers=prefetch_workers, window=prefetch_window)
+    for (i, row), (datestr, this_eq) in zip(eq_match.iterrows(), reader):
+        if isinstance(this_eq, Exception):
+            logger.RFlog.error('{}: {}'.format(datestr, this_eq))
+            continue
+        this_eq.get_time_offset(row['date'])
+        yield i, row, this_eq
+
+
+def match_eq(eq_lst, pathname, stla, stlo, logger, ref_comp='Z', suffix='SAC', offset=None,
+             tolerance=210, dateformat='%Y.%j.%H.%M.%S', prefetch_workers=0, prefetch_window=8):
+    eq_match = match_sac_files(eq_lst, pathname, ref_comp=ref_comp, suffix=suffix, offset=offset,
+                               tolerance=tolerance, dateformat=dateformat)
+    new_col = ['dis', 'bazi', 'data', 'datestr']
+    rows = []
+    index = []
+    for i, row, this_eq in iter_eq(eq_match, pathname, logger, suffix=suffix,
+                                   prefetch_workers=prefetch_workers, prefetch_window=prefetch_window):
+        daz = distaz(stla, stlo, row['evla'], row['evlo'])
+        rows.append([daz.delta, daz.baz, this_eq, row['datestr']])
+        index.append(i)
+    eq_match = pd.DataFrame(rows, columns=new_col, index=index)
+    return pd.concat([eq_lst, eq_match], axis=1, join='inner')
+
+
+def _n_eqs(rf, *args, **kwargs):
+    return rf.eqs.shape[0]
+
+
+def _n_eq_lst(rf, *args, **kwargs):
+    return rf.eq_lst.shape[0]
+
+
 class stainfo():
     def __init__(self):
         self.network = ''
@@ -170,7 +211,7 @@ def CfgParser(cfg_file):
                     pa.__dict__[key] = float(value)
                 except:
                     pa.__dict__[key] = None
-            elif key == 'itmax':
+            elif key in ('itmax', 'prefetch_workers', 'prefetch_window'):
                 pa.__dict__[key] = int(value)
             elif key == 'only_r':
                 pa.__dict__[key] = cf.getboolean(sec, 'only_r')
@@ -220,9 +261,22 @@ class RF(object):
             raise TypeError('Input value should be class seispy.rf.para')
         self.eq_lst = pd.DataFrame()
         self.eqs = pd.DataFrame()
-        self.model = TauPyModel('iasp91')
+        self._model = None
         self.stainfo = stainfo()
         self.baz_shift = 0
+        self.streamed = False
+
+    @property
+    def model(self):
+        """TauP model for arrivals, loaded on first use"""
+        if self._model is None:
+            from obspy.taup import TauPyModel
+            self._model = TauPyModel('iasp91')
+        return self._model
+
+    @model.setter
+    def model(self, value):
+        self._model = value
 
     @property
     def date_begin(self):
@@ -248,6 +302,7 @@ class RF(object):
             self.logger.RFlog.error('{0}'.format(e))
             raise e
 
+    @metrics.timed('rf.search_eq', items=_n_eq_lst)
     def search_eq(self, local=False, server=None, catalog='GCMT'):
         if not local:
             try:
@@ -274,13 +329,15 @@ class RF(object):
                 raise e
         self.logger.RFlog.info('{} earthquakes are found'.format(self.eq_lst.shape[0]))
 
+    @metrics.timed('rf.match_eq', items=_n_eqs)
     def match_eq(self):
         try:
             self.logger.RFlog.info('Match SAC files')
             self.eqs = match_eq(self.eq_lst, self.para.datapath, self.stainfo.stla, self.stainfo.stlo, self.logger,
                                 ref_comp=self.para.ref_comp, suffix=self.para.suffix,
                                 offset=self.para.offset, tolerance=self.para.tolerance,
-                                dateformat=self.para.dateformat)
+                                dateformat=self.para.dateformat, prefetch_workers=self.para.prefetch_workers,
+                                prefetch_window=self.para.prefetch_window)
         except Exception as e:
             self.logger.RFlog.error('{0}'.format(e))
             raise e
@@ -291,22 +348,35 @@ class RF(object):
             self.logger.RFlog.info('{0} earthquakes are matched'.format(self.eqs.shape[0]))
 
     def savepjt(self):
-        eqs = self.eqs.copy()
-        for _, row in eqs.iterrows():
-            row['data'].cleanstream()
         try:
             self.logger.RFlog.info('Saving project to {0}'.format(self.para.pjtpath))
-            with open(self.para.pjtpath, 'wb') as f:
-                pickle.dump({'para': self.para, 'eqs': eqs}, f, -1)
+            save_pjt(self.para.pjtpath, self.para, self.stainfo, self.eqs)
         except Exception as e:
             self.logger.RFlog.error('{0}'.format(e))
             raise IOError(e)
- 
+
     @classmethod
     def loadpjt(cls, path):
+        """Load a project saved by :meth:`savepjt`. Waveforms are read on first access.
+        Projects pickled by earlier versions are re-read from ``datapath``.
+
+        :param path: Path to the project file
+        :type path: str
+        """
+        if not is_pjtfile(path):
+            return cls._loadpjt_pickle(path)
+        header, eqs = load_pjt(path)
+        pjt = cls()
+        pjt.para.__dict__.update(header['para'])
+        pjt.stainfo.__dict__.update(header['stainfo'])
+        pjt.eqs = eqs
+        return pjt
+
+    @classmethod
+    def _loadpjt_pickle(cls, path):
         with open(path, 'rb') as f:
             rfdata = pickle.load(f)
-        pjt = cls(phase=rfdata['para'].phase)
+        pjt = cls()
         pjt.para = rfdata['para']
         if not exists(pjt.para.datapath):
             pjt.logger.RFlog.error('Data path {} was not found'.format(pjt.para.datapath))
@@ -321,6 +391,7 @@ class RF(object):
                 continue
         return pjt
 
+    @metrics.timed('rf.channel_correct', items=_n_eqs, count_before=True)
     def channel_correct(self):
         if self.para.switchEN or self.para.reverseN or self.para.reverseE:
             self.logger.RFlog.info('Correct components with switchEN: {}, reverseE: {}, reverseN: {}'.format(
@@ -328,6 +399,7 @@ class RF(object):
             for _, row in self.eqs.iterrows():
                 row['data'].channel_correct(self.para.switchEN, self.para.reverseE, self.para.reverseN)
         
+    @metrics.timed('rf.detrend', items=_n_eqs, count_before=True)
     def detrend(self):
         self.logger.RFlog.info('Detrend all data')
         drop_idx = []
@@ -339,6 +411,7 @@ class RF(object):
                 drop_idx.append(i)
         self.eqs.drop(drop_idx, inplace=True)
 
+    @metrics.timed('rf.filter', items=_n_eqs, count_before=True)
     def filter(self, freqmin=None, freqmax=None, order=4):
         if freqmin is None:
             freqmin = self.para.freqmin
@@ -348,11 +421,13 @@ class RF(object):
         for _, row in self.eqs.iterrows():
             row['data'].filter(freqmin=freqmin, freqmax=freqmax, order=order)
 
+    @metrics.timed('rf.cal_phase', items=_n_eqs, count_before=True)
     def cal_phase(self):
         self.logger.RFlog.info('Calculate {} arrivals and ray parameters for all data'.format(self.para.phase))
         for _, row in self.eqs.iterrows():
             row['data'].get_arrival(self.model, row['evdp'], row['dis'], phase=self.para.phase)
 
+    @metrics.timed('rf.baz_correct', items=_n_eqs, count_before=True)
     def baz_correct(self, time_b=10, time_e=20, offset=90, correct_angle=None):
         if correct_angle is not None:
             self.logger.RFlog.info('correct back-azimuth with {} deg.'.format(correct_angle))
@@ -376,14 +451,18 @@ class RF(object):
             # self._baz_confirm(offset, ampt_all)
             self.logger.RFlog.info('Average {:.1f} deg offset in back-azimuth'.format(self.baz_shift))
 
-    def rotate(self, search_inc=False):
+    def _rotate_method(self):
         targ_comp = ''.join(sorted(self.para.comp.upper()))
         if targ_comp == 'RTZ':
-            method='NE->RT'
+            return 'NE->RT'
         elif targ_comp == 'LQT':
-            method='ZNE->LQT'
+            return 'ZNE->LQT'
         else:
             raise ValueError('comp must be in RTZ or LQT.')
+
+    @metrics.timed('rf.rotate', items=_n_eqs, count_before=True)
+    def rotate(self, search_inc=False):
+        method = self._rotate_method()
         self.logger.RFlog.info('Rotate {0} phase to {1}'.format(self.para.phase, method))
         drop_idx = []
         for i, row in self.eqs.iterrows():
@@ -398,6 +477,7 @@ class RF(object):
                                        row['data'].datestr, row['data'].inc_correction))
         self.eqs.drop(drop_idx, inplace=True)
 
+    @metrics.timed('rf.drop_eq_snr', items=_n_eqs, count_before=True)
     def drop_eq_snr(self, length=None):
         if length is None:
             length = self.para.noiselen
@@ -411,6 +491,67 @@ class RF(object):
         self.eqs.drop(drop_lst, inplace=True)
         self.logger.RFlog.info('{0} events left after SNR calculation'.format(self.eqs.shape[0]))
 
+    @metrics.timed('rf.batch_qc', items=_n_eqs, count_before=True)
+    def batch_qc(self, length=None, drop_snr=True, prepick=False, stl=5, ltl=10):
+        """Screen all events with SNR and recursive STA/LTA in one call per sampling rate,
+        instead of trimming streams event by event.
+
+        :param length: Length of signal and noise windows for SNR in sec, defaults to ``noiselen``
+        :type length: float, optional
+        :param drop_snr: Whether to drop events with mean SNR of 3 components less than ``noisegate``, defaults to True
+        :type drop_snr: bool, optional
+        :param prepick: Whether to set ``trigger_shift`` of events with the STA/LTA trigger, defaults to False
+        :type prepick: bool, optional
+        :param stl: Length of short time average window in sec, defaults to 5
+        :type stl: float, optional
+        :param ltl: Length of long time average window in sec, defaults to 10
+        :type ltl: float, optional
+        """
+        if length is None:
+            length = self.para.noiselen
+        if drop_snr:
+            self.logger.RFlog.info('Reject data record with SNR less than {0}'.format(self.para.noisegate))
+        if prepick:
+            self.logger.RFlog.info('Pre-pick {} arrival using STA/LTA method'.format(self.para.phase))
+        time_before = max(length, self.para.time_before)
+        time_after = max(length, self.para.time_after)
+        trig_chan = '*Z' if self.para.phase[-1] == 'P' else '*T'
+        groups = {}
+        drop_lst = []
+        for i, row in self.eqs.iterrows():
+            deltas = set(tr.stats.delta for tr in row['data'].st)
+            if len(deltas) > 1:
+                # components of different sampling rates cannot be stacked in one window matrix
+                self.logger.RFlog.warning('Components of {} have different sampling intervals, '
+                                          'skipping QC'.format(row['data'].datestr))
+                if drop_snr:
+                    drop_lst.append(i)
+                continue
+            groups.setdefault(deltas.pop(), []).append(i)
+        for idx in groups.values():
+            eqs = self.eqs.loc[idx, 'data']
+            arrs = [eq.st[2].stats.starttime + eq.arr_correct(write_to_sac=False) + eq.trigger_shift for eq in eqs]
+            data = np.stack([qc.window_matrix([eq.st[j] for eq in eqs], arrs, time_before, time_after)[0]
+                             for j in range(3)], axis=1)
+            dt = eqs.iloc[0].st[0].stats.delta
+            trigger_data = None
+            if prepick:
+                trigger_data = qc.window_matrix([eq.st.select(channel=trig_chan)[0] for eq in eqs],
+                                             arrs, time_before, time_after)[0]
+            keep, _, trigger_shift = qc.batch_qc(data, dt, time_before, noiselen=length, noisegate=self.para.noisegate,
+                                                 trigger_data=trigger_data, trigger_before=self.para.time_before,
+                                                 trigger_after=self.para.time_after, stl=stl, ltl=ltl)
+            if drop_snr:
+                drop_lst += [i for i, k in zip(idx, keep) if not k]
+            if prepick:
+                for eq, arr, shift in zip(eqs, arrs, trigger_shift):
+                    eq.t_trigger = arr + shift
+                    eq.trigger_shift = shift
+        self.eqs.drop(drop_lst, inplace=True)
+        if drop_snr:
+            self.logger.RFlog.info('{0} events left after SNR calculation'.format(self.eqs.shape[0]))
+
+    @metrics.timed('rf.trim', items=_n_eqs, count_before=True)
     def trim(self):
         self.logger.RFlog.info('Trim waveforms from {0:.2f} before {2} to {1:.2f} after {2}'.format(
                                self.para.time_before, self.para.time_after, self.para.phase))
@@ -418,46 +559,60 @@ class RF(object):
             row['data'].trim(self.para.time_before, self.para.time_after)
     
     def pick(self, prepick=True, stl=5, ltl=10):
+        if self.streamed:
+            raise RuntimeError('Interactive picking is only available in the batch mode')
         if prepick:
-            self.logger.RFlog.info('Pre-pick {} arrival using STA/LTA method'.format(self.para.phase))
             for _, row in self.eqs.iterrows():
-                row['data'].phase_trigger(self.para.time_before, self.para.time_after,
-                                          stl=stl, ltl=ltl)
+                t1, t2 = row['data']._get_time(self.para.time_before, self.para.time_after)
+                row['data'].st_pick = row['data'].st.copy().trim(t1, t2)
+            self.batch_qc(drop_snr=False, prepick=True, stl=stl, ltl=ltl)
         self.logger.RFlog.info('{0} events left after virtual checking'.format(self.eqs.shape[0]))
         pickphase(self.eqs, self.para, self.logger)
 
+    def _deconv_event(self, eq, count, total):
+        eq.deconvolute(self.para.time_before, self.para.time_after, method=self.para.decon_method,
+                       f0=self.para.gauss, only_r=self.para.only_r, itmax=self.para.itmax,
+                       minderr=self.para.minderr, wlevel=self.para.wlevel, target_dt=self.para.target_dt)
+        if self.para.decon_method == 'iter':
+            self.logger.RFlog.info('Iterative Decon {0} ({3}/{4}) iterations: {1}; final RMS: {2:.4f}'.format(
+                eq.datestr, eq.rf[0].stats.iter, eq.rf[0].stats.rms[-1], count, total))
+        elif self.para.decon_method == 'water':
+            self.logger.RFlog.info('Water level Decon {} ({}/{}); RMS: {:.4f}'.format(
+                eq.datestr, count, total, eq.rf[0].stats.rms))
+
+    @metrics.timed('rf.deconv', items=_n_eqs, count_before=True)
     def deconv(self):
-        shift = self.para.time_before
-        time_after = self.para.time_after
         drop_lst = []
 
         count = 0
         for i, row in self.eqs.iterrows():
             count += 1
             try:
-                row['data'].deconvolute(shift, time_after, method=self.para.decon_method, f0=self.para.gauss,
-                                        only_r=self.para.only_r, itmax=self.para.itmax, minderr=self.para.minderr,
-                                        wlevel=self.para.wlevel, target_dt=self.para.target_dt)
-                if self.para.decon_method == 'iter':
-                    self.logger.RFlog.info('Iterative Decon {0} ({3}/{4}) iterations: {1}; final RMS: {2:.4f}'.format(
-                        row['data'].datestr, row['data'].rf[0].stats.iter,
-                        row['data'].rf[0].stats.rms[-1], count, self.eqs.shape[0]))
-                elif self.para.decon_method == 'water':
-                    self.logger.RFlog.info('Water level Decon {} ({}/{}); RMS: {:.4f}'.format(
-                        row['data'].datestr, count, self.eqs.shape[0], row['data'].rf[0].stats.rms))
+                self._deconv_event(row['data'], count, self.eqs.shape[0])
             except Exception as e:
                 self.logger.RFlog.error('{}: {}'.format(row['data'].datestr, e))
                 drop_lst.append(i)
         self.eqs.drop(drop_lst, inplace=True)
 
-    def saverf(self):
+    def _rf_shift(self):
         npts = int((self.para.time_before + self.para.time_after)/self.para.target_dt+1)
         if self.para.phase[-1] == 'P':
             shift = self.para.time_before
         elif self.para.phase[-1] == 'S':
             shift = self.para.time_after
         else:
-            pass
+            shift = None
+        return shift, npts
+
+    def _saverf_event(self, row, shift):
+        row['data'].saverf(self.para.rfpath, evtstr=row['date'].strftime('%Y.%j.%H.%M.%S'), shift=shift,
+                           evla=row['evla'], evlo=row['evlo'], evdp=row['evdp'], baz=row['bazi'],
+                           mag=row['mag'], gcarc=row['dis'], gauss=self.para.gauss, only_r=self.para.only_r,
+                           user9=self.baz_shift, kuser9='baz corr')
+
+    @metrics.timed('rf.saverf', items=_n_eqs, count_before=True)
+    def saverf(self):
+        shift, npts = self._rf_shift()
         good_lst = []
 
         if self.para.rmsgate is not None:
@@ -466,14 +621,82 @@ class RF(object):
             self.logger.RFlog.info('Save RFs with and criterion of {}'.format(self.para.criterion))
         for i, row in self.eqs.iterrows():
             if row['data'].judge_rf(shift, npts, criterion=self.para.criterion, rmsgate=self.para.rmsgate):
-                row['data'].saverf(self.para.rfpath, evtstr=row['date'].strftime('%Y.%j.%H.%M.%S'), shift=shift,
-                                   evla=row['evla'], evlo=row['evlo'], evdp=row['evdp'], baz=row['bazi'],
-                                   mag=row['mag'], gcarc=row['dis'], gauss=self.para.gauss, only_r=self.para.only_r,
-                                   user9=self.baz_shift, kuser9='baz corr')
+                self._saverf_event(row, shift)
                 good_lst.append(i)
         self.logger.RFlog.info('{} PRFs are saved.'.format(len(good_lst)))
         self.eqs = self.eqs.loc[good_lst]
 
+    def _read_events(self, eq_match):
+        for i, row, this_eq in iter_eq(eq_match, self.para.datapath, self.logger, suffix=self.para.suffix,
+                                       prefetch_workers=self.para.prefetch_workers,
+                                       prefetch_window=self.para.prefetch_window):
+            daz = distaz(self.stainfo.stla, self.stainfo.stlo, row['evla'], row['evlo'])
+            row['dis'] = daz.delta
+            row['bazi'] = daz.baz
+            row['data'] = this_eq
+            yield i, row
+
+    @metrics.timed('rf.stream', items=_n_eqs)
+    def stream(self, drop_snr=True, correct_angle=None, search_inc=False):
+        """Calculate RFs event by event to keep the memory bounded.
+
+        Each matched event is read and passed through channel correction, detrend, filter,
+        arrival calculation, SNR rejection, rotation, trim, deconvolution and RF judgement,
+        then the waveforms are released. Only the summary rows of saved RFs are kept in ``self.eqs``.
+        The back-azimuth can only be corrected with a fixed angle and interactive picking is
+        not available in this mode.
+
+        :param drop_snr: Whether to reject events with SNR less than ``noisegate``, defaults to True
+        :type drop_snr: bool, optional
+        :param correct_angle: Correct back-azimuth with this angle, defaults to None
+        :type correct_angle: float, optional
+        :param search_inc: Whether to grid search incidence angle, defaults to False
+        :type search_inc: bool, optional
+        """
+        self.streamed = True
+        method = self._rotate_method()
+        shift, npts = self._rf_shift()
+        if correct_angle is not None:
+            self.logger.RFlog.info('correct back-azimuth with {} deg.'.format(correct_angle))
+        self.logger.RFlog.info('Match SAC files')
+        eq_match = match_sac_files(self.eq_lst, self.para.datapath, ref_comp=self.para.ref_comp,
+                                   suffix=self.para.suffix, offset=self.para.offset,
+                                   tolerance=self.para.tolerance, dateformat=self.para.dateformat)
+        if eq_match.shape[0] == 0:
+            self.logger.RFlog.warning('No earthquakes matched, please check configurations.')
+            sys.exit(1)
+        self.logger.RFlog.info('{0} earthquakes are matched, calculating RFs event by event'.format(
+                               eq_match.shape[0]))
+        rows = []
+        index = []
+        count = 0
+        for i, row in self._read_events(eq_match):
+            count += 1
+            this_eq = row['data']
+            with metrics.stage('rf.stream.event', items=1, label=this_eq.datestr):
+                try:
+                    this_eq.channel_correct(self.para.switchEN, self.para.reverseE, self.para.reverseN)
+                    this_eq.detrend()
+                    this_eq.filter(freqmin=self.para.freqmin, freqmax=self.para.freqmax)
+                    this_eq.get_arrival(self.model, row['evdp'], row['dis'], phase=self.para.phase)
+                    if drop_snr and np.mean(this_eq.snr(length=self.para.noiselen)) < self.para.noisegate:
+                        continue
+                    if correct_angle is not None:
+                        row['bazi'] = np.mod(row['bazi'] + correct_angle, 360)
+                    this_eq.rotate(row['bazi'], method=method, search_inc=search_inc, baz_shift=self.baz_shift)
+                    this_eq.trim(self.para.time_before, self.para.time_after)
+                    self._deconv_event(this_eq, count, eq_match.shape[0])
+                    if this_eq.judge_rf(shift, npts, criterion=self.para.criterion, rmsgate=self.para.rmsgate):
+                        self._saverf_event(row, shift)
+                        rows.append(row)
+                        index.append(i)
+                except Exception as e:
+                    self.logger.RFlog.error('{}: {}'.format(this_eq.datestr, e))
+                finally:
+                    this_eq.cleanstream()
+        self.eqs = pd.DataFrame(rows, index=index)
+        self.logger.RFlog.info('{} PRFs are saved.'.format(len(rows)))
+
 
 def setpar():
     parser = argparse.ArgumentParser(description="Set parameters to configure file")
@@ -2,10 +2,13 @@ from seispy.rfcorrect import RFStation, psrf2depth, Mod3DPerturbation, psrf_1D_r
     psrf_3D_migration, time2depth, psrf_3D_raytracing
 import numpy as np
 from seispy.ccppara import ccppara
+from seispy.psrayp import load_rayp_lib
+from seispy.metrics import metrics
 from seispy.setuplog import setuplog
 from seispy.geo import latlon_from, deg2km, rad2deg
 from os.path import join, dirname, exists
 import argparse
+import atexit
 import sys
 import glob
 
@@ -70,44 +73,45 @@ def makedata(cpara, velmod3d=None, modfolder1d=None, log=setuplog()):
 
     # cpara = ccppara(cfg_file)
     sta_info = Station(cpara.stalist)
+    srayp = None if cpara.rayp_lib is None else load_rayp_lib(cpara.rayp_lib)
     RFdepth = []
     for i in range(sta_info.stla.shape[0]):
-        rfdep = {}
-        evt_lst = join(cpara.rfpath, sta_info.station[i], sta_info.station[i] + 'finallist.dat')
-        stadatar = RFStation(evt_lst, only_r=True)
-        stadatar.stel = sta_info.stel[i]
-        stadatar.stla = sta_info.stla[i]
-        stadatar.stlo = sta_info.stlo[i]
-        log.RF2depthlog.info('the {}th/{} station with {} events'.format(i + 1, sta_info.stla.shape[0], stadatar.ev_num))
-        piercelat = np.zeros([stadatar.ev_num, cpara.depth_axis.shape[0]])
-        piercelon = np.zeros([stadatar.ev_num, cpara.depth_axis.shape[0]])
-        if stadatar.prime_phase == 'P':
-            sphere = True
-        else:
-            sphere = False
-        if ismod1d:
-            if modfolder1d is not None:
-                velmod = _load_mod(modfolder1d, sta_info.station[i])
+        with metrics.stage('makedata.station', label=sta_info.station[i]) as st:
+            rfdep = {}
+            evt_lst = join(cpara.rfpath, sta_info.station[i], sta_info.station[i] + 'finallist.dat')
+            stadatar = RFStation(evt_lst, only_r=True, dtype=cpara.dtype)
+            stadatar.stel = sta_info.stel[i]
+            stadatar.stla = sta_info.stla[i]
+            stadatar.stlo = sta_info.stlo[i]
+            st.items = stadatar.ev_num
+            log.RF2depthlog.info('the {}th/{} station with {} events'.format(i + 1, sta_info.stla.shape[0], stadatar.ev_num))
+            if stadatar.prime_phase == 'P':
+                sphere = True
             else:
-                velmod = cpara.velmod
-        PS_RFdepth, end_index, x_s, _ = psrf2depth(stadatar, cpara.depth_axis,
-                            velmod=velmod, srayp=cpara.rayp_lib, sphere=sphere, phase=cpara.phase)
-        for j in range(stadatar.ev_num):
-            piercelat[j], piercelon[j] = latlon_from(sta_info.stla[i], sta_info.stlo[i],
-                                                     stadatar.bazi[j], rad2deg(x_s[j]))
-        rfdep['station'] = sta_info.station[i]
-        rfdep['stalat'] = sta_info.stla[i]
-        rfdep['stalon'] = sta_info.stlo[i]
-        rfdep['depthrange'] = cpara.depth_axis
-        # rfdep['events'] = _convert_str_mat(stadatar.event)
-        rfdep['bazi'] = stadatar.bazi
-        rfdep['rayp'] = stadatar.rayp
-        # rfdep['phases'] = stadatar.phase[i]
-        rfdep['moveout_correct'] = PS_RFdepth
-        rfdep['piercelat'] = piercelat
-        rfdep['piercelon'] = piercelon
-        rfdep['stopindex'] = end_index
-        RFdepth.append(rfdep)
+                sphere = False
+            if ismod1d:
+                if modfolder1d is not None:
+                    velmod = _load_mod(modfolder1d, sta_info.station[i])
+                else:
+                    velmod = cpara.velmod
+            PS_RFdepth, end_index, x_s, _ = psrf2depth(stadatar, cpara.depth_axis,
+                                velmod=velmod, srayp=srayp, sphere=sphere, phase=cpara.phase,
+                                lut=cpara.rayp_lut)
+            piercelat, piercelon = latlon_from(sta_info.stla[i], sta_info.stlo[i],
+                                               stadatar.bazi[:, np.newaxis], rad2deg(x_s), dtype=x_s.dtype)
+            rfdep['station'] = sta_info.station[i]
+            rfdep['stalat'] = sta_info.stla[i]
+            rfdep['stalon'] = sta_info.stlo[i]
+            rfdep['depthrange'] = cpara.depth_axis
+            # rfdep['events'] = _convert_str_mat(stadatar.event)
+            rfdep['bazi'] = stadatar.bazi
+            rfdep['rayp'] = stadatar.rayp
+            # rfdep['phases'] = stadatar.phase[i]
+            rfdep['moveout_correct'] = PS_RFdepth
+            rfdep['piercelat'] = piercelat
+            rfdep['piercelon'] = piercelon
+            rfdep['stopindex'] = end_index
+            RFdepth.append(rfdep)
     # savemat(cpara.depthdat, {'RFdepth': RFdepth})
     np.save(cpara.depthdat, RFdepth)
 
@@ -115,44 +119,43 @@ def makedata(cpara, velmod3d=None, modfolder1d=None, log=setuplog()):
 def makedata3d(cpara, velmod3d, log=setuplog(), raytracing3d=True):
     mod3d = Mod3DPerturbation(velmod3d, cpara.depth_axis, velmod=cpara.velmod)
     sta_info = Station(cpara.stalist)
-    if cpara.rayp_lib is not None:
-        srayp = np.load(cpara.rayp_lib)
-    else:
-        srayp = None
+    srayp = None if cpara.rayp_lib is None else load_rayp_lib(cpara.rayp_lib)
     RFdepth = []
     for i in range(sta_info.stla.shape[0]):
-        rfdep = {}
-        evt_lst = join(cpara.rfpath, sta_info.station[i], sta_info.station[i] + 'finallist.dat')
-        stadatar = RFStation(evt_lst, only_r=True)
-        stadatar.stel = sta_info.stel[i]
-        stadatar.stla = sta_info.stla[i]
-        stadatar.stlo = sta_info.stlo[i]
-        if stadatar.prime_phase == 'P':
-            sphere = True
-        else:
-            sphere = False
-        log.RF2depthlog.info('the {}th/{} station with {} events'.format(i + 1, sta_info.stla.shape[0], stadatar.ev_num))
-        if raytracing3d:
-            pplat_s, pplon_s, pplat_p, pplon_p, newtpds = psrf_3D_raytracing(stadatar, cpara.depth_axis, mod3d, srayp=srayp, sphere=sphere)
-        else:
-            pplat_s, pplon_s, pplat_p, pplon_p, raylength_s, raylength_p, tps = psrf_1D_raytracing(
-                stadatar, cpara.depth_axis, srayp=srayp, sphere=sphere, phase=cpara.phase)
-            newtpds = psrf_3D_migration(pplat_s, pplon_s, pplat_p, pplon_p, raylength_s, raylength_p,
-                                        tps, cpara.depth_axis, mod3d)
-        amp3d, end_index = time2depth(stadatar, cpara.depth_axis, newtpds)
-        rfdep['station'] = sta_info.station[i]
-        rfdep['stalat'] = sta_info.stla[i]
-        rfdep['stalon'] = sta_info.stlo[i]
-        rfdep['depthrange'] = cpara.depth_axis
-        # rfdep['events'] = _convert_str_mat(stadatar.event)
-        rfdep['bazi'] = stadatar.bazi
-        rfdep['rayp'] = stadatar.rayp
-        # rfdep['phases'] = _convert_str_mat(stadatar.phase)
-        rfdep['moveout_correct'] = amp3d
-        rfdep['piercelat'] = pplat_s
-        rfdep['piercelon'] = pplon_s
-        rfdep['stopindex'] = end_index
-        RFdepth.append(rfdep)
+        with metrics.stage('makedata3d.station', label=sta_info.station[i]) as st:
+            rfdep = {}
+            evt_lst = join(cpara.rfpath, sta_info.station[i], sta_info.station[i] + 'finallist.dat')
+            stadatar = RFStation(evt_lst, only_r=True, dtype=cpara.dtype)
+            stadatar.stel = sta_info.stel[i]
+            stadatar.stla = sta_info.stla[i]
+            stadatar.stlo = sta_info.stlo[i]
+            st.items = stadatar.ev_num
+            if stadatar.prime_phase == 'P':
+                sphere = True
+            else:
+                sphere = False
+            log.RF2depthlog.info('the {}th/{} station with {} events'.format(i + 1, sta_info.stla.shape[0], stadatar.ev_num))
+            if raytracing3d:
+                pplat_s, pplon_s, pplat_p, pplon_p, newtpds = psrf_3D_raytracing(stadatar, cpara.depth_axis, mod3d, srayp=srayp, sphere=sphere)
+            else:
+                pplat_s, pplon_s, pplat_p, pplon_p, raylength_s, raylength_p, tps = psrf_1D_raytracing(
+                    stadatar, cpara.depth_axis, srayp=srayp, sphere=sphere, phase=cpara.phase)
+                newtpds = psrf_3D_migration(pplat_s, pplon_s, pplat_p, pplon_p, raylength_s, raylength_p,
+                                            tps, cpara.depth_axis, mod3d)
+            amp3d, end_index = time2depth(stadatar, cpara.depth_axis, newtpds)
+            rfdep['station'] = sta_info.station[i]
+            rfdep['stalat'] = sta_info.stla[i]
+            rfdep['stalon'] = sta_info.stlo[i]
+            rfdep['depthrange'] = cpara.depth_axis
+            # rfdep['events'] = _convert_str_mat(stadatar.event)
+            rfdep['bazi'] = stadatar.bazi
+            rfdep['rayp'] = stadatar.rayp
+            # rfdep['phases'] = _convert_str_mat(stadatar.phase)
+            rfdep['moveout_correct'] = amp3d
+            rfdep['piercelat'] = pplat_s.astype(cpara.dtype, copy=False)
+            rfdep['piercelon'] = pplon_s.astype(cpara.dtype, copy=False)
+            rfdep['stopindex'] = end_index
+            RFdepth.append(rfdep)
     np.save(cpara.depthdat, RFdepth)
 
 
@@ -165,10 +168,14 @@ def rf2depth():
     parser.add_argument('-r', help='Path to 3d vel model in npz file for 3D ray tracing',
                         metavar='3d_velmodel_path', type=str, default='')
     parser.add_argument('cfg_file', type=str, help='Path to configure file')
+    parser.add_argument('--metrics', help='Write timing metrics of processing stages to a JSON or CSV file',
+                        metavar='metrics_file', default=None)
     arg = parser.parse_args()
     if len(sys.argv) == 1:
         parser.print_help()
         sys.exit(1)
+    if arg.metrics is not None:
+        atexit.register(metrics.dump, arg.metrics)
     cpara = ccppara(arg.cfg_file)
     if arg.d != '' and arg.r != '':
         raise ValueError('Specify only 1 argument in \'-d\' and \'-r\'')
@@ -1,10 +1,7 @@
 import numpy as np
 from obspy.io.sac import SACTrace
-from matplotlib.ticker import MultipleLocator
-import matplotlib.pyplot as plt
 from os.path import join, abspath, dirname
 from seispy.geo import cosd, sind, extrema
-from scipy.interpolate import griddata
 from seispy.utils import load_cyan_map
 
 
@@ -27,7 +24,8 @@ def average_delay(fd, td):
 
 
 class RFAni():
-    def __init__(self, sacdatar, tb, te, tlen=3, val=10, rayp=0.06, model='iasp91'):
+    def __init__(self, sacdatar, tb, te, tlen=3, val=10, rayp=0.06, model='iasp91',
+                 dt_step=0.05, fvd_step=5, dt_max=1.5):
         self.tb = tb
         self.te = te
         self.tlen = tlen
@@ -40,7 +38,7 @@ class RFAni():
         self.search_peak_amp()
         # self.para = readpara(para=join(path, 'raysum-params'))
         # self.baz, self.datar, self.datat = readrf(path, self.para, join(path, 'sample.geom'))
-        self.init_ani_para()
+        self.init_ani_para(dt_step=dt_step, fvd_step=fvd_step, dt_max=dt_max)
         self.fvd, self.deltat = np.meshgrid(self.fvd_1d, self.deltat_1d)
 
     def baz_stack(self, val=10):
@@ -66,66 +64,97 @@ class RFAni():
         self.nb = int(nps - self.tlen / self.sacdatar.sampling)
         self.ne = int(nps + self.tlen / self.sacdatar.sampling)
 
-    def init_ani_para(self):
-        self.deltat_1d = np.arange(0, 1.55, 0.05)
-        self.fvd_1d = np.arange(0, 365, 5)
+    def init_ani_para(self, dt_step=0.05, fvd_step=5, dt_max=1.5):
+        """Grid of delay times from 0 to ``dt_max`` and fast velocity directions from 0 to 360 deg
 
-    def cut_energy_waveform(self, idx, nb, ne):
-        engr = np.zeros([nb.shape[0], nb.shape[1], self.ne-self.nb])
-        for i in range(nb.shape[0]):
-            for j in range(nb.shape[1]):
-                engr[i, j, :] = self.rfr_baz[idx, nb[i, j]:ne[i, j]]
-        return engr
+        :param dt_step: Step of delay time in sec, defaults to 0.05
+        :type dt_step: float, optional
+        :param fvd_step: Step of fast velocity direction in deg, defaults to 5
+        :type fvd_step: float, optional
+        :param dt_max: Maximum delay time in sec, defaults to 1.5
+        :type dt_max: float, optional
+        """
+        self.deltat_1d = np.arange(0, dt_max + dt_step / 2, dt_step)
+        self.fvd_1d = np.arange(0, 360 + fvd_step / 2, fvd_step)
+        fvd, deltat = np.meshgrid(self.fvd_1d, self.deltat_1d, indexing='ij')
+        self.ani_points = np.column_stack((fvd.ravel(), deltat.ravel()))
 
-    def radial_energy_max(self):
-        energy = np.zeros([self.fvd.shape[0], self.fvd.shape[1], self.ne-self.nb])
-        # tmp_data = np.zeros(self.ne-self.nb)
-        for i, baz in enumerate(self.stack_range):
-            t_corr = (self.deltat / 2) * cosd(2 * (self.fvd - baz))
+    def radial_energy_max(self, chunk=4096):
+        """R cosine energy of all grid points, gathering time shifted windows of all back-azimuths
+        with one index tensor per chunk of grid points.
+
+        :param chunk: Number of grid points evaluated at once, defaults to 4096
+        :type chunk: int, optional
+        :return: Energy in shape of ``(deltat_1d.size, fvd_1d.size)``
+        :rtype: numpy.ndarray
+        """
+        nwin = self.ne - self.nb
+        fvd = self.fvd.ravel()
+        deltat = self.deltat.ravel()
+        energy = np.zeros(fvd.size)
+        win = np.arange(self.nb, self.ne)
+        for b in range(0, fvd.size, chunk):
+            t_corr = (deltat[b:b+chunk] / 2) * cosd(2 * (fvd[b:b+chunk] - self.stack_range[:, np.newaxis]))
             nt_corr = (t_corr / self.sacdatar.sampling).astype(int)
-            new_nb = self.nb - nt_corr
-            new_ne = self.ne - nt_corr
-            energy += self.cut_energy_waveform(i, new_nb, new_ne)
-        energy = np.max(energy ** 2, axis=2)
+            idx = (win - nt_corr[:, :, np.newaxis]).reshape(self.stack_range.size, -1)
+            engr = np.take_along_axis(self.rfr_baz, idx, axis=1).reshape(self.stack_range.size, -1, nwin)
+            energy[b:b+chunk] = np.max(np.sum(engr, axis=0) ** 2, axis=1)
+        energy = energy.reshape(self.fvd.shape)
         energy /= np.max(np.sum(self.rfr_baz[:, self.nb:self.ne], axis=0)**2)
         return energy
 
-    def xyz2grd(self, energy):
-        self.fvd, self.deltat = np.meshgrid(self.fvd_1d, self.deltat_1d)
-        return griddata(self.ani_points, energy, (self.fvd, self.deltat))
+    def rotate_to_fast_slow(self, chunk=32):
+        """R cross-correlation and T energy of all grid points after correcting the splitting.
+
+        Waveforms of all delay times are gathered at once, and the rotation to fast/slow directions
+        and back is expanded in sine and cosine of ``fvd - baz`` so that fast velocity directions
+        are evaluated with ``einsum``, ``chunk`` directions at a time.
 
-    def rotate_to_fast_slow(self):
-        self.ani_points = np.empty([0, 2])
-        for f in self.fvd_1d:
-            for d in self.deltat_1d:
-                self.ani_points = np.vstack((self.ani_points, np.array([f, d])))
-        energy_cc = np.zeros(self.ani_points.shape[0])
-        energy_tc = np.zeros(self.ani_points.shape[0])
+        :param chunk: Number of fast velocity directions evaluated at once, defaults to 32
+        :type chunk: int, optional
+        :return: Energy of R cross-correlation and T energy in shape of ``(deltat_1d.size, fvd_1d.size)``
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
         raw_energy_r = np.sum(np.sum(self.rfr_baz[:, self.nb:self.ne], axis=0) ** 2 - np.sum(self.rfr_baz[:, self.nb:self.ne] ** 2, axis=0))
         raw_energy_t = np.sum(np.sum(self.rft_baz[:, self.nb:self.ne] ** 2, axis=0))
-        for i, point in enumerate(self.ani_points):
-            nt_corr = (point[1]/2 / self.sacdatar.sampling).astype(int)
-            nt_fast = np.arange(self.nb, self.ne) + nt_corr
-            nt_slow = np.arange(self.nb, self.ne) - nt_corr
-            fcr = np.zeros(self.ne-self.nb)
-            fcr_sq = np.zeros(self.ne-self.nb)
-            fct = 0
-            for j, baz in enumerate(self.stack_range):
-                data_fast = self.rfr_baz[j, nt_slow] * cosd(point[0] - baz) + self.rft_baz[j, nt_slow] * sind(point[0] - baz)
-                data_slow = -self.rfr_baz[j, nt_fast] * sind(point[0] - baz) + self.rft_baz[j, nt_fast] * cosd(point[0] - baz)
-                back_rotate_data_r = data_fast * cosd(point[0] - baz) - data_slow * sind(point[0] - baz)
-                back_rotate_data_t = data_fast * sind(point[0] - baz) + data_slow * cosd(point[0] - baz)
-                fcr += back_rotate_data_r
-                fcr_sq += back_rotate_data_r ** 2
-                # print(np.sum(back_rotate_data_t ** 2), np.sum(self.rft_baz[j, self.nb:self.ne] ** 2))
-                fct += np.sum(back_rotate_data_t ** 2)
-            energy_cc[i] = np.sum(fcr ** 2 - fcr_sq) / raw_energy_r
-            energy_tc[i] = fct/ raw_energy_t
-        # energy_cc /= np.max(np.abs(energy_cc))
+        nt_corr = (self.deltat_1d / 2 / self.sacdatar.sampling).astype(int)
+        win = np.arange(self.nb, self.ne)
+        nt_fast = win + nt_corr[:, np.newaxis]
+        nt_slow = win - nt_corr[:, np.newaxis]
+        # (baz, deltat, time)
+        r_slow = self.rfr_baz[:, nt_slow]
+        r_fast = self.rfr_baz[:, nt_fast]
+        t_slow = self.rft_baz[:, nt_slow]
+        t_fast = self.rft_baz[:, nt_fast]
+        d_t = t_slow - t_fast
+        d_r = r_slow - r_fast
+        # sums over time of products in the squares of back rotated R and T, in shape of (baz, deltat)
+        prod_r = [np.sum(x * y, axis=2) for x, y in ((r_slow, r_slow), (r_fast, r_fast), (d_t, d_t),
+                                                     (r_slow, r_fast), (r_slow, d_t), (r_fast, d_t))]
+        prod_t = [np.sum(x * y, axis=2) for x, y in ((d_r, d_r), (t_slow, t_slow), (t_fast, t_fast),
+                                                     (d_r, t_slow), (d_r, t_fast), (t_slow, t_fast))]
+        energy_cc = np.zeros((self.fvd_1d.size, self.deltat_1d.size))
+        energy_tc = np.zeros((self.fvd_1d.size, self.deltat_1d.size))
+        for b in range(0, self.fvd_1d.size, chunk):
+            theta = self.fvd_1d[b:b+chunk, np.newaxis] - self.stack_range
+            c = cosd(theta)
+            s = sind(theta)
+            # back rotated R = c^2*r_slow + s^2*r_fast + cs*(t_slow-t_fast)
+            # back rotated T = cs*(r_slow-r_fast) + s^2*t_slow + c^2*t_fast
+            fcr = np.einsum('fb,bdk->fdk', c**2, r_slow) + np.einsum('fb,bdk->fdk', s**2, r_fast) + \
+                np.einsum('fb,bdk->fdk', c*s, d_t)
+            w_r = (c**4, s**4, c**2*s**2, 2*c**2*s**2, 2*c**3*s, 2*c*s**3)
+            w_t = (c**2*s**2, s**4, c**4, 2*c*s**3, 2*c**3*s, 2*c**2*s**2)
+            fcr_sq = sum(w @ p for w, p in zip(w_r, prod_r))
+            fct = sum(w @ p for w, p in zip(w_t, prod_t))
+            energy_cc[b:b+chunk] = (np.sum(fcr ** 2, axis=2) - fcr_sq) / raw_energy_r
+            energy_tc[b:b+chunk] = fct / raw_energy_t
         energy_tc /= np.max(np.abs(energy_tc))
-        return self.xyz2grd(energy_cc), self.xyz2grd(energy_tc)
+        return energy_cc.T, energy_tc.T
 
     def plot_stack_baz(self, enf=60, outpath='./'):
+        import matplotlib.pyplot as plt
+        from matplotlib.ticker import MultipleLocator
         ml = MultipleLocator(5)
         bound = np.zeros_like(self.sacdatar.time_axis)
         plt.style.use("bmh")
@@ -172,6 +201,8 @@ class RFAni():
         fig.savefig(join(outpath, '{}_baz_stack.png'.format(self.sacdatar.staname)), dpi=400, bbox_inches='tight')
 
     def plot_correct(self, fvd=0, dt=0.44, enf=80, outpath=None):
+        import matplotlib.pyplot as plt
+        from matplotlib.ticker import MultipleLocator
         nt_corr = int((dt/2 / self.sacdatar.sampling))
         # nt_fast = np.arange(self.nb, self.ne) + nt_corr
         # nt_slow = np.arange(self.nb, self.ne) - nt_corr
@@ -241,7 +272,7 @@ class RFAni():
         self.bf, self.bt = self.search_peak(self.energy_joint, opt='max')
         return self.bf, self.bt
 
-    def plot_polar(self, cmap=load_cyan_map(), show=False, outpath='./'):
+    def plot_polar(self, cmap=None, show=False, outpath='./'):
         """Polar map of crustal anisotropy inverted by a joint method. See Liu and Niu (2012, doi: 10.1111/j.1365-246X.2011.05249.x) in detail.
 
         :param cmap: Colormap of matplotlib, defaults to 'rainbow'
@@ -251,6 +282,9 @@ class RFAni():
         :param outpath: Output path to saving the figure. If show the figure in the Matplotlib window, this option will be invalid, defaults to current directory.
         :type outpath: str, optional
         """
+        import matplotlib.pyplot as plt
+        if cmap is None:
+            cmap = load_cyan_map()
         fig, axes = plt.subplots(2, 2, figsize=(8, 7), subplot_kw={'projection': 'polar'}, constrained_layout=True)
         axs = [axes[0, 0], axes[0, 1], axes[1, 0], axes[1, 1]]
         energy_all = [self.energy_r, self.energy_cc, self.energy_tc, self.energy_joint]
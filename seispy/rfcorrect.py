@@ -6,17 +6,18 @@ from scipy.signal import resample
 from os.path import dirname, join, exists, basename, isfile, abspath
 from seispy.geo import skm2srad, sdeg2skm, rad2deg, latlon_from, \
                        asind, tand, srad2skm, km2deg
-from seispy.psrayp import get_psrayp
+from seispy.psrayp import load_rayp_lib
 from seispy.rfani import RFAni
 from seispy.slantstack import SlantStack
 from seispy.harmonics import Harmonics
 from seispy.utils import DepModel, Mod3DPerturbation
 import warnings
 import glob
+from functools import lru_cache
 
 
 class RFStation(object):
-    def __init__(self, data_path, only_r=False, prime_comp='R'):
+    def __init__(self, data_path, only_r=False, prime_comp='R', dtype=None):
         """
         Class for derivative process of RFs.
 
@@ -26,6 +27,9 @@ class RFStation(object):
         :type only_r: bool, optional
         :param prime_comp: Prime component in RF filename. ``R`` or ``Q`` for PRF and ``L`` or ``Z`` for SRF
         :type prime_comp: str
+        :param dtype: Data type of RFs, e.g., ``np.float32`` as stored in SAC files to halve the memory,
+                      defaults to float64
+        :type dtype: numpy.dtype, optional
 
         .. warning::
 
@@ -34,6 +38,7 @@ class RFStation(object):
         
         self.only_r = only_r
         self.comp = prime_comp
+        self.data_dtype = np.dtype(np.float64 if dtype is None else dtype)
         self._chech_comp()
         if isfile(data_path):
             data_path = dirname(abspath(data_path))
@@ -52,9 +57,9 @@ class RFStation(object):
         self.rayp = skm2srad(self.rayp)
         self.ev_num = self.evla.shape[0]
         self.read_sample(data_path)
-        self.__dict__['data{}'.format(self.comp.lower())] = np.empty([self.ev_num, self.rflength])
+        self.__dict__['data{}'.format(self.comp.lower())] = np.empty([self.ev_num, self.rflength], dtype=self.data_dtype)
         if not only_r:
-            self.datat = np.empty([self.ev_num, self.rflength])
+            self.datat = np.empty([self.ev_num, self.rflength], dtype=self.data_dtype)
             for _i, evt, ph in zip(range(self.ev_num), self.event, self.phase):
                 sac = SACTrace.read(join(data_path, evt + '_' + ph + '_{}.sac'.format(self.comp)))
                 sact = SACTrace.read(join(data_path, evt + '_' + ph + '_T.sac'))
@@ -113,14 +118,13 @@ class RFStation(object):
         if method == 'single':
             maxamp = np.nanmax(np.abs(self.__dict__['data{}'.format(self.comp.lower())]), axis=1)
         elif method == 'average':
-            amp = np.nanmax(np.abs(np.mean(self.__dict__['data{}'.format(self.comp.lower())], axis=0)))
+            amp = np.nanmax(np.abs(np.mean(self.__dict__['data{}'.format(self.comp.lower())], axis=0, dtype=np.float64)))
             maxamp = np.ones(self.ev_num) * amp
         else:
             raise ValueError('\'method\' must be in \'single\' and \'average\'')
-        for i in range(self.ev_num):
-            self.__dict__['data{}'.format(self.comp.lower())][i] /= maxamp[i]
-            if not self.only_r:
-                self.datat[i] /= maxamp[i]
+        self.__dict__['data{}'.format(self.comp.lower())] /= maxamp[:, np.newaxis]
+        if not self.only_r:
+            self.datat /= maxamp[:, np.newaxis]
 
     def resample(self, dt):
         """Resample RFs with specified dt
@@ -133,9 +137,9 @@ class RFStation(object):
         """
         npts = int(self.rflength * (self.sampling / dt)) + 1
         self.__dict__['data{}'.format(self.comp.lower())] = resample(
-            self.__dict__['data{}'.format(self.comp.lower())], npts, axis=1)
+            self.__dict__['data{}'.format(self.comp.lower())], npts, axis=1).astype(self.data_dtype, copy=False)
         if not self.only_r:
-            self.datat = resample(self.datat, npts, axis=1)
+            self.datat = resample(self.datat, npts, axis=1).astype(self.data_dtype, copy=False)
         self.sampling = dt
         self.rflength = npts
         self.time_axis = np.arange(npts) * dt - self.shift
@@ -254,7 +258,7 @@ class RFStation(object):
         return rfdepth
 
     def jointani(self, tb, te, tlen=3., stack_baz_val=10, rayp=0.06,
-                 velmodel='iasp91', weight=[0.4, 0.4, 0.2]):
+                 velmodel='iasp91', weight=[0.4, 0.4, 0.2], dt_step=0.05, fvd_step=5):
         """Eastimate crustal anisotropy with a joint method. See Liu and Niu (2012, doi: 10.1111/j.1365-246X.2011.05249.x) in detail.
 
         :param tb: Time before Pms for search Ps peak
@@ -273,26 +277,41 @@ class RFStation(object):
         :type velmodel: str, optional
         :param weight: Weight for three different method, defaults to [0.4, 0.4, 0.2]
         :type weight: list, optional
+        :param dt_step: Grid step of time delay in sec, defaults to 0.05
+        :type dt_step: float, optional
+        :param fvd_step: Grid step of fast velocity direction in deg, defaults to 5
+        :type fvd_step: float, optional
         :return: Dominant fast velocity direction and time delay
         :rtype: list, list
         """
-        self.ani = RFAni(self, tb, te, tlen=tlen, rayp=rayp, model=velmodel)
+        self.ani = RFAni(self, tb, te, tlen=tlen, rayp=rayp, model=velmodel, dt_step=dt_step, fvd_step=fvd_step)
         self.ani.baz_stack(val=stack_baz_val)
         best_f, best_t = self.ani.joint_ani(weight=weight)
         return best_f, best_t
 
-    def slantstack(self, ref_dis=None, rayp_range=None, tau_range=None):
+    def slantstack(self, ref_dis=None, rayp_range=None, tau_range=None, method='time'):
         self.slant = SlantStack(self.__dict__['data{}'.format(self.comp.lower())], self.time_axis, self.dis)
-        self.slant.stack(ref_dis, rayp_range, tau_range)
+        self.slant.stack(ref_dis, rayp_range, tau_range, method=method)
         return self.slant.stack_amp
 
-    def harmonic(self, tb=-5, te=10):
+    def harmonic(self, tb=-5, te=10, method='qr', resample=None, n_boot=500, ci=95, seed=None):
         """Harmonic decomposition for extracting anisotropic and isotropic features from the radial and transverse RFs
 
         :param tb: Start time relative to P, defaults to -5
         :type tb: float, optional
         :param te: End time relative to P, defaults to 10
         :type te: float, optional
+        :param method: Solver of the least-squares problem, ``'qr'`` or ``'lsqr'``, defaults to 'qr'
+        :type method: str, optional
+        :param resample: ``'bootstrap'`` or ``'jackknife'`` to estimate confidence bands in
+                         ``self.harmo.harmonic_ci`` and ``self.harmo.unmodel_ci``, defaults to None
+        :type resample: str, optional
+        :param n_boot: Number of bootstrap resamples, defaults to 500
+        :type n_boot: int, optional
+        :param ci: Confidence level in percent, defaults to 95
+        :type ci: float, optional
+        :param seed: Seed of the random generator for bootstrap, defaults to None
+        :type seed: int, optional
 
         Returns
         -------
@@ -305,20 +324,24 @@ class RFStation(object):
         if self.only_r:
             raise ValueError('Transverse RFs are nessary for harmonic decomposition')
         self.harmo = Harmonics(self, tb, te)
-        self.harmo.harmo_trans()
+        self.harmo.harmo_trans(method=method)
+        if resample is not None:
+            self.harmo.resample_ci(n_boot=n_boot, method=resample, ci=ci, seed=seed)
         return self.harmo.harmonic_trans, self.harmo.unmodel_trans
 
 
 class SACStation(RFStation):
-    def __init__(self, data_path, only_r=False):
+    def __init__(self, data_path, only_r=False, dtype=None):
         """Class for derivative process of RFs.
 
         :param data_path: Path to RF data with SAC format. A finallist.dat must be in this path.
         :type data_path: str
         :param only_r: Wether only read R component, defaults to False
         :type only_r: bool, optional
+        :param dtype: Data type of RFs, defaults to float64
+        :type dtype: numpy.dtype, optional
         """
-        super().__init__(data_path, only_r=only_r)
+        super().__init__(data_path, only_r=only_r, dtype=dtype)
 
 
 def _imag2nan(arr):
@@ -353,46 +376,100 @@ def moveoutcorrect_ref(stadatar, raypref, YAxisRange,
     else:
         raise ValueError('Field \'datar\' or \'datal\' must be in the SACStation')
     dep_mod = DepModel(YAxisRange, velmod, stadatar.stel)
-    # x_s = np.zeros([stadatar.ev_num, YAxisRange.shape[0]])
-    # x_p = np.zeros([stadatar.ev_num, YAxisRange.shape[0]])
-    tps = np.zeros([stadatar.ev_num, YAxisRange.shape[0]])
-    for i in range(stadatar.ev_num):
-        tps[i], _, _ = xps_tps_map(dep_mod, stadatar.rayp[i], stadatar.rayp[i], sphere=sphere, phase=phase)
-    Tpds_ref, _, _ = xps_tps_map(dep_mod, raypref, raypref, sphere=sphere, phase=phase)
-    Newdatar = np.zeros([stadatar.ev_num, stadatar.rflength])
-    EndIndex = np.zeros(stadatar.ev_num)
-#
-    for i in range(stadatar.ev_num):
-        Newaxis = np.array([])
-        TempTpds = tps[i, :]
-        StopIndex = np.where(np.imag(TempTpds) == 1)[0]
-        if StopIndex.size == 0:
-            StopIndex = dep_mod.depths.shape[0]
-        EndIndex[i] = StopIndex - 1
-        Newaxis = np.append(Newaxis, np.append(np.arange(-shift, 0, sampling), 0))
-        for j in np.arange(int(shift / sampling + 1), stadatar.rflength):
-            Refaxis = j * sampling - shift
-            index = np.where(Refaxis <= tps[i, 0:StopIndex])[0]
-            if index.size == 0:
-                break
-            Ratio = (Tpds_ref[index[0]] - Tpds_ref[index[0] - 1]) / (tps[i, index[0]] - tps[i, index[0] - 1])
-            Newaxis = np.append(Newaxis, Tpds_ref[index[0] - 1] + (Refaxis - tps[i, index[0] - 1]) * Ratio)
-        endidx = Newaxis.shape[0]
-        x_new = np.arange(0, stadatar.rflength) * sampling - shift
-        Tempdata = interp1d(Newaxis, data[i, 0:endidx], bounds_error=False)(x_new)
-        endIndice = np.where(np.isnan(Tempdata))[0]
-        if endIndice.size == 0:
-            New_data = Tempdata
-        else:
-            New_data = np.append(Tempdata[1:endIndice[0]], data[i, endidx+1:])
-        if New_data.shape[0] < stadatar.rflength:
-            Newdatar[i] = np.append(New_data, np.zeros(stadatar.rflength - New_data.shape[0]))
-        else:
-            Newdatar[i] = New_data[0: stadatar.rflength]
+    rayp = np.asarray(stadatar.rayp, dtype=float)[:, np.newaxis]
+    # Ps times of turning rays are NaN and excluded by the valid mask below
+    with np.errstate(invalid='ignore'):
+        tps, _, _ = xps_tps_map(dep_mod, rayp, rayp, sphere=sphere, phase=phase)
+        Tpds_ref, _, _ = xps_tps_map(dep_mod, raypref, raypref, sphere=sphere, phase=phase)
+    Tpds_ref = np.real(Tpds_ref)
+    ev_num, rflength = data.shape[0], stadatar.rflength
+    ndep = tps.shape[1]
+    StopIndex = np.where((np.imag(tps) == 1).any(axis=1), np.argmax(np.imag(tps) == 1, axis=1), ndep)
+    EndIndex = (StopIndex - 1).astype(float)
+    tps = np.real(tps)
+
+    # new time axis before P is unchanged
+    head = np.append(np.arange(-shift, 0, sampling), 0)
+    j = np.arange(int(shift / sampling + 1), rflength)
+    Refaxis = j * sampling - shift
+    # For each event and time after P, find the first depth with Ps time not earlier than it.
+    # NaN times and times below the stop index are never selected, so they are replaced with
+    # ``hi`` later than all times, and the leading NaN times with ``lo`` earlier than all times.
+    col = np.arange(ndep)
+    valid = ~np.isnan(tps) & (col < StopIndex[:, np.newaxis])
+    has_valid = valid.any(axis=1)
+    first_valid = np.argmax(valid, axis=1)
+    last_valid = ndep - 1 - np.argmax(valid[:, ::-1], axis=1)
+    finite = tps[valid]
+    lo = min(Refaxis.min(), finite.min() if finite.size else 0) - 1
+    hi = max(Refaxis.max(), finite.max() if finite.size else 0) + 1
+    tps_sorted = np.where(col < first_valid[:, np.newaxis], lo, np.where(valid, tps, hi))
+    # Rows are in [lo, hi], so adding ``row * (hi - lo + 1)`` makes the raveled array sorted
+    # and one searchsorted finds the index in every row. Subtracting ``row * ndep`` gives the
+    # column index back.
+    offset = np.arange(ev_num)[:, np.newaxis] * (hi - lo + 1)
+    index = np.searchsorted((tps_sorted + offset).ravel(), (Refaxis + offset).ravel()).reshape(ev_num, -1)
+    index -= np.arange(ev_num)[:, np.newaxis] * ndep
+    # times later than the last valid Ps time are not mapped
+    last_tps = tps[np.arange(ev_num), last_valid]
+    nvalid = np.where(has_valid, np.sum(Refaxis <= last_tps[:, np.newaxis], axis=1), 0)
+    # times earlier than the Ps time at the first depth (with elevation) are extrapolated
+    # from the first two depths
+    index = np.clip(index, 1, ndep - 1)
+    prev = index - 1
+    tps_idx = np.take_along_axis(tps, index, axis=1)
+    tps_prev = np.take_along_axis(tps, prev, axis=1)
+    # equal or NaN Ps times only occur at indices not mapped below
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Ratio = (Tpds_ref[index] - Tpds_ref[prev]) / (tps_idx - tps_prev)
+    Newaxis = np.full((ev_num, head.size + j.size), np.inf)
+    Newaxis[:, :head.size] = head
+    Newaxis[:, head.size:] = np.where(np.arange(j.size) < nvalid[:, np.newaxis],
+                                      Tpds_ref[prev] + (Refaxis - tps_prev) * Ratio, np.inf)
+    endidx = head.size + nvalid
+
+    # Linear interpolation of all events at once, same as interp1d. Only the first ``lens``
+    # samples of each row of ``Newaxis`` are used, so the rest are set to ``bound`` later than
+    # all samples. Rows are then in [-bound, bound] and made sorted by the same row offsets as above.
+    x_new = np.arange(0, rflength) * sampling - shift
+    lens = np.minimum(endidx, rflength)
+    rows = np.arange(ev_num)[:, np.newaxis]
+    xq = Newaxis[:, :rflength].copy()
+    bound = np.max(np.abs(np.append(xq[np.isfinite(xq)], x_new))) + 1
+    xq[np.arange(rflength) >= lens[:, np.newaxis]] = bound
+    offset = rows * (2 * bound + 1)
+    x_new_idx = np.searchsorted((xq + offset).ravel(), (x_new + offset).ravel()).reshape(ev_num, -1) - rows * rflength
+    # index of the right end of the interval, points out of bounds are set to NaN below
+    x_new_idx = np.clip(x_new_idx, 1, np.maximum(lens - 1, 1)[:, np.newaxis])
+    x_lo = np.take_along_axis(Newaxis, x_new_idx - 1, axis=1)
+    x_hi = np.take_along_axis(Newaxis, x_new_idx, axis=1)
+    y_lo = np.take_along_axis(data, x_new_idx - 1, axis=1)
+    y_hi = np.take_along_axis(data, x_new_idx, axis=1)
+    # zero-width or unbounded intervals only occur at points set to NaN below
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (y_hi - y_lo) / (x_hi - x_lo)
+        Tempdata = slope * (x_new - x_lo) + y_lo
+    out_bounds = (x_new < Newaxis[:, :1]) | (x_new > np.take_along_axis(Newaxis, lens[:, np.newaxis] - 1, axis=1))
+    Tempdata[out_bounds] = np.nan
+
+    # Splice the rest of the raw trace after the first NaN and pad with zeros. Row ``i`` takes
+    # ``Tempdata[i, 1:endIndice]`` and then ``data[i, endidx+1:]`` as in the loop over events.
+    isnan = np.isnan(Tempdata)
+    endIndice = np.where(isnan.any(axis=1), np.argmax(isnan, axis=1), rflength)
+    pos = np.arange(rflength)
+    head_len = np.where(endIndice < rflength, np.maximum(endIndice - 1, 0), rflength)[:, np.newaxis]
+    src_tmp = np.where(endIndice[:, np.newaxis] < rflength, pos + 1, pos)
+    src_raw = pos - head_len + endidx[:, np.newaxis] + 1
+    from_tmp = pos < head_len
+    from_raw = ~from_tmp & (src_raw < rflength)
+    Newdatar = np.zeros([ev_num, rflength])
+    Newdatar[from_tmp] = np.take_along_axis(Tempdata, np.minimum(src_tmp, rflength - 1), axis=1)[from_tmp]
+    Newdatar[from_raw] = np.take_along_axis(data, np.clip(src_raw, 0, rflength - 1), axis=1)[from_raw]
     return Newdatar, EndIndex
 
 
-def psrf2depth(stadatar, YAxisRange, velmod='iasp91', srayp=None, normalize='single', sphere=True, phase=1):
+def psrf2depth(stadatar, YAxisRange, velmod='iasp91', srayp=None, normalize='single', sphere=True, phase=1,
+               dtype=None, lut=False):
     """ Time-to-depth conversion with S-wave backprojection.
 
     :param stadatar: Data class of RFStation
@@ -401,12 +478,19 @@ def psrf2depth(stadatar, YAxisRange, velmod='iasp91', srayp=None, normalize='sin
     :type YAxisRange: numpy.ndarray
     :param velmod: Velocity for conversion, whcih can be a path to velocity file, defaults to 'iasp91'
     :type velmod: str, optional
-    :param srayp: ray-parameter library of conversion phases. See :meth:`seispy.psrayp` in detail, defaults to None
-    :type srayp: str or :meth:`seispy.psrayp.PsRayp`, optional
+    :param srayp: ray-parameter library of conversion phases. See :meth:`seispy.psrayp` in detail. Ray-parameters
+                  of all RFs are looked up at once, defaults to None
+    :type srayp: str, numpy.lib.npyio.NpzFile or :meth:`seispy.psrayp.PsRaypLib`, optional
     :param normalize: method of normalization, defaults to 'single'. Please refer to :meth:`RFStation.normalize`
     :type normalize: str, optional
     :param sphere: Wether do earth-flattening transformation, defaults to True
     :type sphere: bool, optional
+    :param dtype: Data type of RFs in depth and horizontal distances, e.g., ``np.float32`` to halve the memory,
+                  defaults to the data type of RFs in ``stadatar``
+    :type dtype: numpy.dtype, optional
+    :param lut: Wether interpolate the ray-parameter lookup table of :meth:`rayp_table` instead of
+                tracing rays of each RF. Only used without ``srayp``, defaults to False
+    :type lut: bool, optional
 
     Returns
     ------------
@@ -441,26 +525,20 @@ def psrf2depth(stadatar, YAxisRange, velmod='iasp91', srayp=None, normalize='sin
     x_s = np.zeros([stadatar.ev_num, YAxisRange.shape[0]])
     x_p = np.zeros([stadatar.ev_num, YAxisRange.shape[0]])
     tps = np.zeros([stadatar.ev_num, YAxisRange.shape[0]])
-    if srayp is None:
+    if srayp is None and lut:
+        tps, x_s, x_p = rayp_table(dep_mod, sphere=sphere, phase=phase)(stadatar.rayp)
+    elif srayp is None:
         for i in range(stadatar.ev_num):
             tps[i], x_s[i], x_p[i] = xps_tps_map(dep_mod, stadatar.rayp[i], 
                 stadatar.rayp[i], sphere=sphere, phase=phase)
-    elif isinstance(srayp, str) or isinstance(srayp, np.lib.npyio.NpzFile):
-        if isinstance(srayp, str):
-            if not exists(srayp):
-                raise FileNotFoundError('Ps rayp lib file was not found')
-            else:
-                rayp_lib = np.load(srayp)
-        else:
-            rayp_lib = srayp
-        for i in range(stadatar.ev_num):
-            rayp = get_psrayp(rayp_lib, stadatar.dis[i], stadatar.evdp[i], dep_mod.depths_elev)
-            rayp = skm2srad(sdeg2skm(rayp))
-            tps[i], x_s[i], x_p[i] = xps_tps_map(dep_mod,
-                rayp, stadatar.rayp[i], sphere=sphere, phase=phase)
     else:
-        raise TypeError('srayp should be path to Ps rayp lib')
-    ps_rfdepth, endindex = time2depth(stadatar, dep_mod.depths, tps, normalize=normalize)
+        rayp_lib = load_rayp_lib(srayp)
+        rayp = skm2srad(sdeg2skm(rayp_lib(stadatar.dis, stadatar.evdp, dep_mod.depths_elev)))
+        tps, x_s, x_p = xps_tps_map(dep_mod, rayp, np.asarray(stadatar.rayp, dtype=float)[:, np.newaxis],
+                                    sphere=sphere, phase=phase)
+    ps_rfdepth, endindex = time2depth(stadatar, dep_mod.depths, tps, normalize=normalize, dtype=dtype)
+    x_s = x_s.astype(ps_rfdepth.dtype, copy=False)
+    x_p = x_p.astype(ps_rfdepth.dtype, copy=False)
     return ps_rfdepth, endindex, x_s, x_p
 
 
@@ -513,18 +591,102 @@ def xps_tps_map(dep_mod, srayp, prayp, is_raylen=False, sphere=True, phase=1):
     else:
         raise ValueError('Phase must be in 1 for Ps, 2 for PpPs, 3 for PsPs+PpSs')
     if dep_mod.elevation != 0:
-        x_s = interp1d(dep_mod.depths_elev, x_s, bounds_error=False, fill_value=(np.nan, x_s[-1]))(dep_mod.depths)
-        x_p = interp1d(dep_mod.depths_elev, x_p, bounds_error=False, fill_value=(np.nan, x_p[-1]))(dep_mod.depths)
-        tps = interp1d(dep_mod.depths_elev, tps, bounds_error=False, fill_value=(np.nan, tps[-1]))(dep_mod.depths)
+        x_s = interp1d(dep_mod.depths_elev, x_s, bounds_error=False, fill_value=(np.nan, x_s[..., -1]))(dep_mod.depths)
+        x_p = interp1d(dep_mod.depths_elev, x_p, bounds_error=False, fill_value=(np.nan, x_p[..., -1]))(dep_mod.depths)
+        tps = interp1d(dep_mod.depths_elev, tps, bounds_error=False, fill_value=(np.nan, tps[..., -1]))(dep_mod.depths)
         if is_raylen:
-            raylength_s = interp1d(dep_mod.depths_elev, raylength_s, bounds_error=False, fill_value=(np.nan, raylength_s[-1]))(dep_mod.depths)
-            raylength_p = interp1d(dep_mod.depths_elev, raylength_p, bounds_error=False, fill_value=(np.nan, raylength_p[-1]))(dep_mod.depths)         
+            raylength_s = interp1d(dep_mod.depths_elev, raylength_s, bounds_error=False, fill_value=(np.nan, raylength_s[..., -1]))(dep_mod.depths)
+            raylength_p = interp1d(dep_mod.depths_elev, raylength_p, bounds_error=False, fill_value=(np.nan, raylength_p[..., -1]))(dep_mod.depths)         
     if is_raylen:
         return tps, x_s, x_p, raylength_s, raylength_p
     else:
         return tps, x_s, x_p
 
 
+class RaypTable(object):
+    def __init__(self, dep_mod, rayp_range=(0.03, 0.1), nrayp=256, sphere=True, phase=1,
+                 time_tol=0.01, dist_tol=0.1):
+        """Lookup table of delay times and horizontal distances of :meth:`xps_tps_map` on a dense
+        grid of ray-parameters, for conversions with the same ray-parameter as the direct phase.
+        Values are linearly interpolated between grid points. Each grid cell is checked against
+        the exact path at its midpoint, and ray-parameters in cells exceeding the tolerances,
+        e.g., rays turning within the depth axis, or out of the grid are computed exactly.
+
+        :param dep_mod: 1D velocity model
+        :type dep_mod: :meth:`seispy.utils.DepModel`
+        :param rayp_range: Range of ray-parameters in s/km, defaults to (0.03, 0.1)
+        :type rayp_range: tuple, optional
+        :param nrayp: Number of ray-parameters in the grid, defaults to 256
+        :type nrayp: int, optional
+        :param sphere: Wether do earth-flattening transformation, defaults to True
+        :type sphere: bool, optional
+        :param phase: Phases to calculate 1 for ``Ps``, 2 for ``PpPs``, 3 for ``PsPs+PpSs``, defaults to 1
+        :type phase: int, optional
+        :param time_tol: Tolerance of delay times in s, defaults to 0.01
+        :type time_tol: float, optional
+        :param dist_tol: Tolerance of horizontal distances in km, defaults to 0.1
+        :type dist_tol: float, optional
+        """
+        self.dep_mod = dep_mod
+        self.sphere = sphere
+        self.phase = phase
+        self.rayp = np.linspace(skm2srad(rayp_range[0]), skm2srad(rayp_range[1]), nrayp)
+        self.step = self.rayp[1] - self.rayp[0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.tps, self.x_s, self.x_p = self._exact(self.rayp)
+            mid = self._exact(self.rayp[:-1] + self.step / 2)
+        errors = []
+        self.valid = np.ones(nrayp - 1, dtype=bool)
+        for table, exact in zip((self.tps, self.x_s, self.x_p), mid):
+            approx = (table[1:] + table[:-1]) / 2
+            errors.append(np.max(np.where(np.isnan(exact), 0, np.abs(approx - exact)), axis=1))
+            self.valid &= np.all(np.isnan(approx) == np.isnan(exact), axis=1)
+        # errors of each cell in s and km
+        self.time_error = errors[0]
+        self.dist_error = np.maximum(errors[1], errors[2]) * 6371
+        self.valid &= (self.time_error <= time_tol) & (self.dist_error <= dist_tol)
+
+    def _exact(self, rayp):
+        rayp = np.asarray(rayp, dtype=float)[:, np.newaxis]
+        return xps_tps_map(self.dep_mod, rayp, rayp, sphere=self.sphere, phase=self.phase)
+
+    def __call__(self, rayp):
+        """Delay times and horizontal distances of ray-parameters ``rayp`` in s/rad
+
+        :return: ``tps``, ``x_s`` and ``x_p`` in shape of ``(rayp.size, depths.size)`` as
+                 :meth:`xps_tps_map`
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        rayp = np.atleast_1d(np.asarray(rayp, dtype=float))
+        pos = (rayp - self.rayp[0]) / self.step
+        k = np.clip(np.floor(pos).astype(int), 0, self.rayp.size - 2)
+        use = (pos >= 0) & (pos <= self.rayp.size - 1) & self.valid[k]
+        w = (pos - k)[:, np.newaxis]
+        out = [table[k] + (table[k + 1] - table[k]) * w for table in (self.tps, self.x_s, self.x_p)]
+        if not use.all():
+            for arr, exact in zip(out, self._exact(rayp[~use])):
+                arr[~use] = exact
+        return tuple(out)
+
+
+@lru_cache(maxsize=32)
+def _cached_rayp_table(key, sphere, phase):
+    filename, _, depths, elevation = key
+    return RaypTable(DepModel(np.frombuffer(depths), filename, elevation), sphere=sphere, phase=phase)
+
+
+def rayp_table(dep_mod, sphere=True, phase=1):
+    """:class:`RaypTable` of ``dep_mod``, shared between models with the same velocity model file,
+    depth axis and elevation.
+
+    :rtype: :class:`RaypTable`
+    """
+    key = dep_mod.cache_key
+    if key is None:
+        return RaypTable(dep_mod, sphere=sphere, phase=phase)
+    return _cached_rayp_table(key, sphere, phase)
+
+
 def psrf_1D_raytracing(stadatar, YAxisRange, velmod='iasp91', srayp=None, sphere=True, phase=1):
     dep_mod = DepModel(YAxisRange, velmod, stadatar.stel)
 
@@ -543,25 +705,16 @@ def psrf_1D_raytracing(stadatar, YAxisRange, velmod='iasp91', srayp=None, sphere
                 dep_mod, stadatar.rayp[i], stadatar.rayp[i], is_raylen=True, sphere=sphere, phase=phase)
             pplat_s[i], pplon_s[i] = latlon_from(stadatar.stla, stadatar.stlo, stadatar.bazi[i], rad2deg(x_s))
             pplat_p[i], pplon_p[i] = latlon_from(stadatar.stla, stadatar.stlo, stadatar.bazi[i], rad2deg(x_p))
-    elif isinstance(srayp, str) or isinstance(srayp, np.lib.npyio.NpzFile):
-        if isinstance(srayp, str):
-            if not exists(srayp):
-                raise FileNotFoundError('Ps rayp lib file not found')
-            else:
-                rayp_lib = np.load(srayp)
-        else:
-            rayp_lib = srayp
+    else:
+        rayp_lib = load_rayp_lib(srayp)
+        srayps = skm2srad(sdeg2skm(rayp_lib(stadatar.dis, stadatar.evdp, dep_mod.depths_elev)))
         for i in range(stadatar.ev_num):
-            rayp = get_psrayp(rayp_lib, stadatar.dis[i], stadatar.evdp[i], dep_mod.depths_elev)
-            rayp = skm2srad(sdeg2skm(rayp))
-            tps[i], x_s, x_p, raylength_s[i], raylength_p[i] = xps_tps_map(dep_mod, rayp, 
+            tps[i], x_s, x_p, raylength_s[i], raylength_p[i] = xps_tps_map(dep_mod, srayps[i], 
                                         stadatar.rayp[i], is_raylen=True, sphere=sphere, phase=phase)
             x_s = _imag2nan(x_s)
             x_p = _imag2nan(x_p)
             pplat_s[i], pplon_s[i] = latlon_from(stadatar.stla, stadatar.stlo, stadatar.bazi[i], rad2deg(x_s))
             pplat_p[i], pplon_p[i] = latlon_from(stadatar.stla, stadatar.stlo, stadatar.bazi[i], rad2deg(x_p))
-    else:
-        raise TypeError('srayp should be path to Ps rayp lib')
     return pplat_s, pplon_s, pplat_p, pplon_p, raylength_s, raylength_p, tps
 
 
@@ -597,26 +750,14 @@ def psrf_3D_raytracing(stadatar, YAxisRange, mod3d, srayp=None, elevation=0, sph
     tps = np.zeros([stadatar.ev_num, YAxisRange.shape[0]])
     rayps = srad2skm(stadatar.rayp)
 
-    if isinstance(srayp, str) or isinstance(srayp, np.lib.npyio.NpzFile):
-        if isinstance(srayp, str):
-            if not exists(srayp):
-                raise FileNotFoundError('Ps rayp lib file not found')
-            else:
-                rayp_lib = np.load(srayp)
-        else:
-            rayp_lib = srayp
-    elif srayp is None:
-        pass
-    else:
-        raise TypeError('srayp should be path to Ps rayp lib')
+    if srayp is not None:
+        srayps_all = skm2srad(sdeg2skm(load_rayp_lib(srayp)(stadatar.dis, stadatar.evdp, YAxisRange)))
 
     for i in range(stadatar.ev_num):
         if srayp is None:
             srayps = stadatar.rayp[i]
         else:
-            srayps = get_psrayp(rayp_lib, stadatar.dis[i],
-                                stadatar.evdp[i], YAxisRange)
-            srayps = skm2srad(sdeg2skm(srayps))
+            srayps = srayps_all[i]
         pplat_s[i][0] = pplat_p[i][0] = stadatar.stla
         pplon_s[i][0] = pplon_p[i][0] = stadatar.stlo
         x_s[i][0] = 0
@@ -626,10 +767,10 @@ def psrf_3D_raytracing(stadatar, YAxisRange, mod3d, srayp=None, elevation=0, sph
         for j, dep in enumerate(YAxisRange[:-1]):
             vs[j] = interpn((mod3d.model['dep'], mod3d.model['lat'], mod3d.model['lon']),
                             mod3d.model['vs'], (dep, pplat_s[i, j], pplon_s[i, j]),
-                            bounds_error=False, fill_value=None)
+                            bounds_error=False, fill_value=None)[0]
             vp[j] = interpn((mod3d.model['dep'], mod3d.model['lat'], mod3d.model['lon']),
                             mod3d.model['vp'], (dep, pplat_p[i, j], pplon_p[i, j]),
-                            bounds_error=False, fill_value=None)
+                            bounds_error=False, fill_value=None)[0]
             x_s[i, j+1] = ddepth*tand(asind(vs[j]*rayps[i])) + x_s[i, j]
             x_p[i, j+1] = ddepth*tand(asind(vp[j]*rayps[i])) + x_p[i, j]
             pplat_s[i, j+1], pplon_s[i, j+1] = latlon_from(stadatar.stla,
@@ -721,7 +862,7 @@ def psrf_3D_migration(pplat_s, pplon_s, pplat_p, pplon_p, raylength_s, raylength
     return Tpds + timecorrections
 
 
-def time2depth(stadatar, dep_range, Tpds, normalize='single'):
+def time2depth(stadatar, dep_range, Tpds, normalize='single', dtype=None):
     """ Interpolate RF amplitude with specified time difference and depth range
 
     Parameters
@@ -731,10 +872,13 @@ def time2depth(stadatar, dep_range, Tpds, normalize='single'):
     dep_range : :meth:`np.ndarray`
         1D array of depths in km, (``dep_range.size``)
     Tpds : :meth:`np.ndarray`
-        1D array of time difference in ``dep_range`` (``dep_range.size``)
+        2D array of time difference in ``dep_range`` (:meth:`RFStation.ev_num`, ``dep_range.size``)
     normalize : str, optional
         Normlization option, ``'sinlge'`` and ``'average'`` are available , by default 'single'
         See :meth:`RFStation.normalize` in detail.
+    dtype : numpy.dtype, optional
+        Data type of RFs in depth, e.g., ``np.float32`` to halve the memory,
+        by default the data type of RFs in ``stadatar``
 
     Returns
     -------
@@ -745,27 +889,32 @@ def time2depth(stadatar, dep_range, Tpds, normalize='single'):
     """
     if normalize:
         stadatar.normalize(method=normalize)
-    PS_RFdepth = np.zeros([stadatar.ev_num, dep_range.shape[0]])
-    EndIndex = np.zeros(stadatar.ev_num).astype(int)
-    for i in range(stadatar.ev_num):
-        TempTpds = Tpds[i, :]
-        StopIndex = np.where(np.imag(TempTpds) == 1)[0]
-        if StopIndex.size == 0:
-            EndIndex[i] = dep_range.size - 1
-            # DepthAxis = interp1d(TempTpds, dep_range, bounds_error=False)(stadatar.time_axis)
-        else:
-            EndIndex[i] = StopIndex[0] - 1
-            # DepthAxis = interp1d(TempTpds[0:StopIndex], dep_range[0: StopIndex], bounds_error=False)(stadatar.time_axis)
-
-        PS_RFTempAmps = stadatar.__dict__['data{}'.format(stadatar.comp.lower())][i]
-        ValueIndices = np.where(np.logical_not(np.isnan(dep_range[0:EndIndex[i]+1])))[0]
-        if ValueIndices.size == 0:
-            continue
-        elif np.max(ValueIndices) > PS_RFTempAmps.shape[0]:
-            continue
-        else:
-            PS_RFAmps = interp1d(stadatar.time_axis, PS_RFTempAmps, bounds_error=False)(TempTpds[0:EndIndex[i]+1])
-            PS_RFdepth[i] = PS_RFAmps
+    amps = stadatar.__dict__['data{}'.format(stadatar.comp.lower())]
+    if dtype is None:
+        dtype = amps.dtype
+    Tpds = np.asarray(Tpds)
+    PS_RFdepth = np.zeros([stadatar.ev_num, dep_range.shape[0]], dtype=dtype)
+    # the first imaginary time stops the conversion
+    stop = np.imag(Tpds) == 1
+    EndIndex = np.where(stop.any(axis=1), np.argmax(stop, axis=1) - 1, dep_range.size - 1).astype(int)
+    dep_idx = np.arange(dep_range.size)
+    last_valid = np.maximum.accumulate(np.where(np.isnan(dep_range), -1, dep_idx))[np.maximum(EndIndex, 0)]
+    good = (EndIndex >= 0) & (last_valid >= 0) & (last_valid <= amps.shape[1])
+    if not good.any():
+        return PS_RFdepth, EndIndex
+
+    # fractional sample indices of all events, then linear interpolation by gathering
+    time_axis = stadatar.time_axis
+    tps = np.real(Tpds[good])
+    frac = (tps - time_axis[0]) / stadatar.sampling
+    idx = np.clip(np.floor(np.nan_to_num(frac)).astype(int), 0, time_axis.size - 2)
+    weight = frac - idx
+    y_lo = np.take_along_axis(amps[good], idx, axis=1)
+    y_hi = np.take_along_axis(amps[good], idx + 1, axis=1)
+    rfdepth = y_lo + (y_hi - y_lo) * weight
+    rfdepth[np.isnan(tps) | (tps < time_axis[0]) | (tps > time_axis[-1])] = np.nan
+    rfdepth[dep_idx > EndIndex[good][:, np.newaxis]] = 0
+    PS_RFdepth[good] = rfdepth
     return PS_RFdepth, EndIndex
 
 
@@ -1,12 +1,16 @@
+"""Entry points of command line tools. Modules used by a command are imported in its
+function so that each command only loads what it needs.
+"""
 import numpy as np
 import argparse
-from seispy.rfcorrect import RFStation
-from seispy.ccp3d import CCP3D
-from seispy.ccpprofile import CCPProfile
-from scipy.interpolate import interp1d
-from seispy.utils import read_rfdep
-from seispy.rf import RF
-from seispy.recalrf import ReRF
+import atexit
+
+
+def dump_metrics(path):
+    """Write timing metrics of processing stages to ``path`` in JSON or CSV when the command exits"""
+    if path is not None:
+        from seispy.metrics import metrics
+        atexit.register(metrics.dump, path)
 
 
 def rfharmo():
@@ -17,12 +21,20 @@ def rfharmo():
     parser.add_argument('-s', help="Resample RFs with sampling interval of dt", metavar='dt', default=None, type=float)
     parser.add_argument('-o', help="Specify output path for saving constant component.", metavar='outpath', default=None, type=str)
     parser.add_argument('-p', help='Figure output path, defaults to ./', metavar='figure_path', default='./', type=str)
+    parser.add_argument('-b', help='Number of bootstrap resamples for 95%% confidence bands, '
+                        'specify 0 to use jackknife, defaults to no resampling', metavar='n_boot', default=None, type=int)
+    parser.add_argument('--seed', help='Seed of the random generator for bootstrap', default=None, type=int)
     args = parser.parse_args()
+    from seispy.rfcorrect import RFStation
     rfsta = RFStation(args.rfpath)
     if args.s is not None:
         rfsta.resample(args.s)
     twin = [float(v) for v in args.t.split('/')]
-    rfsta.harmonic(twin[0], twin[1])
+    if args.b is None:
+        resample = None
+    else:
+        resample = 'jackknife' if args.b == 0 else 'bootstrap'
+    rfsta.harmonic(twin[0], twin[1], resample=resample, n_boot=args.b, seed=args.seed)
     if args.o is not None:
         rfsta.harmo.write_constant(args.o)
     rfsta.harmo.plot(outpath=args.p)
@@ -48,6 +60,7 @@ def rfani():
     parser.add_argument('-w', help="Weights of 3 anisotropic methods (order by R cosine energy, R cross-correlation and T energy), defaults to 0.4/0.4/0.2",
                         dest='weight', default='0.4/0.4/0.2', metavar='w1/w2/w3')
     arg = parser.parse_args()
+    from seispy.rfcorrect import RFStation
     weights = np.array(arg.weight.split('/')).astype(float)
     timewin = np.array(arg.t.split('/')).astype(float)
     rfsta = RFStation(arg.rfpath)
@@ -65,7 +78,11 @@ def ccp3d():
     parser.add_argument('cfg_file', type=str, help='Path to CCP configure file')
     parser.add_argument('-s', help='Range for searching depth of D410 and D660, The results would be saved to \'peakfile\' in cfg_file',
                         metavar='d410min/d410max/d660min/d660max', default=None)
+    parser.add_argument('--metrics', help='Write timing metrics of processing stages to a JSON or CSV file',
+                        metavar='metrics_file', default=None)
     arg = parser.parse_args()
+    dump_metrics(arg.metrics)
+    from seispy.ccp3d import CCP3D
     ccp = CCP3D(arg.cfg_file)
     ccp.initial_grid()
     ccp.stack()
@@ -80,7 +97,11 @@ def ccp_profile():
     parser = argparse.ArgumentParser(description="Stack PRFS along a profile")
     parser.add_argument('cfg_file', type=str, help='Path to CCP configure file')
     parser.add_argument('-t', help='Output as a text file', dest='isdat', action='store_true')
+    parser.add_argument('--metrics', help='Write timing metrics of processing stages to a JSON or CSV file',
+                        metavar='metrics_file', default=None)
     arg = parser.parse_args()
+    dump_metrics(arg.metrics)
+    from seispy.ccpprofile import CCPProfile
     if arg.isdat:
         typ = 'dat'
     else:
@@ -98,6 +119,8 @@ def get_pierce_points():
     parser.add_argument('-o', help="filename of output file, defaults to ./pierce_points.dat",
                         default='./pierce_points.dat', metavar='filename')
     arg = parser.parse_args()
+    from scipy.interpolate import interp1d
+    from seispy.utils import read_rfdep
     rfdep = read_rfdep(arg.rfdepth_path)
     if arg.d > rfdep[0]['depthrange'][-1]:
         parser.error('The depth exceed max depth in {}'.format(arg.rfdepth_path))
@@ -121,6 +144,11 @@ def common_parser():
                                    'energy of T component. The searching range is raw_baz +/- 90',
                                    dest='baz', nargs='?', const=0, type=float)
     parser.add_argument('-w', help='Write project to localfile', action='store_true')
+    parser.add_argument('-m', help='Calculate RFs event by event in the streaming mode to keep memory bounded. '
+                                   'Only a fixed angle is supported with -b and -w is not available in this mode',
+                        dest='isstream', action='store_true')
+    parser.add_argument('--metrics', help='Write timing metrics of processing stages to a JSON or CSV file',
+                        metavar='metrics_file', default=None)
     return parser
 
 
@@ -149,23 +177,35 @@ def prf():
     parser.add_argument('-f', help='Specify finallist for re-calculating RFs and -l is invalid in this pattern',
                         metavar='finallist', default=None)
     arg = parser.parse_args()
+    dump_metrics(arg.metrics)
+    if arg.isstream and arg.w:
+        parser.error('Saving the project with -w is only available in the batch mode without -m')
+    if arg.isstream and arg.baz == 0:
+        parser.error('Back-azimuth correction with T energy minimization is not available with -m')
     if arg.f is not None:
+        from seispy.recalrf import ReRF
         arg.islocal = False
         pjt = ReRF(arg.f, cfg_file=arg.cfg_file)
     else:
+        from seispy.rf import RF
         pjt = RF(cfg_file=arg.cfg_file)
     pjt.para.switchEN = arg.isswitch
     pjt.para.reverseE ,pjt.para.reverseN= parse_common_args(arg)
     pjt.load_stainfo()
     if arg.f is None:
         pjt.search_eq(local=arg.islocal)
+    if arg.isstream:
+        pjt.stream(drop_snr=arg.f is None, correct_angle=arg.baz)
+        if arg.f is not None:
+            pjt.write_list()
+        return
     pjt.match_eq()
     pjt.channel_correct()
     pjt.detrend()
     pjt.filter()
     pjt.cal_phase()
     if arg.f is None:
-        pjt.drop_eq_snr()
+        pjt.batch_qc()
     if arg.baz is not None and arg.baz != 0:
         pjt.baz_correct(correct_angle=arg.baz)
     elif arg.baz is not None and arg.baz == 0:
@@ -189,18 +229,29 @@ def srf():
     parser.add_argument('-i', help='Wether grid search incidence angle',
                         action='store_true')
     arg = parser.parse_args()
+    dump_metrics(arg.metrics)
+    if arg.isstream and arg.p:
+        parser.error('Picking with -p is only available in the batch mode without -m')
+    if arg.isstream and arg.w:
+        parser.error('Saving the project with -w is only available in the batch mode without -m')
+    if arg.isstream and arg.baz == 0:
+        parser.error('Back-azimuth correction with T energy minimization is not available with -m')
+    from seispy.rf import RF
     pjt = RF(cfg_file=arg.cfg_file)
 
     pjt.para.switchEN = arg.isswitch
     pjt.para.reverseE ,pjt.para.reverseN= parse_common_args(arg)
     pjt.load_stainfo()
     pjt.search_eq(local=arg.islocal)
+    if arg.isstream:
+        pjt.stream(correct_angle=arg.baz, search_inc=arg.i)
+        return
     pjt.match_eq()
     pjt.channel_correct()
     pjt.detrend()
     pjt.filter()
     pjt.cal_phase()
-    pjt.drop_eq_snr()
+    pjt.batch_qc()
     if arg.baz is not None and arg.baz != 0:
         pjt.baz_correct(correct_angle=arg.baz)
     elif arg.baz is not None and arg.baz == 0:
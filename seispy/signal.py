@@ -10,7 +10,7 @@ def smooth(x, half_len=5, window='flat'):
     in the begining and end part of the output signal.
 
     input:
-        x: the input signal
+        x: the input signal, signals in multi-dimensional arrays are smoothed along the last axis
         helf_len: the half dimension of the smoothing window; should be an odd integer
         window: the type of window from 'flat', 'hanning', 'hamming', 'bartlett', 'blackman'
             flat window will produce a moving average smoothing.
@@ -35,10 +35,10 @@ def smooth(x, half_len=5, window='flat'):
 
     window_len = 2*half_len+1
 
-    if x.ndim != 1:
-        raise ValueError("smooth only accepts 1 dimension arrays.")
+    if x.ndim == 0:
+        raise ValueError("smooth only accepts arrays with at least 1 dimension.")
 
-    if x.size < window_len:
+    if x.shape[-1] < window_len:
         raise ValueError("Input vector needs to be bigger than window size.")
 
     if window_len < 3:
@@ -47,14 +47,18 @@ def smooth(x, half_len=5, window='flat'):
     if window not in ['flat', 'hanning', 'hamming', 'bartlett', 'blackman']:
         raise ValueError("Window is on of 'flat', 'hanning', 'hamming',"
                          "'bartlett', 'blackman'")
-    s = np.r_[x[window_len-1:0:-1], x, x[-1:-window_len:-1]]
+    s = np.concatenate((x[..., window_len-1:0:-1], x, x[..., -1:-window_len:-1]), axis=-1)
     if window == 'flat':
         w = np.ones(window_len, 'd')  # moving average
     else:
         w = eval('np.'+window+'(window_len)')
 
-    y = np.convolve(w/w.sum(), s, mode='valid')
-    return y[half_len:-half_len]
+    if x.ndim == 1:
+        y = np.convolve(w/w.sum(), s, mode='valid')
+    else:
+        # smooth along the last axis of all rows, windows are symmetric
+        y = np.lib.stride_tricks.sliding_window_view(s, window_len, axis=-1) @ (w/w.sum())
+    return y[..., half_len:-half_len]
 
 
 def whiten(data, Nfft, delta, f1, f2, f3, f4):
@@ -1,7 +1,6 @@
 import numpy as np
 from scipy.interpolate import interp1d
-import matplotlib.pyplot as plt
-from obspy.taup import TauPyModel
+from scipy.fft import rfft, irfft, rfftfreq, next_fast_len
 from seispy.geo import srad2skm, skm2sdeg
 
 class SlantStack():
@@ -24,7 +23,19 @@ class SlantStack():
         self.syn_tau = np.array([])
         self.syn_drayp = np.array([])
 
-    def stack(self, ref_dis=None, rayp_range=None, tau_range=None):
+    def stack(self, ref_dis=None, rayp_range=None, tau_range=None, method='time'):
+        """Slant stack of RFs
+
+        :param ref_dis: Reference distance, defaults to None
+        :type ref_dis: float, optional
+        :param rayp_range: Range of relative ray-parameters, defaults to None
+        :type rayp_range: numpy.ndarray, optional
+        :param tau_range: Range of tau, defaults to None
+        :type tau_range: numpy.ndarray, optional
+        :param method: ``'time'`` to interpolate each RF in time domain, or ``'fft'`` to
+                       shift RFs with phase ramps in frequency domain, defaults to 'time'
+        :type method: str, optional
+        """
         if ref_dis is not None and isinstance(ref_dis, (int, float)):
             self.ref_dis = ref_dis
         elif ref_dis is None:
@@ -44,6 +55,11 @@ class SlantStack():
         else:
             raise TypeError('{} should be in numpy.ndarray type.'.format(tau_range))
         ev_num = self.datar.shape[0]
+        if method == 'fft':
+            self.stack_amp = self._stack_fft() / ev_num
+            return
+        elif method != 'time':
+            raise ValueError('method must be in \'time\' or \'fft\'')
         taus, rayps = np.meshgrid(self.tau_range, self.rayp_range)
         self.stack_amp = np.zeros([self.rayp_range.shape[0], self.tau_range.shape[0]])
         for i in range(ev_num):
@@ -51,7 +67,28 @@ class SlantStack():
             self.stack_amp += interp1d(self.time_axis, self.datar[i, :], fill_value='extrapolate')(tps)
         self.stack_amp /= ev_num
 
+    def _stack_fft(self, max_elements=2**22):
+        # delay each RF by rayp * (dis - ref_dis) with a phase ramp on its spectrum and sum over events
+        dt = self.time_axis[1] - self.time_axis[0]
+        npts = self.datar.shape[1]
+        delays = self.rayp_range[:, np.newaxis] * (np.asarray(self.dis) - self.ref_dis)
+        nfft = next_fast_len(npts + int(np.ceil(np.max(np.abs(delays)) / dt)) + 1)
+        spec = rfft(self.datar, nfft, axis=1)
+        freqs = rfftfreq(nfft, dt)
+        stack_spec = np.zeros((self.rayp_range.size, freqs.size), dtype=complex)
+        chunk = max(1, max_elements // delays.size)
+        for b in range(0, freqs.size, chunk):
+            ramp = np.exp(-2j * np.pi * delays[:, :, np.newaxis] * freqs[b:b+chunk])
+            stack_spec[:, b:b+chunk] = np.einsum('pef,ef->pf', ramp, spec[:, b:b+chunk])
+        stack_trace = irfft(stack_spec, nfft, axis=1)
+        # sample at tau, negative delays are wrapped to the end of the padded traces
+        frac = (self.tau_range - self.time_axis[0]) / dt
+        idx = np.floor(frac).astype(int)
+        weight = frac - idx
+        return stack_trace[:, idx % nfft] * (1 - weight) + stack_trace[:, (idx + 1) % nfft] * weight
+
     def syn_tps(self, phase_list, velmodel='iasp91', focal_dep=10):
+        from obspy.taup import TauPyModel
         model = TauPyModel(model=velmodel)
         phase_list.insert(0, 'P')
         arrs = model.get_travel_times(focal_dep, self.ref_dis, phase_list=phase_list)
@@ -61,6 +98,7 @@ class SlantStack():
         self.syn_drayp = [p_rayp - skm2sdeg(srad2skm(arr.ray_param))for arr in arrs[1:]]
 
     def plot(self, cmap='jet', xlim=None, vmin=None, vmax=None, figpath=None):
+        import matplotlib.pyplot as plt
         plt.style.use("bmh")
         self.fig = plt.figure(figsize=(8,5))
         self.ax = self.fig.add_subplot()
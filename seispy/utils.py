@@ -1,6 +1,6 @@
-from os.path import join, dirname, exists, abspath
+from os.path import join, dirname, exists, abspath, getmtime
+from functools import lru_cache
 from scipy.io import loadmat
-from matplotlib.colors import ListedColormap
 from seispy import geo
 from seispy.geo import geo2sph, km2deg, skm2srad, sph2geo, srad2skm
 from seispy import distaz
@@ -10,6 +10,7 @@ import seispy
 
 
 def load_cyan_map():
+    from matplotlib.colors import ListedColormap
     path = join(dirname(__file__), 'data', 'cyan.mat')
     carray = loadmat(path)['cyan']
     return ListedColormap(carray)
@@ -38,29 +39,80 @@ def read_rfdep(path):
             raise FileNotFoundError('Cannot open file of {}'.format(path))
 
 
+# Decimals of elevation in km kept in the cache key, so that stations with similar elevations
+# share layer arrays. 1 m is below the precision of elevations in station lists.
+ELEVATION_DECIMALS = 3
+
+
+@lru_cache(maxsize=32)
+def _load_velmod(filename, mtime):
+    """Raw depth, Vp and Vs of a velocity model file, cached by path and modification time"""
+    model = np.loadtxt(filename)
+    cols = model[:, 0].copy(), model[:, 1].copy(), model[:, 2].copy()
+    for col in cols:
+        col.flags.writeable = False
+    return cols
+
+
+@lru_cache(maxsize=256)
+def _model_layers(filename, mtime, depths, elevation):
+    """Layer arrays of a velocity model on a depth axis given as bytes, cached by all arguments"""
+    depthsraw, vpraw, vsraw = _load_velmod(filename, mtime)
+    depths = np.frombuffer(depths)
+    dep_val = np.average(np.diff(depths))
+    if elevation == 0:
+        depths_elev = depths
+        depths_extend = depths
+    else:
+        dep_append = np.arange(depths[-1]+dep_val,
+                               depths[-1]+dep_val+np.floor(elevation/dep_val+1), dep_val)
+        depths_extend = np.append(depths, dep_append)
+        depths_elev = np.append(depths, dep_append) - elevation
+    dz = np.append(0, np.diff(depths_extend))
+    vp = interp1d(depthsraw, vpraw, bounds_error=False, fill_value=vpraw[0])(depths_elev)
+    vs = interp1d(depthsraw, vsraw, bounds_error=False, fill_value=vsraw[0])(depths_elev)
+    layers = depths_elev, depths_extend, dz, vp, vs, 6371.0 - depths_elev
+    for arr in layers:
+        arr.flags.writeable = False
+    return layers
+
+
+def clear_model_cache():
+    """Clear cached velocity models and layer arrays of :class:`DepModel`"""
+    _load_velmod.cache_clear()
+    _model_layers.cache_clear()
+
+
 class DepModel(object):
     def __init__(self, YAxisRange, velmod='iasp91', elevation=0):
-        self.elevation = elevation
-        VelocityModel = np.loadtxt(self.from_file(velmod))
-        self.depthsraw = VelocityModel[:, 0]
-        self.vpraw = VelocityModel[:, 1]
-        self.vsraw = VelocityModel[:, 2]
+        """1D velocity model on a depth axis. Parsed model files and layer arrays are cached
+        and shared between instances with the same model, depth axis and elevation,
+        so these arrays are read-only.
+
+        :param YAxisRange: Depth axis in km
+        :type YAxisRange: numpy.ndarray
+        :param velmod: Path to velocity model file or name of internal model, defaults to 'iasp91'
+        :type velmod: str, optional
+        :param elevation: Elevation of the station in km, rounded to ``ELEVATION_DECIMALS`` as the layers, defaults to 0
+        :type elevation: float, optional
+        """
+        self.elevation = round(float(elevation), ELEVATION_DECIMALS)
+        filename = abspath(self.from_file(velmod))
+        mtime = getmtime(filename)
+        self.depthsraw, self.vpraw, self.vsraw = _load_velmod(filename, mtime)
         self.depths = YAxisRange.astype(float)
         self.dep_val = np.average(np.diff(self.depths))
-        if elevation == 0:
-            self.depths_elev = self.depths
-            self.depths_extend = self.depths
-        else:
-            dep_append = np.arange(self.depths[-1]+self.dep_val, 
-                               self.depths[-1]+self.dep_val+np.floor(elevation/self.dep_val+1), self.dep_val)
-            self.depths_extend = np.append(self.depths, dep_append)
-            self.depths_elev = np.append(self.depths, dep_append) - elevation
-        self.dz = np.append(0, np.diff(self.depths_extend))
-        self.vp = interp1d(self.depthsraw, self.vpraw, bounds_error=False,
-                           fill_value=self.vpraw[0])(self.depths_elev)
-        self.vs = interp1d(self.depthsraw, self.vsraw, bounds_error=False,
-                           fill_value=self.vsraw[0])(self.depths_elev)
-        self.R = 6371.0 - self.depths_elev
+        self._key = (filename, mtime, self.depths.tobytes(), self.elevation)
+        self._layers = _model_layers(*self._key)
+        self.depths_elev, self.depths_extend, self.dz, self.vp, self.vs, self.R = self._layers
+
+    @property
+    def cache_key(self):
+        """Key of the cached layer arrays, None if any of them has been replaced, e.g., by a 3D model"""
+        layers = self.depths_elev, self.depths_extend, self.dz, self.vp, self.vs, self.R
+        if all(a is b for a, b in zip(layers, self._layers)):
+            return self._key
+        return None
 
     def from_file(self, mode_name):
         if exists(mode_name):
@@ -78,7 +130,7 @@ class DepModel(object):
             radius = 6371.
         tps = np.cumsum((np.sqrt((radius / self.vs) ** 2 - rayps ** 2) -
                         np.sqrt((radius / self.vp) ** 2 - raypp ** 2)) *
-                        (self.dz / radius))
+                        (self.dz / radius), axis=-1)
         return tps
     
     def tpppds(self, rayps, raypp, sphere=True):
@@ -88,7 +140,7 @@ class DepModel(object):
             radius = 6371.
         tps = np.cumsum((np.sqrt((radius / self.vs) ** 2 - rayps ** 2) +
                         np.sqrt((radius / self.vp) ** 2 - raypp ** 2)) *
-                        (self.dz / radius))
+                        (self.dz / radius), axis=-1)
         return tps
     
     def tpspds(self, rayps, sphere=True):
@@ -97,7 +149,7 @@ class DepModel(object):
         else:
             radius = 6371.
         tps = np.cumsum(2*np.sqrt((radius / self.vs) ** 2 - rayps ** 2)*
-                        (self.dz / radius))
+                        (self.dz / radius), axis=-1)
         return tps
 
     def radius_s(self, rayp, phase='P', sphere=True):
@@ -109,7 +161,7 @@ class DepModel(object):
             radius = self.R
         else:
             radius = 6371.
-        hor_dis = np.cumsum((self.dz / radius) / np.sqrt((1. / (rayp ** 2. * (radius / vel) ** -2)) - 1))
+        hor_dis = np.cumsum((self.dz / radius) / np.sqrt((1. / (rayp ** 2. * (radius / vel) ** -2)) - 1), axis=-1)
         return hor_dis
 
     def raylength(self, rayp, phase='P', sphere=True):
@@ -165,7 +217,5 @@ def create_center_bin_profile(stations, val=5, method='linear'):
 
 
 def prof_range(lat, lon):
-    dis = [0]
-    for i in range(lat.size-1):
-        dis.append(distaz(lat[i], lon[i], lat[i+1], lon[i+1]).degreesToKilometers())
-    return np.cumsum(dis)
\ No newline at end of file
+    dis = distaz(lat[:-1], lon[:-1], lat[1:], lon[1:]).degreesToKilometers()
+    return np.cumsum(np.append(0, dis))
\ No newline at end of file
@@ -0,0 +1,779 @@
+import numpy as np
+from obspy.signal.trigger import recursive_sta_lta
+from seispy.geo import snr
+from seispy import qc
+
+
+def _noise_with_onset(nev=5, npts=3000, onset=1500):
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(nev, npts))
+    data[:, onset:] *= 4
+    return data
+
+
+def test_sub01():
+    data = _noise_with_onset()
+    cft = qc.recursive_sta_lta(data, 50, 100)
+    for row, c in zip(data, cft):
+        assert np.allclose(c, recursive_sta_lta(row, 50, 100))
+
+
+def test_sub02():
+    data = _noise_with_onset()
+    keep, snr_all, shift = qc.batch_qc(data, 0.1, 150, noiselen=50, noisegate=5, stl=5, ltl=10)
+    ref = [snr(row[1500:2001], row[1000:1501]) for row in data]
+    assert np.allclose(snr_all, ref)
+    assert np.array_equal(keep, np.array(ref) >= 5)
+    assert np.all(np.abs(shift) < 5)
+
+
+def test_sub03():
+    from seispy.slantstack import SlantStack
+    rng = np.random.default_rng(0)
+    time_axis = np.arange(1301) * 0.1 - 10
+    dis = rng.uniform(30, 90, 50)
+    data = np.exp(-(time_axis - 0.04 * (dis[:, np.newaxis] - 65) - 5) ** 2)
+    slant = SlantStack(data, time_axis, dis)
+    slant.stack()
+    amp_time = slant.stack_amp
+    slant.stack(method='fft')
+    assert np.allclose(slant.stack_amp, amp_time, atol=5e-3)
+    assert np.unravel_index(np.argmax(slant.stack_amp), amp_time.shape) == \
+        np.unravel_index(np.argmax(amp_time), amp_time.shape)
+
+
+def test_sub04():
+    from seispy.mccc import mccc
+    rng = np.random.default_rng(1)
+    dt = 0.05
+    time_axis = np.arange(1000) * dt
+    delay = rng.integers(-40, 40, 60) * dt
+    data = np.exp(-((time_axis - 25 - delay[:, np.newaxis]) / 0.5) ** 2)
+    tdel = mccc(data, dt)
+    assert np.allclose(tdel, delay.mean() - delay)
+    tdel_lsq, sigma = mccc(data, dt, lsq=True)
+    assert np.allclose(tdel_lsq, tdel) and np.allclose(sigma, 0)
+    assert np.allclose(mccc(data, dt, twin=10, neighbors=3), tdel)
+
+
+def test_sub05():
+    from seispy.geo import latlon_from
+    from seispy.distaz import delaz, distaz
+    bazi = np.array([0., 45., 190., 300.])
+    dist = np.linspace(0.5, 80, 6)
+    lat, lon = latlon_from(30., 100., bazi[:, np.newaxis], dist)
+    assert lat.shape == (4, 6)
+    for i, j in np.ndindex(lat.shape):
+        la, lo = latlon_from(30., 100., bazi[i], dist[j])
+        assert np.isclose(la, lat[i, j]) and np.isclose(lo, lon[i, j])
+    out = tuple(np.empty(lat.shape, dtype=np.float32) for _ in range(3))
+    delta, az, baz = delaz(30., 100., lat, lon, out=out)
+    assert delta is out[0] and delta.dtype == np.float32
+    assert np.allclose(delta, distaz(30., 100., lat, lon).delta, atol=5e-3)
+    da = distaz(30., 100., np.array([30., 31.]), 100.)
+    assert da.delta[0] == 0 and da.baz[1] == 0
+
+
+def test_sub06(tmp_path):
+    from seispy.ccp3d import gen_center_bin
+    bin_loca, bin_mat, bin_map = gen_center_bin(30, 100, 2, 3, 0.5, cache=str(tmp_path))
+    assert bin_mat.shape == (8, 12, 2) and np.array_equal(bin_loca[bin_map[3, 5]], bin_mat[3, 5])
+    assert len(list(tmp_path.iterdir())) == 1
+    cached = gen_center_bin(30, 100, 2, 3, 0.5, cache=str(tmp_path))
+    assert all(np.array_equal(a, b) for a, b in zip(cached, (bin_loca, bin_mat, bin_map)))
+
+
+def test_sub07():
+    from seispy.ccp3d import peak_depth, crossing_depth
+    dep = np.arange(300, 800, 2.)
+    mu = np.array([np.exp(-((dep - 410 - shift) / 8) ** 2) + 0.8 * np.exp(-((dep - 660 + shift) / 8) ** 2)
+                   for shift in (-10, 0, 10)])
+    mu[2, :] = np.nan
+    d410 = peak_depth(mu, dep, 380, 440)
+    d660 = peak_depth(mu, dep, 630, 690)
+    assert np.allclose(d410[:2], [400, 410]) and np.allclose(d660[:2], [670, 660])
+    assert np.isnan(d410[2]) and np.isnan(d660[2])
+    err = crossing_depth(mu, dep, np.full(3, np.exp(-1)), np.zeros(3, dtype=int), np.full(3, 100))
+    assert np.allclose(err[1], [402, 418], atol=0.5) and np.isnan(err[2]).all()
+
+
+def _synthetic_rfdep(nsta=4, seed=0):
+    from seispy.geo import latlon_from
+    rng = np.random.default_rng(seed)
+    depth = np.arange(0, 201, 1.)
+    rfdep = []
+    for s in range(nsta):
+        nev = int(rng.integers(10, 30))
+        plat, plon = latlon_from(30 + 0.2 * s, 100., rng.uniform(0, 360, nev)[:, np.newaxis],
+                                 depth * 0.003)
+        rfdep.append({'station': 'S{}'.format(s), 'stalat': 30 + 0.2 * s, 'stalon': 100.,
+                      'piercelat': plat, 'piercelon': plon, 'stopindex': rng.integers(100, 201, nev),
+                      'moveout_correct': rng.normal(size=(nev, depth.size))})
+    return rfdep
+
+
+def test_sub08(tmp_path):
+    from seispy.ccpoperator import CCPOperator, load_or_build
+    from seispy.distaz import distaz
+    rfdep = _synthetic_rfdep()
+    bin_loca = np.array([[30.1, 100.], [30.5, 100.1]])
+    stack_idx = np.arange(50, 150, 10)
+    path = str(tmp_path / 'op.npz')
+    op = load_or_build(path, rfdep, bin_loca, stack_idx, 0.3)
+    mu, _, count = CCPOperator.load(path).stack(op.amplitudes(rfdep), radius=0.2)
+    for i, j in ((0, 3), (1, 8)):
+        idx = stack_idx[j]
+        amp = []
+        for sta in rfdep:
+            evs = np.where(sta['stopindex'] >= idx)[0]
+            dis = distaz(sta['piercelat'][evs, idx], sta['piercelon'][evs, idx], *bin_loca[i]).delta
+            amp.extend(sta['moveout_correct'][evs[dis < 0.2], idx])
+        assert count[i, j] == len(amp) and np.isclose(mu[i, j], np.mean(amp))
+    assert not op.match(rfdep[:-1], bin_loca, stack_idx)
+    # pierce points of another velocity model with the same shapes
+    moved = [dict(sta) for sta in rfdep]
+    moved[1]['piercelat'] = moved[1]['piercelat'] + 0.05
+    assert CCPOperator.load(path).match(rfdep, bin_loca, stack_idx) and not op.match(moved, bin_loca, stack_idx)
+    op_moved = load_or_build(path, moved, bin_loca, stack_idx, 0.3)
+    assert op_moved.matrix.nnz != op.matrix.nnz or (op_moved.matrix != op.matrix).nnz
+    assert CCPOperator.load(path).match(moved, bin_loca, stack_idx)
+
+
+def test_sub09(tmp_path):
+    from seispy.ccpoperator import CCPOperator
+    from seispy.ccpstats import CCPStats
+    rfdep = _synthetic_rfdep(nsta=5)
+    bin_loca = np.array([[30.1, 100.], [30.5, 100.1], [30.9, 100.]])
+    stack_idx = np.arange(50, 150, 10)
+    stats = CCPStats(bin_loca, stack_idx, 0.2, reservoir=5, seed=0)
+    stats.update(rfdep[:3])
+    path = str(tmp_path / 'stats.npz')
+    stats.save(path)
+    stats = CCPStats.load(path)
+    updated = _synthetic_rfdep(nsta=5, seed=1)[1]
+    rows = stats.update(rfdep[2:4] + [updated])
+    assert rows.size and sorted(stats.stations) == ['S0', 'S1', 'S2', 'S3']
+    full = rfdep[:1] + [updated] + rfdep[2:4]
+    op = CCPOperator.build(full, bin_loca, stack_idx, 0.2)
+    mu_ref, _, count_ref = op.stack(op.amplitudes(full))
+    mu, _, count, _ = stats.stack()
+    assert np.array_equal(count, count_ref) and np.allclose(mu, mu_ref, equal_nan=True)
+    assert np.all((stats.res_sta >= 0).sum(axis=1) <= np.minimum(stats.count, 5))
+    ids = [led['id'] for led in stats.stations.values()]
+    assert np.all(np.isin(stats.res_sta[stats.res_sta >= 0], ids))
+
+
+def test_sub10():
+    import subprocess
+    import sys
+    code = ('import sys, seispy.scripts, seispy.ccp3d, seispy.hk, seispy.rfcorrect; '
+            'print([m for m in ("PyQt5", "matplotlib.pyplot", "obspy.taup", "scikits.bootstrap") if m in sys.modules])')
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert out.strip().splitlines()[-1] == '[]'
+
+
+def test_sub11(tmp_path):
+    import csv
+    import json
+    from seispy.metrics import Metrics
+    m = Metrics()
+
+    @m.timed('double', items=len, count_before=True)
+    def double(x):
+        return x * 2
+    with m.stage('load', items=3, label='ST01') as st:
+        st.items += 1
+    assert double([1, 2]) == [1, 2, 1, 2]
+    assert [i for i in m.batched('bins', range(25), size=10)] == list(range(25))
+    summ = m.summary()
+    assert summ['load']['items'] == 4 and summ['double']['items'] == 2
+    assert summ['bins']['calls'] == 3 and summ['bins']['items'] == 25
+    m.dump(str(tmp_path / 'm.json'))
+    m.dump(str(tmp_path / 'm.csv'))
+    with open(tmp_path / 'm.json') as f:
+        assert json.load(f)['summary'] == json.loads(json.dumps(summ))
+    with open(tmp_path / 'm.csv') as f:
+        rows = list(csv.DictReader(f))
+    assert [r['name'] for r in rows] == ['load', 'double', 'bins', 'bins', 'bins'] and rows[-1]['label'] == '20-24'
+    m.enabled = False
+    with m.stage('load'):
+        pass
+    assert m.summary()['load']['calls'] == 1
+
+
+def test_sub12():
+    from types import SimpleNamespace
+    from seispy.geo import skm2srad
+    from seispy.rfcorrect import time2depth, psrf2depth
+    from seispy.ccpoperator import CCPOperator
+    rng = np.random.default_rng(2)
+    time_axis = np.arange(1000) * 0.1 - 10
+    sta = SimpleNamespace(comp='R', ev_num=20, time_axis=time_axis, sampling=0.1,
+                          datar=rng.normal(size=(20, 1000)).astype(np.float32))
+    dep_range = np.arange(0, 201, 1.)
+    tpds = np.sort(rng.uniform(0, 60, size=(20, dep_range.size)), axis=1)
+    rf32, end32 = time2depth(sta, dep_range, tpds, normalize=None)
+    rf64, end64 = time2depth(sta, dep_range, tpds, normalize=None, dtype=np.float64)
+    assert rf32.dtype == np.float32 and np.array_equal(end32, end64)
+    assert np.allclose(rf32, rf64, atol=1e-6)
+    sta.rayp, sta.stel = skm2srad(rng.uniform(0.04, 0.08, 20)), 0.
+    for dtype in (None, np.float64):
+        rfdep_, _, x_s, x_p = psrf2depth(sta, dep_range, normalize=None, dtype=dtype)
+        assert rfdep_.dtype == x_s.dtype == x_p.dtype == (np.float32 if dtype is None else dtype)
+    rfdep = _synthetic_rfdep()
+    rfdep32 = [dict(s, moveout_correct=s['moveout_correct'].astype(np.float32),
+                    piercelat=s['piercelat'].astype(np.float32),
+                    piercelon=s['piercelon'].astype(np.float32)) for s in rfdep]
+    bin_loca = np.array([[30.1, 100.], [30.5, 100.1]])
+    stack_idx = np.arange(50, 150, 10)
+    op = CCPOperator.build(rfdep, bin_loca, stack_idx, 0.3)
+    op32 = CCPOperator.build(rfdep32, bin_loca, stack_idx, 0.3)
+    amp32 = op32.amplitudes(rfdep32)
+    assert amp32.dtype == np.float32
+    mu, _, count = op.stack(op.amplitudes(rfdep))
+    mu32, _, count32 = op32.stack(amp32)
+    assert mu32.dtype == np.float64 and np.array_equal(count, count32)
+    assert np.allclose(mu32, mu, atol=1e-5, equal_nan=True)
+
+
+def test_sub13(tmp_path):
+    import os
+    from seispy.utils import DepModel
+    depths = np.arange(0, 100, 1.)
+    mod = DepModel(depths, 'iasp91', elevation=1.2)
+    mod_near = DepModel(depths, 'iasp91', elevation=1.2002)
+    assert mod.vp is mod_near.vp and not mod.vp.flags.writeable
+    assert mod_near.elevation == mod.elevation == 1.2
+    assert mod.dz.size == mod.depths_elev.size == depths.size + 2
+    assert np.allclose(mod.vs, np.interp(mod.depths_elev, mod.depthsraw, mod.vsraw))
+    velmod = tmp_path / 'test.vel'
+    np.savetxt(velmod, [[0, 6., 3.5], [200, 8., 4.5]])
+    assert np.allclose(DepModel(depths, str(velmod)).vp, 6 + depths / 100)
+    np.savetxt(velmod, [[0, 5., 3.], [200, 7., 4.]])
+    os.utime(velmod, (0, 1e9))
+    assert np.allclose(DepModel(depths, str(velmod)).vp, 5 + depths / 100)
+
+
+def test_sub14():
+    from types import SimpleNamespace
+    from seispy.rfcorrect import psrf2depth, rayp_table, xps_tps_map
+    from seispy.utils import DepModel
+    from seispy.geo import skm2srad
+    rng = np.random.default_rng(3)
+    time_axis = np.arange(1300) * 0.1 - 10
+    rayp = skm2srad(np.append(rng.uniform(0.04, 0.08, 30), [0.02, 0.12]))
+    sta = SimpleNamespace(comp='R', ev_num=rayp.size, time_axis=time_axis, sampling=0.1, stel=1.2,
+                          rayp=rayp, datar=rng.normal(size=(rayp.size, time_axis.size)))
+    dep_range = np.arange(0, 801, 2.)
+    dep_mod = DepModel(dep_range, 'iasp91', elevation=1.2)
+    table = rayp_table(dep_mod)
+    assert table is rayp_table(DepModel(dep_range, 'iasp91', elevation=1.2))
+    assert table.valid.any() and not table.valid.all()
+    with np.errstate(invalid='ignore'):
+        tps, x_s, _ = table(rayp)
+        for i in (0, 1, 30, 31):
+            tps_ref, x_s_ref, _ = xps_tps_map(dep_mod, rayp[i], rayp[i])
+            assert np.allclose(tps[i], tps_ref, atol=0.01, equal_nan=True)
+            assert np.allclose(x_s[i] * 6371, x_s_ref * 6371, atol=0.1, equal_nan=True)
+        rf, end, _, _ = psrf2depth(sta, dep_range, normalize=None)
+        rf_lut, end_lut, _, _ = psrf2depth(sta, dep_range, normalize=None, lut=True)
+    assert np.array_equal(end, end_lut) and np.allclose(rf, rf_lut, atol=0.05, equal_nan=True)
+
+
+def test_sub15(tmp_path):
+    from types import SimpleNamespace
+    from seispy.psrayp import get_psrayp, load_rayp_lib
+    from seispy.rfcorrect import psrf2depth, xps_tps_map
+    from seispy.utils import DepModel
+    from seispy.geo import skm2srad, sdeg2skm
+    dis, dep, layers = np.arange(30, 91, 5.), np.arange(0, 601, 100.), np.arange(0, 800, 10.)
+    rayp = (8.8 - 0.08 * dis[:, None, None] - 0.001 * dep[None, :, None] + 0.003 * np.sqrt(layers))
+    path = str(tmp_path / 'Ps_rayp.npz')
+    np.savez(path, dis=dis, dep=dep, layers=layers, rayp=rayp)
+    lib = load_rayp_lib(path)
+    assert isinstance(lib.rayp, np.memmap) and lib is load_rayp_lib(path)
+    rng = np.random.default_rng(4)
+    sta = SimpleNamespace(comp='R', ev_num=10, time_axis=np.arange(1300) * 0.1 - 10, sampling=0.1, stel=0.5,
+                          dis=rng.uniform(30, 90, 10), evdp=rng.uniform(0, 600, 10),
+                          datar=rng.normal(size=(10, 1300)))
+    sta.rayp = skm2srad(sdeg2skm(8.8 - 0.08 * sta.dis - 0.001 * sta.evdp))
+    dep_range = np.arange(0, 301, 1.)
+    with np.load(path) as npz:
+        ref = np.array([get_psrayp(npz, d, e, dep_range) for d, e in zip(sta.dis, sta.evdp)])
+    assert np.allclose(lib(sta.dis, sta.evdp, dep_range), ref)
+    _, _, x_s, x_p = psrf2depth(sta, dep_range, srayp=path, normalize=None)
+    dep_mod = DepModel(dep_range, 'iasp91', elevation=0.5)
+    for i in range(sta.ev_num):
+        srayp = skm2srad(sdeg2skm(get_psrayp(lib, sta.dis[i], sta.evdp[i], dep_mod.depths_elev)))
+        _, x_s_ref, x_p_ref = xps_tps_map(dep_mod, srayp, sta.rayp[i])
+        assert np.allclose(x_s[i], x_s_ref, equal_nan=True) and np.allclose(x_p[i], x_p_ref, equal_nan=True)
+
+
+def _synthetic_hk_rfs(nev=40, h=35., kappa=1.75, vp=6.3, noise=0.1, seed=5):
+    from seispy.hk import vslow
+    rng = np.random.default_rng(seed)
+    time_axis = np.arange(1300) * 0.1 - 10
+    rayp = rng.uniform(0.04, 0.08, nev)
+    eta_p, eta_s = vslow(vp, rayp)[:, np.newaxis], vslow(vp / kappa, rayp)[:, np.newaxis]
+    seis = np.zeros((nev, time_axis.size))
+    for t, amp in ((0, 1), (h * (eta_s - eta_p), 0.3), (h * (eta_s + eta_p), 0.15), (2 * h * eta_s, -0.1)):
+        seis += amp * np.exp(-((time_axis - t) * 2) ** 2)
+    return seis + noise * rng.normal(size=seis.shape), rayp
+
+
+def test_sub16():
+    from seispy.hk import hkstack, hkstack_adaptive, ci
+    seis, rayp = _synthetic_hk_rfs()
+    h, kappa = np.arange(20, 80, 0.05), np.arange(1.6, 1.9, 0.0025)
+    stack, _, allstack, _ = hkstack(seis, 10, 0.1, rayp, h, kappa)
+    besth, bestk, cvalue_full, hsig, ksig = ci(allstack, h, kappa, rayp.size)
+    assert abs(besth - 35) < 2 and abs(bestk - 1.75) < 0.05
+    stack_ad, _, allstack_ad, _, cvalue = hkstack_adaptive(seis, 10, 0.1, rayp, h, kappa, full_output=True)
+    assert allstack_ad.shape == allstack.shape and stack_ad.shape == stack.shape
+    besth_ad, bestk_ad, _, hsig_ad, ksig_ad = ci(allstack_ad, h, kappa, rayp.size, cvalue=cvalue)
+    assert besth_ad == besth and bestk_ad == bestk
+    assert abs(cvalue - cvalue_full) < 1e-4
+    assert np.isclose(hsig_ad, hsig, rtol=1e-3) and np.isclose(ksig_ad, ksig, rtol=1e-3)
+    above = allstack >= min(cvalue, cvalue_full)
+    assert np.allclose(allstack_ad[above], allstack[above], rtol=0, atol=1e-12)
+    assert np.allclose(ci(allstack_ad, h, kappa, rayp.size, cvalue=cvalue_full)[3:], (hsig, ksig), rtol=1e-10)
+
+
+def test_sub17():
+    from seispy.hk import hkstack, hkvstack
+    seis, rayp = _synthetic_hk_rfs()
+    h, kappa = np.arange(20, 80, 0.2), np.arange(1.6, 1.9, 0.01)
+    _, _, allstack, allstackvar = hkstack(seis, 10, 0.1, rayp, h, kappa, vp=6.3)
+    volume, volvar, _, _ = hkvstack(seis, 10, 0.1, rayp, h, kappa, np.array([6.3]), chunk=7)
+    assert volume.shape == (1, kappa.size, h.size)
+    assert np.allclose(volume[0], allstack) and np.allclose(volvar[0], allstackvar)
+    vp = np.arange(6.0, 6.6, 0.1)
+    volume, volvar, best, marginals = hkvstack(seis, 10, 0.1, rayp, h, kappa, vp)
+    volume2, volvar2, best2, _ = hkvstack(seis, 10, 0.1, rayp, h, kappa, vp, chunk=100, workers=2)
+    assert np.allclose(volume, volume2) and np.allclose(volvar, volvar2) and best == best2
+    assert [m.size for m in marginals] == [vp.size, kappa.size, h.size]
+    assert np.all([m.max() == 1 for m in marginals])
+    iv = np.argmin(np.abs(vp - best[0]))
+    assert np.allclose(volume[iv].max(), 1)
+
+
+def test_sub18():
+    from seispy.ccpoperator import CCPOperator
+    from seispy.ccpstats import CCPStats
+    rfdep = _synthetic_rfdep(nsta=3)
+    bin_loca = np.array([[30.1, 100.], [30.5, 100.1], [30.3, 100.]])
+    stack_idx = np.arange(50, 200, 10)
+    nan_sta = dict(rfdep[1], moveout_correct=rfdep[1]['moveout_correct'].copy(),
+                   stopindex=np.full(rfdep[1]['stopindex'].size, 200))
+    nan_sta['moveout_correct'][:, 120:] = np.nan
+    stats = CCPStats(bin_loca, stack_idx, 0.2, reservoir=5, seed=0)
+    stats.update([rfdep[0], nan_sta, rfdep[2]])
+    assert np.all(np.isfinite(stats.sum)) and np.all(np.isfinite(stats.res_val[stats.res_sta >= 0]))
+    finite_sta = dict(nan_sta, moveout_correct=rfdep[1]['moveout_correct'])
+    stats.update([finite_sta])
+    full = [rfdep[0], finite_sta, rfdep[2]]
+    op = CCPOperator.build(full, bin_loca, stack_idx, 0.2)
+    mu_ref, _, count_ref = op.stack(op.amplitudes(full))
+    mu, _, count, _ = stats.stack()
+    assert np.array_equal(count, count_ref) and np.allclose(mu, mu_ref, equal_nan=True)
+    assert np.array_equal(np.isnan(mu), np.isnan(mu_ref))
+
+
+def _rf_project(para, eq_lst, rfpath):
+    import copy
+    from seispy.rf import RF
+    pjt = RF()
+    pjt.para = copy.deepcopy(para)
+    pjt.para.rfpath = rfpath
+    pjt.load_stainfo()
+    pjt.eq_lst = eq_lst.copy()
+    return pjt
+
+
+def test_sub19(tmp_path):
+    import sys
+    from os import listdir
+    from os.path import join, dirname, abspath
+    from obspy.io.sac import SACTrace
+    sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'benchmarks'))
+    import synthetic
+    para, eq_lst = synthetic.write_events(str(tmp_path / 'events'), nev=4)
+    pjt = _rf_project(para, eq_lst, str(tmp_path / 'batch'))
+    pjt.match_eq()
+    pjt.channel_correct()
+    pjt.detrend()
+    pjt.filter()
+    pjt.cal_phase()
+    pjt.batch_qc()
+    pjt.rotate()
+    pjt.trim()
+    pjt.deconv()
+    pjt.saverf()
+    spjt = _rf_project(para, eq_lst, str(tmp_path / 'stream'))
+    spjt.stream()
+    assert np.array_equal(spjt.eqs.index, pjt.eqs.index) and spjt.eqs.shape[0] == 4
+    assert all(row['data'].st is None and row['data'].rf is None for _, row in spjt.eqs.iterrows())
+    files = sorted(listdir(str(tmp_path / 'batch')))
+    assert files and files == sorted(listdir(str(tmp_path / 'stream')))
+    for fname in files:
+        assert np.allclose(SACTrace.read(str(tmp_path / 'batch' / fname)).data,
+                           SACTrace.read(str(tmp_path / 'stream' / fname)).data)
+
+
+def test_sub20(monkeypatch):
+    from types import SimpleNamespace
+    from seispy import metrics
+    if metrics.resource is None:
+        return
+    monkeypatch.setattr(metrics.resource, 'getrusage', lambda who: SimpleNamespace(ru_maxrss=200 * 1048576))
+    monkeypatch.setattr(metrics.sys, 'platform', 'darwin')
+    assert metrics.peak_rss() == 200
+    monkeypatch.setattr(metrics.sys, 'platform', 'linux')
+    assert metrics.peak_rss() == 200 * 1024
+
+
+def _moveoutcorrect_loop(stadatar, raypref, YAxisRange, velmod='iasp91'):
+    # per-event and per-sample moveout correction before vectorization
+    from scipy.interpolate import interp1d
+    from seispy.utils import DepModel
+    from seispy.rfcorrect import xps_tps_map
+    sampling, shift, data = stadatar.sampling, stadatar.shift, stadatar.datar
+    dep_mod = DepModel(YAxisRange, velmod, stadatar.stel)
+    tps = np.zeros([stadatar.ev_num, YAxisRange.shape[0]], dtype=complex)
+    for i in range(stadatar.ev_num):
+        tps[i], _, _ = xps_tps_map(dep_mod, stadatar.rayp[i], stadatar.rayp[i])
+    Tpds_ref, _, _ = xps_tps_map(dep_mod, raypref, raypref)
+    Tpds_ref = np.real(Tpds_ref)
+    Newdatar = np.zeros([stadatar.ev_num, stadatar.rflength])
+    EndIndex = np.zeros(stadatar.ev_num)
+    for i in range(stadatar.ev_num):
+        StopIndex = np.where(np.imag(tps[i]) == 1)[0]
+        StopIndex = dep_mod.depths.shape[0] if StopIndex.size == 0 else StopIndex[0]
+        EndIndex[i] = StopIndex - 1
+        TempTpds = np.real(tps[i])
+        Newaxis = np.append(np.arange(-shift, 0, sampling), 0)
+        for j in np.arange(int(shift / sampling + 1), stadatar.rflength):
+            Refaxis = j * sampling - shift
+            index = np.where(Refaxis <= TempTpds[0:StopIndex])[0]
+            if index.size == 0:
+                break
+            index[0] = max(index[0], 1)
+            Ratio = (Tpds_ref[index[0]] - Tpds_ref[index[0] - 1]) / (TempTpds[index[0]] - TempTpds[index[0] - 1])
+            Newaxis = np.append(Newaxis, Tpds_ref[index[0] - 1] + (Refaxis - TempTpds[index[0] - 1]) * Ratio)
+        endidx = Newaxis.shape[0]
+        x_new = np.arange(0, stadatar.rflength) * sampling - shift
+        Tempdata = interp1d(Newaxis, data[i, 0:endidx], bounds_error=False)(x_new)
+        endIndice = np.where(np.isnan(Tempdata))[0]
+        if endIndice.size == 0:
+            New_data = Tempdata
+        else:
+            New_data = np.append(Tempdata[1:endIndice[0]], data[i, endidx+1:])
+        if New_data.shape[0] < stadatar.rflength:
+            Newdatar[i] = np.append(New_data, np.zeros(stadatar.rflength - New_data.shape[0]))
+        else:
+            Newdatar[i] = New_data[0: stadatar.rflength]
+    return Newdatar, EndIndex
+
+
+def test_sub21(monkeypatch):
+    import warnings
+    from types import SimpleNamespace
+    from seispy import rfcorrect
+    from seispy.geo import skm2srad
+    rng = np.random.default_rng(3)
+    rayp = skm2srad(np.array([0.045, 0.06, 0.075, 0.12, 0.13]))
+    datar = rng.normal(size=(rayp.size, 1301))
+    xps_tps_map = rfcorrect.xps_tps_map
+
+    def complex_tps(dep_mod, srayp, prayp, **kwargs):
+        # Ps times of rays steeper than 0.07 s/km become imaginary below 300 km
+        tps, x_s, x_p = xps_tps_map(dep_mod, srayp, prayp, **kwargs)
+        steep = np.asarray(srayp) > skm2srad(0.07)
+        tps = np.where(steep & (dep_mod.depths >= 300), tps + 1j, tps + 0j)
+        return tps, x_s, x_p
+
+    dep_range = np.arange(0, 801, 1.)
+    for stel, patch in ((0., False), (1.5, False), (0., True), (2.2, True)):
+        if patch:
+            monkeypatch.setattr(rfcorrect, 'xps_tps_map', complex_tps)
+        stadatar = SimpleNamespace(sampling=0.1, shift=10., datar=datar, rayp=rayp, stel=stel,
+                                   ev_num=rayp.size, rflength=datar.shape[1])
+        ref, end_ref = _moveoutcorrect_loop(stadatar, skm2srad(0.06), dep_range)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            new, end = rfcorrect.moveoutcorrect_ref(stadatar, skm2srad(0.06), dep_range)
+        assert np.array_equal(end, end_ref) and np.array_equal(end < dep_range.size - 1, patch & (rayp > skm2srad(0.07)))
+        assert np.allclose(new, ref, equal_nan=True)
+        monkeypatch.undo()
+
+
+def test_sub22(tmp_path):
+    import sys
+    from os import remove
+    from os.path import join, dirname, abspath
+    from types import SimpleNamespace
+    from seispy.eq import EQ, EQPrefetcher
+    from seispy.rf import match_sac_files, iter_eq
+    sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'benchmarks'))
+    import synthetic
+    path = str(tmp_path / 'events')
+    para, eq_lst = synthetic.write_events(path, nev=6)
+    eq_match = match_sac_files(eq_lst, path, tolerance=210)
+    datestrs = list(eq_match['datestr'])
+    remove(join(path, '{}.SY.SYN.BHN.SAC'.format(datestrs[2])))
+    datestrs.insert(4, '1990.001.00.00.00')
+    out = list(EQPrefetcher(path, datestrs, workers=3, window=2))
+    assert [d for d, _ in out] == datestrs
+    assert [isinstance(eq, Exception) for _, eq in out] == [False, False, True, False, True, False, False]
+    for datestr, eq in out:
+        if not isinstance(eq, Exception):
+            assert np.array_equal(eq.st[0].data, EQ(path, datestr).st[0].data)
+    errors = []
+    logger = SimpleNamespace(RFlog=SimpleNamespace(error=errors.append))
+    read = [i for i, _, _ in iter_eq(eq_match, path, logger, prefetch_workers=2, prefetch_window=2)]
+    assert read == [i for k, i in enumerate(eq_match.index) if k != 2] and len(errors) == 1
+
+
+def test_sub23(tmp_path):
+    import sys
+    import pytest
+    from os.path import join, dirname, abspath
+    from seispy.pjtfile import save_pjt, load_pjt
+    from seispy.rf import RF
+    sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'benchmarks'))
+    import synthetic
+    para, eq_lst = synthetic.write_events(str(tmp_path / 'events'), nev=3)
+    pjt = _rf_project(para, eq_lst, str(tmp_path / 'rf'))
+    pjt.match_eq()
+    pjt.detrend()
+    pjt.cal_phase()
+    path = str(tmp_path / 'pjt.npz')
+    save_pjt(path, pjt.para, pjt.stainfo, pjt.eqs)
+    header, eqs = load_pjt(path)
+    assert header['para'] == pjt.para.__dict__ and header['stainfo'] == pjt.stainfo.__dict__
+    assert list(eqs.columns) == [col for col in pjt.eqs.columns if col != 'data'] + ['data']
+    loaded = RF.loadpjt(path)
+    assert loaded.para.__dict__ == pjt.para.__dict__ and loaded.stainfo.__dict__ == pjt.stainfo.__dict__
+    assert list(loaded.eqs.index) == list(pjt.eqs.index)
+    for col in pjt.eqs.columns.drop('data'):
+        assert list(loaded.eqs[col]) == list(pjt.eqs[col])
+    for (_, row), (_, ref) in zip(loaded.eqs.iterrows(), pjt.eqs.iterrows()):
+        this_eq = row['data']
+        assert this_eq._st is None and this_eq.rayp == ref['data'].rayp
+        assert len(this_eq.st) == 3 and this_eq._st is not None
+        for tr, tr_ref in zip(this_eq.st, ref['data'].st):
+            assert np.array_equal(tr.data, tr_ref.data) and tr.id == tr_ref.id
+            assert tr.stats.starttime == tr_ref.stats.starttime and tr.stats.sac == tr_ref.stats.sac
+    pjt.eqs['data'].iloc[0].extra = object()
+    with pytest.warns(UserWarning, match='extra'):
+        save_pjt(path, pjt.para, pjt.stainfo, pjt.eqs)
+
+
+def _rfani_loop(ani):
+    # R energy, R cross-correlation and T energy point by point before vectorization
+    from seispy.geo import cosd, sind
+    energy = np.zeros([ani.fvd.shape[0], ani.fvd.shape[1], ani.ne - ani.nb])
+    for i, baz in enumerate(ani.stack_range):
+        nt_corr = (((ani.deltat / 2) * cosd(2 * (ani.fvd - baz))) / ani.sacdatar.sampling).astype(int)
+        for j, k in np.ndindex(ani.fvd.shape):
+            energy[j, k] += ani.rfr_baz[i, ani.nb - nt_corr[j, k]:ani.ne - nt_corr[j, k]]
+    energy_r = np.max(energy ** 2, axis=2) / np.max(np.sum(ani.rfr_baz[:, ani.nb:ani.ne], axis=0) ** 2)
+    raw_energy_r = np.sum(np.sum(ani.rfr_baz[:, ani.nb:ani.ne], axis=0) ** 2 - np.sum(ani.rfr_baz[:, ani.nb:ani.ne] ** 2, axis=0))
+    raw_energy_t = np.sum(np.sum(ani.rft_baz[:, ani.nb:ani.ne] ** 2, axis=0))
+    energy_cc = np.zeros((ani.fvd_1d.size, ani.deltat_1d.size))
+    energy_tc = np.zeros((ani.fvd_1d.size, ani.deltat_1d.size))
+    for (i, f), (j, d) in ((a, b) for a in enumerate(ani.fvd_1d) for b in enumerate(ani.deltat_1d)):
+        nt_corr = int(d / 2 / ani.sacdatar.sampling)
+        nt_fast = np.arange(ani.nb, ani.ne) + nt_corr
+        nt_slow = np.arange(ani.nb, ani.ne) - nt_corr
+        fcr = np.zeros(ani.ne - ani.nb)
+        fcr_sq = np.zeros(ani.ne - ani.nb)
+        fct = 0
+        for k, baz in enumerate(ani.stack_range):
+            data_fast = ani.rfr_baz[k, nt_slow] * cosd(f - baz) + ani.rft_baz[k, nt_slow] * sind(f - baz)
+            data_slow = -ani.rfr_baz[k, nt_fast] * sind(f - baz) + ani.rft_baz[k, nt_fast] * cosd(f - baz)
+            back_r = data_fast * cosd(f - baz) - data_slow * sind(f - baz)
+            back_t = data_fast * sind(f - baz) + data_slow * cosd(f - baz)
+            fcr += back_r
+            fcr_sq += back_r ** 2
+            fct += np.sum(back_t ** 2)
+        energy_cc[i, j] = np.sum(fcr ** 2 - fcr_sq) / raw_energy_r
+        energy_tc[i, j] = fct / raw_energy_t
+    return energy_r, energy_cc.T, energy_tc.T / np.max(np.abs(energy_tc))
+
+
+def test_sub24():
+    from types import SimpleNamespace
+    from seispy.rfani import RFAni
+    rng = np.random.default_rng(4)
+    ani = RFAni.__new__(RFAni)
+    ani.sacdatar = SimpleNamespace(sampling=0.1)
+    ani.stack_range = np.arange(0, 360, 30)
+    ani.rfr_baz = rng.normal(size=(ani.stack_range.size, 300))
+    ani.rft_baz = rng.normal(size=(ani.stack_range.size, 300))
+    ani.nb, ani.ne = 120, 180
+    ani.init_ani_para(dt_step=0.1, fvd_step=20, dt_max=1.5)
+    ani.fvd, ani.deltat = np.meshgrid(ani.fvd_1d, ani.deltat_1d)
+    energy_r, energy_cc, energy_tc = _rfani_loop(ani)
+    assert np.allclose(ani.radial_energy_max(chunk=50), energy_r)
+    for chunk in (1, 7, 100):
+        cc, tc = ani.rotate_to_fast_slow(chunk=chunk)
+        assert np.allclose(cc, energy_cc) and np.allclose(tc, energy_tc)
+
+
+def _harmonics(ev_num=40, nsamp=30, seed=6):
+    from types import SimpleNamespace
+    from seispy.harmonics import Harmonics
+    rng = np.random.default_rng(seed)
+    harmo = Harmonics.__new__(Harmonics)
+    harmo.rfsta = SimpleNamespace(bazi=rng.uniform(0, 360, ev_num), ev_num=ev_num)
+    harmo.datar = rng.normal(size=(ev_num, nsamp))
+    harmo.datat = rng.normal(size=(ev_num, nsamp))
+    harmo.nsamp = nsamp
+    return harmo
+
+
+def test_sub25():
+    from seispy.geo import cosd, sind
+    harmo = _harmonics()
+    harmonic, unmodel = harmo.design_matrix()
+    for i, baz in enumerate(harmo.rfsta.bazi):
+        assert np.allclose(harmonic[i], [1, cosd(baz), sind(baz), cosd(baz*2), sind(baz*2)])
+        assert np.allclose(harmonic[i+harmo.rfsta.ev_num], [0, cosd(baz+90), sind(baz+90), cosd(baz*2+90), sind(baz*2+90)])
+        assert np.allclose(unmodel[i+harmo.rfsta.ev_num], [0, cosd(baz-90), sind(baz-90), cosd(baz*2-90), sind(baz*2-90)])
+    harmonic_res, unmodel_res = harmo.harmo_trans()
+    traces = np.vstack((harmo.datar, harmo.datat))
+    for g, trans, res in ((harmonic, harmo.harmonic_trans, harmonic_res), (unmodel, harmo.unmodel_trans, unmodel_res)):
+        sol, rss, _, _ = np.linalg.lstsq(g, traces, rcond=None)
+        assert np.allclose(trans, sol) and np.allclose(res, np.sqrt(rss))
+    harmo_lsqr = _harmonics()
+    harmo_lsqr.harmo_trans(method='lsqr')
+    assert np.allclose(harmo_lsqr.harmonic_trans, harmo.harmonic_trans, atol=1e-5)
+
+
+def test_sub26():
+    harmo = _harmonics(ev_num=25, nsamp=12)
+    n_boot, seed = 40, 7
+    bands = harmo.resample_ci(n_boot=n_boot, seed=seed)
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, 25, size=(n_boot, 25))
+    traces = np.vstack((harmo.datar, harmo.datat))
+    for g, band in zip(harmo.design_matrix(), bands):
+        sol = np.array([np.linalg.lstsq(g[np.append(i, i + 25)], traces[np.append(i, i + 25)], rcond=None)[0]
+                        for i in idx])
+        assert np.allclose(band, np.percentile(sol, [2.5, 97.5], axis=0))
+    jack = harmo.resample_ci(method='jackknife')
+    assert all(np.all(b[0] <= b[1]) for b in jack)
+
+
+def test_sub27():
+    from types import SimpleNamespace
+    from scipy.interpolate import interp1d
+    from seispy.rfcorrect import RFStation, time2depth
+    rng = np.random.default_rng(8)
+    ev_num, dep_range = 6, np.arange(0, 301, 1.)
+    time_axis = np.arange(601) * 0.1 - 10
+    datar = rng.normal(size=(ev_num, time_axis.size))
+    datat = rng.normal(size=(ev_num, time_axis.size))
+    sta = SimpleNamespace(ev_num=ev_num, comp='R', only_r=False, datar=datar.copy(), datat=datat.copy())
+    RFStation.normalize(sta, method='single')
+    maxamp = np.nanmax(np.abs(datar), axis=1)
+    assert np.allclose(sta.datar, datar / maxamp[:, np.newaxis]) and np.allclose(sta.datat, datat / maxamp[:, np.newaxis])
+    sta = SimpleNamespace(ev_num=ev_num, comp='R', only_r=True, datar=datar.copy())
+    RFStation.normalize(sta, method='average')
+    assert np.allclose(sta.datar, datar / np.nanmax(np.abs(np.mean(datar, axis=0))))
+    # Ps times of different slopes, the last event exceeds the time window and two stop early
+    Tpds = (dep_range * np.linspace(0.08, 0.2, ev_num)[:, np.newaxis]).astype(complex)
+    Tpds[1, 120:] += 1j
+    Tpds[3, 0:] += 1j
+    stadatar = SimpleNamespace(ev_num=ev_num, comp='R', datar=datar, time_axis=time_axis, sampling=0.1)
+    rfdepth, end_index = time2depth(stadatar, dep_range, Tpds, normalize=False)
+    for i in range(ev_num):
+        stop = np.where(np.imag(Tpds[i]) == 1)[0]
+        end = dep_range.size - 1 if stop.size == 0 else stop[0] - 1
+        assert end_index[i] == end
+        ref = np.zeros(dep_range.size)
+        if end >= 0:
+            ref[:end+1] = interp1d(time_axis, datar[i], bounds_error=False)(np.real(Tpds[i, :end+1]))
+        assert np.allclose(rfdepth[i], ref, equal_nan=True)
+    assert np.isnan(rfdepth[-1]).any() and np.all(rfdepth[3] == 0)
+
+
+def test_sub28(tmp_path):
+    import sys
+    import matplotlib
+    from os.path import join, dirname, abspath
+    from seispy.hk import hksta
+    from seispy.hkpara import HKPara
+    sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'benchmarks'))
+    import synthetic
+    matplotlib.use('Agg')
+    synthetic.write_rfs(str(tmp_path), nev=20)
+    hpara = HKPara()
+    hpara.rfpath = str(tmp_path / 'SYN')
+    hpara.hkpath = str(tmp_path)
+    hpara.hklist = str(tmp_path / 'hk.dat')
+    hpara.hrange = np.arange(25, 45, 0.5)
+    hpara.krange = np.arange(1.65, 1.85, 0.01)
+    hksta(hpara, isplot=True)
+    hpara.vprange = np.arange(6.0, 6.6, 0.2)
+    hksta(hpara, isplot=True)
+    with open(hpara.hklist) as f:
+        lines = [line.split('\t') for line in f.read().splitlines()]
+    assert [len(line) for line in lines] == [7, 8] and float(lines[1][-1]) in np.round(hpara.vprange, 2)
+
+
+def test_sub29():
+    from seispy.ccp3d import boot_bin_stack
+    from seispy.ccpoperator import CCPOperator
+    from seispy.ccpstats import CCPStats
+    from seispy.distaz import distaz
+    rfdep = _synthetic_rfdep(nsta=3)
+    rfdep[1] = dict(rfdep[1], moveout_correct=rfdep[1]['moveout_correct'].copy(),
+                    stopindex=np.full(rfdep[1]['stopindex'].size, 200))
+    rfdep[1]['moveout_correct'][:, 120:] = np.nan
+    bin_loca = np.array([[30.1, 100.], [30.3, 100.], [30.5, 100.1]])
+    stack_idx = np.arange(50, 200, 10)
+    op = CCPOperator.build(rfdep, bin_loca, stack_idx, 0.2)
+    mu_op, _, count_op = op.stack(op.amplitudes(rfdep))
+    stats = CCPStats(bin_loca, stack_idx, 0.2)
+    stats.update(rfdep)
+    mu_st, _, count_st, _ = stats.stack()
+    mu_loop = np.zeros_like(mu_op)
+    count_loop = np.zeros_like(count_op)
+    for i, j in np.ndindex(mu_op.shape):
+        idx = stack_idx[j]
+        amp = []
+        for sta in rfdep:
+            evs = np.where(sta['stopindex'] >= idx)[0]
+            dis = distaz(sta['piercelat'][evs, idx], sta['piercelon'][evs, idx], *bin_loca[i]).delta
+            amp.extend(sta['moveout_correct'][evs[dis < 0.2], idx])
+        mu_loop[i, j], _, count_loop[i, j] = boot_bin_stack(np.array(amp), n_samples=None)
+    assert np.any(count_loop[:, stack_idx >= 120] > 1)
+    for mu, count in ((mu_op, count_op), (mu_st, count_st)):
+        assert np.array_equal(count, count_loop) and np.allclose(mu, mu_loop, equal_nan=True)
+        assert np.array_equal(np.isnan(mu), count_loop <= 1)
+
+
+def test_sub30(tmp_path):
+    import sys
+    from os.path import join, dirname, abspath
+    sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'benchmarks'))
+    import synthetic
+    data = _noise_with_onset()
+    data[0, 1500:] = 0
+    data[1, :1501] = 0
+    _, snr_all, _ = qc.batch_qc(data, 0.1, 150, noiselen=50, noisegate=5)
+    assert snr_all[0] == 0 and snr_all[1] == 0 and np.all(snr_all[2:] > 5)
+    para, eq_lst = synthetic.write_events(str(tmp_path / 'events'), nev=4)
+    pjt = _rf_project(para, eq_lst, str(tmp_path / 'rf'))
+    pjt.match_eq()
+    pjt.channel_correct()
+    pjt.detrend()
+    pjt.filter()
+    pjt.cal_phase()
+    mixed = pjt.eqs.index[1]
+    pjt.eqs.loc[mixed, 'data'].st[0].resample(5.)
+    pjt.para.noisegate = -np.inf
+    pjt.batch_qc()
+    assert pjt.eqs.shape[0] == 3 and mixed not in pjt.eqs.index